@@ -1,10 +1,6 @@
 # -*- coding: utf-8 -*-
 
-# Стандартные библиотеки Python
-import os
-
 # Библиотеки третьей стороны
-from elasticsearch import Elasticsearch
 from flask import Flask
 from flask_babel import Babel, lazy_gettext as _loc
 from flask_bootstrap import Bootstrap
@@ -13,14 +9,21 @@ from flask_mail import Mail
 from flask_migrate import Migrate
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
-import logging
-from logging.handlers import SMTPHandler, RotatingFileHandler
 
 # Собственные модули
+from app.admission import AdmissionControl
+from app.cache import LRUCache
+from app.logs import init_request_logging, start_logging
+from app.metrics import Metrics
+from app.prefork import LazyElasticsearch, init_bytecode_cache
+from app.profiling import Profiler
+from app.routing import ReplicaRouter, RoutingSession, ShardRouter
 from config import Config
 
 
-db: SQLAlchemy = SQLAlchemy()
+db: SQLAlchemy = SQLAlchemy(session_options={'class_': RoutingSession})
+replicas: ReplicaRouter = ReplicaRouter()
+shards: ShardRouter = ShardRouter()
 migrate: Migrate = Migrate()
 
 babel: Babel = Babel()
@@ -30,6 +33,9 @@ login.login_view = 'auth.login'
 login.login_message = _loc("Пожалуйста, войдите, чтобы открыть эту страницу.")
 
 mail = Mail()
+metrics = Metrics()
+admission = AdmissionControl()
+profiler = Profiler()
 bootstrap = Bootstrap()
 moment = Moment()
 
@@ -41,9 +47,14 @@ def create_app(config_class=Config):
     app = Flask(__name__)
 
     # Загружаем настройки из объекта конфигурации.
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
 
+    replicas.init_app(app)
+    shards.init_app(app)
     db.init_app(app)
+    metrics.init_app(app)
+    admission.init_app(app)
+    profiler.init_app(app)
     migrate.init_app(app, db)
     login.init_app(app)
     mail.init_app(app)
@@ -51,6 +62,41 @@ def create_app(config_class=Config):
     moment.init_app(app)
     babel.init_app(app, locale_selector=get_locale)
 
+    # Клиент создается при первом поиске: импорт elasticsearch заметно замедляет старт.
+    app.elasticsearch = LazyElasticsearch(app.config['ELASTICSEARCH_URL']) \
+        if app.config.get('ELASTICSEARCH_URL') else None
+
+    # Кэш отрисованных фрагментов '_post.html' (0 отключает кэширование).
+    fragment_cache_size = app.config.get('FRAGMENT_CACHE_SIZE', 4096)
+    app.fragment_cache = LRUCache(maxsize=fragment_cache_size) if fragment_cache_size else None
+
+    # Дисковый кэш аватаров (пустой AVATAR_CACHE_DIR - отрисовка при каждом запросе).
+    from app.avatars.identicon import AvatarCache
+    app.avatar_cache = AvatarCache(app.config.get('AVATAR_CACHE_DIR', 'avatars'),
+                                   max_bytes=app.config.get('AVATAR_CACHE_BYTES', 64 * 1024 * 1024))
+
+    # Скомпилированные шаблоны читаются с диска, а не компилируются заново в каждом воркере.
+    init_bytecode_cache(app)
+
+    from app.fragments import render_post
+    app.jinja_env.globals['render_post'] = render_post
+
+    # Токен CSRF для форм, которые страница создает скриптом (кнопки подписки в карточках пользователей).
+    from flask_wtf.csrf import generate_csrf
+    app.jinja_env.globals['csrf_token'] = generate_csrf
+
+    # Кэш данных карточек пользователей для всплывающих подсказок (0 отключает кэширование).
+    hover_card_cache_size = app.config.get('HOVER_CARD_CACHE_SIZE', 10000)
+    app.hover_cards = LRUCache(maxsize=hover_card_cache_size, ttl=app.config.get('HOVER_CARD_TTL', 30.0)) \
+        if hover_card_cache_size else None
+
+    # Общий кэш первых страниц глобальной ленты (0 отключает кэширование).
+    from app.explore_cache import ExploreCache
+    explore_cache_size = app.config.get('EXPLORE_CACHE_SIZE', 100)
+    app.explore_cache = ExploreCache(size=explore_cache_size,
+                                     ttl=app.config.get('EXPLORE_CACHE_TTL', 10.0)) \
+        if explore_cache_size else None
+
     from app.errors import bp as errors_bp
     app.register_blueprint(errors_bp)
 
@@ -60,51 +106,20 @@ def create_app(config_class=Config):
     from app.main import bp as main_bp
     app.register_blueprint(main_bp)
 
+    from app.avatars import bp as avatars_bp
+    app.register_blueprint(avatars_bp)
+
+    from app.api import bp as api_bp
+    app.register_blueprint(api_bp, url_prefix='/api')
+
+    init_request_logging(app)
     if not app.debug and not app.testing:
-        if app.config['MAIL_SERVER']:
-            auth = None
-            if app.config['MAIL_USERNAME'] or app.config['MAIL_PASSWORD']:
-                auth = (app.config['MAIL_USERNAME'], app.config['MAIL_PASSWORD'])
-            secure = None
-            if app.config['MAIL_USE_TLS']:
-                secure = ()
-            mail_handler = SMTPHandler(
-                mailhost=(app.config['MAIL_SERVER'], app.config['MAIL_PORT']),
-                fromaddr='no-reply@' + app.config['MAIL_SERVER'],
-                toaddrs=app.config['ADMINS'],
-                subject='Microblog Failure',
-                credentials=auth,
-                secure=secure)
-
-        # Если папка 'logs' не существует, создаем ее.
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-
-        # Создаем файловый обработчик, который ротирует (создает новый) файл лога при достижении определенного размера.
-        # Файлы логов хранятся в папке 'logs' и имеют максимальный размер 10 килобайт,
-        # при достижении которого создается новый файл.
-        # Максимальное количество файлов логов, хранящихся в архиве (backupCount), равно 10.
-        file_handler = RotatingFileHandler('logs/microblog.log', maxBytes=10240, backupCount=10)
-
-        # Устанавливаем формат сообщений в файле журнала.
-        # В этом случае будет дата и время, уровень логирования, текст сообщения и источник (путь и номер строки).
-        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-
-        # Устанавливаем уровень логирования для файла журнала на INFO, чтобы записывать сообщения INFO и более высокого уровня.
-        file_handler.setLevel(logging.INFO)
-
-        # Добавляем файловый обработчик к логгеру приложения.
-        app.logger.addHandler(file_handler)
-
-        # Устанавливаем уровень логирования для логгера приложения на INFO.
-        app.logger.setLevel(logging.INFO)
+        # Записи лога уходят в очередь; файл и письма об ошибках пишет отдельный поток.
+        start_logging(app)
 
         # Записываем информационное сообщение в лог о запуске приложения.
         app.logger.info('Microblog startup')
 
-        app.elasticsearch = Elasticsearch([app.config['ELASTICSEARCH_URL']]) \
-            if app.config['ELASTICSEARCH_URL'] else None
-
     return app
 
 
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from collections import OrderedDict, namedtuple
+import math
+from threading import Lock
+from time import monotonic
+from typing import Dict, Hashable, Optional, Tuple
+
+# Библиотеки третьей стороны
+from flask import Flask, current_app, g, request, session
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+# Решение об отказе: HTTP-статус, через сколько секунд повторить запрос и причина (для метрик).
+Rejection = namedtuple('Rejection', 'status retry_after reason')
+
+
+class TokenBuckets:
+    """
+    Набор корзин маркеров (token bucket) с общими параметрами, по одной на ключ.
+
+    Корзина вмещает до burst маркеров и пополняется со скоростью rate маркеров в секунду; каждый
+    запрос забирает один маркер. Пополнение считается лениво при обращении, поэтому фоновых
+    таймеров нет. Хранится не больше maxsize корзин: давно не использовавшиеся вытесняются (их
+    владельцы и так успели бы накопить полную корзину).
+    """
+
+    def __init__(self, rate: float, burst: int, maxsize: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def take(self, key: Hashable, now: Optional[float] = None) -> float:
+        """
+        Забирает маркер из корзины key.
+
+        Returns:
+            float: 0, если маркер получен, иначе время в секундах до появления маркера.
+        """
+        now = monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class Limiter:
+    """
+    Состояние контроля допуска одного приложения: лимиты частоты и одновременности по маршрутам.
+
+    Состояние хранится в памяти процесса, поэтому при N рабочих процессах фактический лимит
+    на маршрут в N раз больше настроенного.
+
+    Args:
+        rates (Dict[str, tuple]): (запросов в секунду, запас) на пользователя по маршрутам.
+        route_rates (Dict[str, tuple]): (запросов в секунду, запас) на маршрут в целом.
+        concurrency (Dict[str, int]): Максимум одновременно выполняемых запросов по маршрутам.
+        retry_after (int): Retry-After для отказа по одновременности, в секундах.
+        metrics: Расширение Metrics для счетчика отказов (необязательно).
+    """
+
+    def __init__(self, rates: Dict[str, tuple], route_rates: Dict[str, tuple],
+                 concurrency: Dict[str, int], retry_after: int = 1, metrics=None):
+        self.user_buckets = {endpoint: TokenBuckets(*limit) for endpoint, limit in rates.items()}
+        self.route_buckets = {endpoint: TokenBuckets(*limit) for endpoint, limit in route_rates.items()}
+        self.concurrency = dict(concurrency)
+        self.retry_after = retry_after
+        self.metrics = metrics
+        self.in_flight: Dict[str, int] = {}
+        self._lock = Lock()
+
+    def limits(self, endpoint: str) -> bool:
+        return endpoint in self.user_buckets or endpoint in self.route_buckets \
+            or endpoint in self.concurrency
+
+    def admit(self, endpoint: str, key: Hashable) -> Optional[Rejection]:
+        """
+        Решает, выполнять ли запрос к endpoint от клиента key.
+
+        Пользователь, превысивший свой лимит, получает 429 и не расходует общий лимит маршрута;
+        превышение общего лимита или одновременности - перегрузка, ответ 503. Если запрос
+        допущен и для маршрута задан лимит одновременности, после ответа нужно вызвать release().
+
+        Returns:
+            Optional[Rejection]: None, если запрос допущен, иначе причина отказа.
+        """
+        rejection = None
+        if endpoint in self.user_buckets:
+            wait = self.user_buckets[endpoint].take(key)
+            if wait:
+                rejection = Rejection(429, math.ceil(wait), 'user_rate')
+        if rejection is None and endpoint in self.route_buckets:
+            wait = self.route_buckets[endpoint].take(None)
+            if wait:
+                rejection = Rejection(503, math.ceil(wait), 'route_rate')
+        if rejection is None and endpoint in self.concurrency:
+            with self._lock:
+                if self.in_flight.get(endpoint, 0) >= self.concurrency[endpoint]:
+                    rejection = Rejection(503, self.retry_after, 'concurrency')
+                else:
+                    self.in_flight[endpoint] = self.in_flight.get(endpoint, 0) + 1
+        if rejection is not None and self.metrics is not None:
+            self.metrics.inc('microblog_admission_rejections_total',
+                             endpoint=endpoint, reason=rejection.reason)
+        return rejection
+
+    def release(self, endpoint: str) -> None:
+        if endpoint in self.concurrency:
+            with self._lock:
+                self.in_flight[endpoint] -= 1
+
+
+class AdmissionControl:
+    """
+    Расширение, отклоняющее запросы сверх лимитов до выполнения представления.
+
+    Проверка выполняется первым обработчиком before_request, до загрузки пользователя и запросов
+    к базе данных, поэтому отказ почти ничего не стоит. Клиент - пользователь из cookie сессии,
+    для анонимных запросов - IP-адрес. Отказ - исключение TooManyRequests (429) или
+    ServiceUnavailable (503) с заголовком Retry-After; маршруты API отдают его в формате JSON.
+
+    Конфигурация:
+        ADMISSION_CONTROL (bool): Включить контроль допуска, по умолчанию True.
+        RATE_LIMITS (dict): Лимиты на пользователя: {endpoint: (запросов в секунду, запас)}.
+        ROUTE_RATE_LIMITS (dict): Лимиты на маршрут в целом в том же формате.
+        CONCURRENCY_LIMITS (dict): Максимум одновременных запросов: {endpoint: n}.
+        ADMISSION_RETRY_AFTER (int): Retry-After при отказе по одновременности, по умолчанию 1.
+    """
+
+    DEFAULT_RATE_LIMITS = {
+        'main.search': (1.0, 10),
+        'asgi.translate': (1.0, 10),
+        'main.send_message': (0.5, 10),
+        'main.notifications': (1.0, 10),
+    }
+    DEFAULT_ROUTE_RATE_LIMITS = {
+        'main.search': (50.0, 100),
+    }
+    DEFAULT_CONCURRENCY_LIMITS = {
+        'main.search': 8,
+        'asgi.translate': 8,
+    }
+
+    def __init__(self, app: Optional[Flask] = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Создает состояние лимитов приложения и регистрирует обработчики запросов.
+
+        Должен вызываться после metrics.init_app(app), чтобы отказы попадали в метрики.
+        """
+        if not app.config.get('ADMISSION_CONTROL', True):
+            return
+        app.extensions['admission'] = Limiter(
+            app.config.get('RATE_LIMITS', self.DEFAULT_RATE_LIMITS),
+            app.config.get('ROUTE_RATE_LIMITS', self.DEFAULT_ROUTE_RATE_LIMITS),
+            app.config.get('CONCURRENCY_LIMITS', self.DEFAULT_CONCURRENCY_LIMITS),
+            retry_after=app.config.get('ADMISSION_RETRY_AFTER', 1),
+            metrics=app.extensions.get('metrics'))
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    @staticmethod
+    def client_key() -> Tuple[str, str]:
+        user_id = session.get('_user_id')
+        return ('user', user_id) if user_id else ('ip', request.remote_addr)
+
+    def _before_request(self) -> None:
+        limiter = current_app.extensions['admission']
+        endpoint = request.endpoint
+        # Запросы, уже допущенные асинхронным шлюзом (app/asgi.py), повторно не проверяются.
+        if endpoint is None or request.environ.get('microblog.admitted') or not limiter.limits(endpoint):
+            return
+        rejection = limiter.admit(endpoint, self.client_key())
+        if rejection is not None:
+            error = TooManyRequests if rejection.status == 429 else ServiceUnavailable
+            raise error(retry_after=rejection.retry_after)
+        g.admission_endpoint = endpoint
+
+    @staticmethod
+    def _teardown_request(exc: Optional[BaseException]) -> None:
+        endpoint = g.pop('admission_endpoint', None)
+        if endpoint is not None:
+            current_app.extensions['admission'].release(endpoint)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from functools import wraps
+
+# Библиотеки третьей стороны
+from flask import current_app, g, request
+import sqlalchemy as sa
+
+# Собственные модули
+from app import db
+from app.api import bp
+from app.api.errors import error_response
+from app.api.responses import json_response
+from app.models import User
+
+
+def token_required(view):
+    """
+    Декоратор маршрутов API, требующий заголовок 'Authorization: Bearer <token>'.
+
+    id пользователя из токена сохраняется в g.api_user_id; сам пользователь не загружается,
+    поэтому проверка токена не стоит ни одного запроса к базе данных.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        auth = request.authorization
+        user_id = User.verify_api_token(auth.token) \
+            if auth is not None and auth.type == 'bearer' and auth.token else None
+        if user_id is None:
+            response = error_response(401, 'A valid bearer token is required.')
+            response.headers['WWW-Authenticate'] = 'Bearer'
+            return response
+        g.api_user_id = user_id
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@bp.route('/tokens', methods=['POST'])
+def get_token():
+    """
+    Выдает токен доступа по имени пользователя и паролю (HTTP Basic).
+    """
+    auth = request.authorization
+    user = db.session.scalar(sa.select(User).where(User.username == auth.username)) \
+        if auth is not None and auth.type == 'basic' else None
+    if user is None or not user.check_password(auth.password or ''):
+        response = error_response(401, 'Invalid username or password.')
+        response.headers['WWW-Authenticate'] = 'Basic realm="api"'
+        return response
+    expires_in = current_app.config.get('API_TOKEN_EXPIRES_IN', 86400)
+    return json_response({'token': user.get_api_token(expires_in), 'expires_in': expires_in})
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+# Библиотеки третьей стороны
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import HTTP_STATUS_CODES
+
+# Собственные модули
+from app.api import bp
+from app.api.responses import json_response
+
+
+def error_response(status_code: int, message: str = None):
+    """
+    Возвращает ответ API с описанием ошибки в формате JSON.
+
+    Args:
+        status_code (int): HTTP-статус.
+        message (str): Дополнительное описание ошибки.
+    """
+    payload = {'error': HTTP_STATUS_CODES.get(status_code, 'Unknown error')}
+    if message:
+        payload['message'] = message
+    return json_response(payload, status_code)
+
+
+def bad_request(message: str):
+    return error_response(400, message)
+
+
+@bp.errorhandler(HTTPException)
+def handle_exception(e: HTTPException):
+    response = error_response(e.code, e.description)
+    # Retry-After отказов контроля допуска (429, 503).
+    retry_after = getattr(e, 'retry_after', None)
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from datetime import datetime, timezone
+import json
+
+# Библиотеки третьей стороны
+from flask import current_app, Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson необязателен
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        # Как и orjson с OPT_NAIVE_UTC: время в базе хранится в UTC без часового пояса.
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(data) -> bytes:
+    """
+    Сериализует данные в JSON, используя orjson, если он установлен.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NAIVE_UTC)
+    return json.dumps(data, default=_default, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def json_response(data, status: int = 200) -> Response:
+    """
+    Возвращает ответ с JSON, минуя jsonify() и его провайдер.
+    """
+    return current_app.response_class(dumps(data), status=status, mimetype='application/json')
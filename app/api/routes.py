@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from typing import Callable, Iterable, Optional
+
+# Библиотеки третьей стороны
+from flask import current_app, g, request, url_for
+import sqlalchemy as sa
+
+# Собственные модули
+from app import db, sharding, tags
+from app.api import bp
+from app.api.auth import token_required
+from app.api.errors import bad_request, error_response
+from app.api.responses import json_response
+from app.models import User, Post, PostArchive, PostMention, PostTag, avatar_url, followers
+
+
+def _post_columns(model=Post) -> tuple:
+    """
+    Колонки, достаточные для сериализации поста: сущности ORM не создаются.
+    """
+    return (model.id, model.body, model.timestamp, model.language,
+            User.id.label('user_id'), User.username, User.email)
+
+
+def _serialize(rows: Iterable) -> list:
+    avatars = {}
+    items = []
+    for row in rows:
+        avatar = avatars.get(row.email)
+        if avatar is None:
+            avatar = avatars[row.email] = avatar_url(row.email, 70, external=True)
+        items.append({
+            'id': row.id,
+            'body': row.body,
+            'timestamp': row.timestamp,
+            'language': row.language,
+            'author': {'id': row.user_id, 'username': row.username, 'avatar': avatar},
+        })
+    return items
+
+
+def _limit() -> int:
+    limit = request.args.get('limit', current_app.config['POSTS_PER_PAGE'], type=int)
+    return max(1, min(limit, current_app.config.get('API_MAX_LIMIT', 100)))
+
+
+def _page(query: sa.Select, endpoint: str, user_ids: Optional[Callable[[], list]] = None,
+          archive: Optional[sa.Select] = None, **values) -> dict:
+    """
+    Выполняет запрос постов с keyset-пагинацией по id (?before=<id>&limit=<n>).
+
+    При шардировании вместо query страница собирается со всех шардов постов авторов,
+    которых возвращает user_ids() (без user_ids - всех авторов). Запрос archive к post_archive
+    выполняется, только если горячие посты закончились на этой странице: она дополняется
+    из архива, как профиль в HTML-интерфейсе.
+
+    Returns:
+        dict: Посты страницы и ссылка на следующую страницу (или None).
+    """
+    limit = _limit()
+    before = request.args.get('before', type=int)
+    if current_app.extensions['shards'] is not None:
+        rows = sharding.with_authors(sharding.newest_rows(
+            user_ids() if user_ids else None, limit=limit + 1, before_id=before, order='id'))
+    else:
+        if before is not None:
+            query = query.where(Post.id < before)
+        rows = db.session.execute(query.order_by(Post.id.desc()).limit(limit + 1)).all()
+    if archive is not None and len(rows) <= limit:
+        bound = rows[-1].id if rows else before
+        if bound is not None:
+            archive = archive.where(PostArchive.id < bound)
+        rows = list(rows) + db.session.execute(
+            archive.order_by(PostArchive.id.desc()).limit(limit + 1 - len(rows))).all()
+    items = _serialize(rows[:limit])
+    next_url = url_for(endpoint, before=items[-1]['id'], limit=limit, **values) \
+        if len(rows) > limit else None
+    return {'items': items, 'next': next_url}
+
+
+@bp.route('/timeline')
+@token_required
+def timeline():
+    """
+    Лента пользователя: его посты и посты тех, на кого он подписан.
+    """
+    following = sa.select(followers.c.followed_id).where(followers.c.follower_id == g.api_user_id)
+    query = (sa.select(*_post_columns()).join(User, Post.user_id == User.id)
+             .where(sa.or_(Post.user_id.in_(following), Post.user_id == g.api_user_id)))
+    return json_response(_page(query, 'api.timeline',
+                               lambda: sharding.timeline_user_ids(g.api_user_id)))
+
+
+@bp.route('/explore')
+@token_required
+def explore():
+    """
+    Глобальная лента всех постов.
+    """
+    query = sa.select(*_post_columns()).join(User, Post.user_id == User.id)
+    return json_response(_page(query, 'api.explore'))
+
+
+@bp.route('/users/<username>')
+@token_required
+def user(username: str):
+    """
+    Профиль пользователя со счетчиками подписок и страницей его постов.
+
+    Профиль и счетчики читаются одним запросом со скалярными подзапросами.
+    """
+    followers_count = sa.select(sa.func.count()).where(
+        followers.c.followed_id == User.id).scalar_subquery()
+    following_count = sa.select(sa.func.count()).where(
+        followers.c.follower_id == User.id).scalar_subquery()
+    is_following = sa.exists().where(followers.c.follower_id == g.api_user_id,
+                                     followers.c.followed_id == User.id)
+    row = db.session.execute(
+        sa.select(User.id, User.username, User.email, User.about_me, User.last_seen,
+                  followers_count.label('followers_count'),
+                  following_count.label('following_count'),
+                  is_following.label('is_following'))
+        .where(User.username == username)).first()
+    if row is None:
+        return error_response(404, 'Unknown user.')
+    query = (sa.select(*_post_columns()).join(User, Post.user_id == User.id)
+             .where(Post.user_id == row.id))
+    archive = (sa.select(*_post_columns(PostArchive)).join(User, PostArchive.user_id == User.id)
+               .where(PostArchive.user_id == row.id))
+    return json_response({
+        'id': row.id,
+        'username': row.username,
+        'about_me': row.about_me,
+        'last_seen': row.last_seen,
+        'avatar': avatar_url(row.email, 256, external=True),
+        'followers_count': row.followers_count,
+        'following_count': row.following_count,
+        'is_following': bool(row.is_following),
+        'posts': _page(query, 'api.user', lambda: [row.id], archive, username=username),
+    })
+
+
+@bp.route('/posts')
+@token_required
+def posts():
+    """
+    Пакетное получение постов: GET /api/posts?ids=1,2,3.
+
+    Посты возвращаются в порядке запрошенных id; отсутствующие id пропускаются.
+    """
+    ids = _parse_ids(request.args.get('ids', ''))
+    if ids is None:
+        return bad_request('ids must be a comma-separated list of integers.')
+    limit = current_app.config.get('API_MAX_LIMIT', 100)
+    if len(ids) > limit:
+        return bad_request(f'At most {limit} ids can be requested at once.')
+    return json_response({'items': _posts_by_ids(ids)})
+
+
+def _posts_by_ids(ids: list) -> list:
+    """
+    Сериализованные посты по id в порядке ids; отсутствующие id пропускаются.
+
+    Посты, перенесенные в архив, дочитываются из post_archive вторым запросом,
+    только если их не оказалось в таблице post.
+    """
+    if not ids:
+        return []
+    if current_app.extensions['shards'] is not None:
+        rows = sharding.with_authors(sharding.get_rows(ids))
+    else:
+        rows = db.session.execute(sa.select(*_post_columns()).join(User, Post.user_id == User.id)
+                                  .where(Post.id.in_(ids))).all()
+    missing = set(ids) - {row.id for row in rows}
+    if missing:
+        rows += db.session.execute(
+            sa.select(*_post_columns(PostArchive)).join(User, PostArchive.user_id == User.id)
+            .where(PostArchive.id.in_(missing))).all()
+    found = {item['id']: item for item in _serialize(rows)}
+    return [found[post_id] for post_id in ids if post_id in found]
+
+
+def _tag_page(model, key, endpoint: str, **values):
+    """
+    Посты с хэштегом или упоминанием с keyset-пагинацией (?before=<курсор>&limit=<n>).
+    """
+    before = request.args.get('before')
+    cursor = tags.decode_cursor(before)
+    if before and cursor is None:
+        return bad_request('before must be a cursor returned in "next".')
+    limit = _limit()
+    ids, next_cursor = tags.timeline(model, key, cursor, limit)
+    next_url = url_for(endpoint, before=next_cursor, limit=limit, **values) if next_cursor else None
+    return json_response({'items': _posts_by_ids(ids), 'next': next_url})
+
+
+@bp.route('/tags/<tag>')
+@token_required
+def tag(tag: str):
+    """
+    Посты с хэштегом #tag, начиная с новых.
+    """
+    return _tag_page(PostTag, tag.lower(), 'api.tag', tag=tag.lower())
+
+
+@bp.route('/users/<username>/mentions')
+@token_required
+def mentions(username: str):
+    """
+    Посты, в которых упомянут пользователь, начиная с новых.
+    """
+    user_id = db.session.scalar(sa.select(User.id).where(User.username == username))
+    if user_id is None:
+        return error_response(404, 'Unknown user.')
+    return _tag_page(PostMention, user_id, 'api.mentions', username=username)
+
+
+def _parse_ids(value: str) -> Optional[list]:
+    parts = [part.strip() for part in value.split(',') if part.strip()]
+    # isdigit() без isascii() пропускает символы вроде "²", которые не разбирает int().
+    if not all(part.isascii() and part.isdigit() for part in parts):
+        return None
+    return list(dict.fromkeys(int(part) for part in parts))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from datetime import datetime
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Optional, Tuple
+
+# Библиотеки третьей стороны
+from flask import current_app
+import sqlalchemy as sa
+
+# Собственные модули
+from app import db
+from app.models import Post, PostArchive, bump_profile_version
+from app.sharding import use_shard
+from app.search import remove_from_index
+
+ARCHIVE_COLUMNS = ('id', 'body', 'timestamp', 'user_id', 'language')
+
+
+def archive_posts(before: datetime, batch_size: int = 1000) -> Tuple[int, float]:
+    """
+    Переносит посты старше before из таблицы post в post_archive пачками.
+
+    Каждая пачка переносится в отдельной транзакции (INSERT ... SELECT и DELETE по списку id),
+    чтобы не держать долгие блокировки на горячей таблице. Перенесенные посты удаляются
+    из поискового индекса, а версия профиля их авторов увеличивается.
+
+    Args:
+        before (datetime): Горизонт архивации.
+        batch_size (int): Количество постов в одной транзакции.
+
+    Returns:
+        Tuple[int, float]: Количество перенесенных постов и затраченное время в секундах.
+    """
+    started = perf_counter()
+    shards = current_app.extensions['shards']
+    moved = 0
+    for shard in shards.keys if shards is not None else [None]:
+        moved += _archive_shard(shard, before, batch_size)
+    return moved, perf_counter() - started
+
+
+def _archive_shard(shard: Optional[str], before: datetime, batch_size: int) -> int:
+    """
+    Архивирует посты одного шарда (None - основной базы данных без шардирования).
+
+    Шард и архив находятся в разных базах данных, поэтому строки пачки читаются с шарда и
+    вставляются в post_archive отдельным запросом; обе стороны фиксируются одним commit() сессии.
+    """
+    moved = 0
+    columns = [getattr(Post, name) for name in ARCHIVE_COLUMNS]
+    while True:
+        if shard is None:
+            rows = db.session.execute(
+                sa.select(Post.id, Post.user_id).where(Post.timestamp < before)
+                .order_by(Post.timestamp).limit(batch_size)).all()
+            if not rows:
+                break
+            ids = [row.id for row in rows]
+            db.session.execute(
+                sa.insert(PostArchive).from_select(ARCHIVE_COLUMNS,
+                                                   sa.select(*columns).where(Post.id.in_(ids))))
+            db.session.execute(sa.delete(Post).where(Post.id.in_(ids)))
+        else:
+            with use_shard(shard):
+                rows = db.session.execute(
+                    sa.select(*columns).where(Post.timestamp < before)
+                    .order_by(Post.timestamp).limit(batch_size)).all()
+            if not rows:
+                break
+            ids = [row.id for row in rows]
+            db.session.execute(sa.insert(PostArchive.__table__), [row._asdict() for row in rows])
+            with use_shard(shard):
+                db.session.execute(sa.delete(Post).where(Post.id.in_(ids)))
+        bump_profile_version(row.user_id for row in rows)
+        db.session.commit()
+        for post_id in ids:
+            remove_from_index(Post.__tablename__, SimpleNamespace(id=post_id))
+        moved += len(ids)
+    return moved
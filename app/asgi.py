@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import CookieError, SimpleCookie
+import io
+import json
+import sys
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+# Библиотеки третьей стороны
+from flask import Flask
+from itsdangerous import BadSignature
+import sqlalchemy as sa
+from werkzeug.http import HTTP_STATUS_CODES
+
+# Собственные модули
+from app import db
+from app.models import Post, Notification
+from app.translate import DEFAULT_TRANSLATOR_URL, TranslationError, translate_async
+
+
+async def read_body(receive: Callable[[], Awaitable[dict]]) -> bytes:
+    """
+    Читает тело запроса ASGI целиком.
+    """
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    return bytes(body)
+
+
+def _path_info(scope: dict) -> str:
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    return path[len(root_path):] if root_path and path.startswith(root_path) else path
+
+
+def build_environ(scope: dict, body: bytes) -> dict:
+    """
+    Строит окружение WSGI по запросу ASGI.
+    """
+    root_path = scope.get('root_path', '')
+    path = _path_info(scope)
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        # Признак асинхронного режима для шаблонов (поток уведомлений вместо опроса).
+        'microblog.async': True,
+    }
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+class AsyncGateway:
+    """
+    ASGI-приложение для асинхронного режима обслуживания.
+
+    Маршруты, которые в основном ждут внешние сервисы, обслуживаются корутинами:
+    поиск (запрос к Elasticsearch через AsyncElasticsearch), перевод (httpx.AsyncClient) и поток
+    уведомлений (Server-Sent Events). Пока они ждут ответа, процесс продолжает обслуживать другие
+    запросы. Все остальные запросы, а также отрисовка страницы поиска после получения результатов,
+    передаются приложению Flask в пул потоков.
+
+    Запуск: uvicorn microblog:asgi_app (или gunicorn -k uvicorn.workers.UvicornWorker).
+
+    Args:
+        app (Flask): Приложение Flask.
+        search_client: Асинхронный клиент Elasticsearch; по умолчанию создается по ELASTICSEARCH_URL.
+        http_client: Асинхронный HTTP-клиент для перевода; по умолчанию httpx.AsyncClient.
+        max_threads (Optional[int]): Размер пула потоков для Flask (по умолчанию ASGI_THREADS или 16).
+    """
+
+    def __init__(self, app: Flask, search_client=None, http_client=None,
+                 max_threads: Optional[int] = None):
+        self.app = app
+        self._search_client = search_client
+        self._http_client = http_client
+        self._owned_clients: List = []
+        self.executor = ThreadPoolExecutor(max_workers=max_threads or app.config.get('ASGI_THREADS', 16),
+                                           thread_name_prefix='wsgi')
+        self.routes: Dict[Tuple[str, str], Callable] = {
+            ('GET', '/search'): self.search,
+            ('POST', '/translate'): self.translate,
+            ('GET', '/notifications/stream'): self.notification_stream,
+        }
+        # Эндпоинты Flask, лимиты которых (app/admission.py) применяются к этим маршрутам.
+        self.endpoints: Dict[Tuple[str, str], str] = {
+            ('GET', '/search'): 'main.search',
+            ('POST', '/translate'): 'asgi.translate',
+            ('GET', '/notifications/stream'): 'main.notifications',
+        }
+
+    async def __call__(self, scope: dict, receive, send) -> None:
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        route = (scope['method'], _path_info(scope))
+        handler = self.routes.get(route)
+        if handler is None:
+            await self.call_wsgi(scope, receive, send)
+            return
+        limiter = self.app.extensions.get('admission')
+        endpoint = self.endpoints[route]
+        if limiter is None or not limiter.limits(endpoint):
+            await handler(scope, receive, send)
+            return
+        rejection = limiter.admit(endpoint, self.client_key(scope))
+        if rejection is not None:
+            await self.send_json(send, {'error': HTTP_STATUS_CODES[rejection.status]}, rejection.status,
+                                 [(b'retry-after', str(rejection.retry_after).encode('latin-1'))])
+            return
+        try:
+            # Flask не должен проверять лимиты запроса повторно (см. AdmissionControl).
+            await handler(dict(scope, **{'microblog.admitted': True}), receive, send)
+        finally:
+            limiter.release(endpoint)
+
+    async def lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def aclose(self) -> None:
+        for client in self._owned_clients:
+            await client.aclose() if hasattr(client, 'aclose') else await client.close()
+        self._owned_clients.clear()
+        self.executor.shutdown(wait=False)
+
+    @property
+    def search_client(self):
+        if self._search_client is None and self.app.config.get('ELASTICSEARCH_URL'):
+            from elasticsearch import AsyncElasticsearch
+            self._search_client = AsyncElasticsearch([self.app.config['ELASTICSEARCH_URL']])
+            self._owned_clients.append(self._search_client)
+        return self._search_client
+
+    @property
+    def http_client(self):
+        if self._http_client is None:
+            import httpx
+            self._http_client = httpx.AsyncClient(timeout=self.app.config.get('TRANSLATOR_TIMEOUT', 5.0))
+            self._owned_clients.append(self._http_client)
+        return self._http_client
+
+    def user_id(self, scope: dict) -> Optional[int]:
+        """
+        Возвращает id пользователя из подписанной cookie сессии Flask без обращения к Flask.
+        """
+        cookies = SimpleCookie()
+        try:
+            for name, value in scope.get('headers', []):
+                if name == b'cookie':
+                    cookies.load(value.decode('latin-1'))
+        except CookieError:
+            return None
+        morsel = cookies.get(self.app.config['SESSION_COOKIE_NAME'])
+        serializer = self.app.session_interface.get_signing_serializer(self.app)
+        if morsel is None or serializer is None:
+            return None
+        try:
+            session = serializer.loads(
+                morsel.value, max_age=int(self.app.permanent_session_lifetime.total_seconds()))
+            return int(session['_user_id'])
+        except (BadSignature, KeyError, TypeError, ValueError):
+            return None
+
+    def client_key(self, scope: dict) -> Tuple[str, str]:
+        """
+        Ключ клиента для лимитов, как AdmissionControl.client_key(): пользователь или IP-адрес.
+        """
+        user_id = self.user_id(scope)
+        if user_id is not None:
+            return 'user', str(user_id)
+        return 'ip', (scope.get('client') or ('', 0))[0]
+
+    def run_wsgi(self, environ: dict) -> Tuple[int, list, bytes]:
+        """
+        Вызывает приложение Flask (в потоке пула) и возвращает статус, заголовки и тело ответа.
+        """
+        response = {}
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            response['status'], response['headers'] = status, headers
+            return chunks.append
+
+        result = self.app(environ, start_response)
+        try:
+            for chunk in result:
+                chunks.append(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return int(response['status'].split(' ', 1)[0]), response['headers'], b''.join(chunks)
+
+    async def call_wsgi(self, scope: dict, receive, send, extra_environ: Optional[dict] = None) -> None:
+        environ = build_environ(scope, await read_body(receive))
+        environ.update(extra_environ or {})
+        if scope.get('microblog.admitted'):
+            environ['microblog.admitted'] = True
+        loop = asyncio.get_running_loop()
+        status, headers, body = await loop.run_in_executor(self.executor, self.run_wsgi, environ)
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                for name, value in headers]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    async def send_json(send, data, status: int = 200, headers: Optional[list] = None) -> None:
+        body = json.dumps(data).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode('latin-1'))] + (headers or [])})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def query_index(self, index: str, query: str, page: int, per_page: int) -> Tuple[list, int]:
+        """
+        Асинхронный аналог app.search.query_index().
+        """
+        client = self.search_client
+        if client is None:
+            return [], 0
+        search = await client.search(
+            index=index,
+            query={'multi_match': {'query': query, 'fields': ['*']}},
+            from_=(page - 1) * per_page,
+            size=per_page)
+        ids = [int(hit['_id']) for hit in search['hits']['hits']]
+        return ids, search['hits']['total']['value']
+
+    async def search(self, scope: dict, receive, send) -> None:
+        """
+        GET /search: запрос к Elasticsearch выполняется корутиной, страница отрисовывается Flask.
+        """
+        args = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        q = args.get('q', [''])[0].strip()
+        try:
+            page = int(args.get('page', ['1'])[0])
+        except ValueError:
+            page = 1
+        if not q or self.user_id(scope) is None:
+            # Пустой запрос и анонимного пользователя Flask перенаправит сам.
+            await self.call_wsgi(scope, receive, send)
+            return
+        results = await self.query_index(Post.__tablename__, q, page, self.app.config['POSTS_PER_PAGE'])
+        await self.call_wsgi(scope, receive, send, {'microblog.search': results})
+
+    async def translate(self, scope: dict, receive, send) -> None:
+        """
+        POST /translate: перевод через асинхронный HTTP-клиент; во Flask этого маршрута нет.
+        """
+        if self.user_id(scope) is None:
+            await self.send_json(send, {'error': 'authentication required'}, 401)
+            return
+        try:
+            data = json.loads(await read_body(receive) or b'{}')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or not data.get('text') or not data.get('dest_language'):
+            await self.send_json(send, {'error': 'text and dest_language are required'}, 400)
+            return
+        url = self.app.config.get('TRANSLATOR_URL', DEFAULT_TRANSLATOR_URL)
+        try:
+            text = await translate_async(self.http_client, url, data['text'],
+                                         data.get('source_language', 'auto'), data['dest_language'])
+        except TranslationError:
+            await self.send_json(send, {'error': 'translation failed'}, 502)
+            return
+        await self.send_json(send, {'text': text})
+
+    def notifications_since(self, user_id: int, since: float) -> list:
+        """
+        Читает новые уведомления пользователя (выполняется в потоке пула).
+        """
+        with self.app.app_context():
+            try:
+                rows = db.session.execute(
+                    sa.select(Notification.name, Notification.payload_json, Notification.timestamp)
+                    .where(Notification.user_id == user_id, Notification.timestamp > since)
+                    .order_by(Notification.timestamp)).all()
+            finally:
+                db.session.remove()
+        return [{'name': row.name, 'data': json.loads(row.payload_json), 'timestamp': row.timestamp}
+                for row in rows]
+
+    async def notification_stream(self, scope: dict, receive, send) -> None:
+        """
+        GET /notifications/stream: поток уведомлений в формате Server-Sent Events.
+
+        Соединение держит только корутина: раз в NOTIFICATION_STREAM_INTERVAL секунд выполняется
+        короткий индексный запрос в пуле потоков. Через NOTIFICATION_STREAM_TIMEOUT секунд поток
+        завершается, и браузер переподключается с заголовком Last-Event-ID.
+        """
+        user_id = self.user_id(scope)
+        if user_id is None:
+            await self.send_json(send, {'error': 'authentication required'}, 401)
+            return
+        args = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        since = args.get('since', ['0'])[0]
+        for name, value in scope.get('headers', []):
+            if name == b'last-event-id':
+                since = value.decode('latin-1')
+        try:
+            since = float(since)
+        except ValueError:
+            since = 0.0
+        interval = self.app.config.get('NOTIFICATION_STREAM_INTERVAL', 2.0)
+        timeout = self.app.config.get('NOTIFICATION_STREAM_TIMEOUT', 300.0)
+
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream'),
+                                (b'cache-control', b'no-cache'),
+                                (b'x-accel-buffering', b'no')]})
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            while not disconnected.done() and loop.time() < deadline:
+                notifications = await loop.run_in_executor(self.executor, self.notifications_since,
+                                                           user_id, since)
+                if notifications:
+                    since = notifications[-1]['timestamp']
+                    body = ''.join('id: {!r}\ndata: {}\n\n'.format(n['timestamp'], json.dumps(n))
+                                   for n in notifications)
+                    await send({'type': 'http.response.body', 'body': body.encode('utf-8'),
+                                'more_body': True})
+                await asyncio.wait([disconnected],
+                                   timeout=max(0.0, min(interval, deadline - loop.time())))
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+
+    @staticmethod
+    async def _wait_disconnect(receive) -> None:
+        while (await receive())['type'] != 'http.disconnect':
+            pass
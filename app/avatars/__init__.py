@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+bp = Blueprint('avatars', __name__)
+
+from app.avatars import routes
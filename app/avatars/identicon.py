@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+import colorsys
+import os
+import re
+import struct
+import tempfile
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Iterable, Optional, Tuple, Union
+import zlib
+
+# Библиотеки третьей стороны
+import sqlalchemy as sa
+
+# Собственные модули
+from app import db
+
+# Хеш MD5 адреса электронной почты, как в URL Gravatar.
+DIGEST = re.compile(r'^[0-9a-f]{32}$')
+# Размеры аватаров, которые использует приложение (AVATAR_SIZES по умолчанию).
+SIZES = (36, 64, 70, 128, 256)
+BACKGROUND = (240, 240, 240)
+GRID = 5
+
+
+def _chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+
+def render_identicon(digest: str, size: int) -> bytes:
+    """
+    Рисует identicon - симметричный узор 5x5 клеток одного цвета - и возвращает его в формате PNG.
+
+    Узор и цвет однозначно определяются хешем: клетка левой половины закрашена, если
+    соответствующая шестнадцатеричная цифра хеша четная, правая половина - зеркальное отражение;
+    оттенок задают последние семь цифр. Изображение палитровое (два цвета, байт на пиксель),
+    поэтому собирается из повторяющихся строк байтов без попиксельного цикла.
+
+    Args:
+        digest (str): Хеш MD5 в шестнадцатеричном виде (32 символа).
+        size (int): Ширина и высота изображения в пикселях.
+
+    Returns:
+        bytes: Содержимое файла PNG.
+    """
+    nibbles = [int(char, 16) for char in digest[:GRID * 3]]
+    cells = [[nibbles[min(col, GRID - 1 - col) * GRID + row] % 2 == 0 for col in range(GRID)]
+             for row in range(GRID)]
+    red, green, blue = colorsys.hls_to_rgb(int(digest[-7:], 16) / 0xfffffff, 0.55, 0.6)
+
+    cell = max(size // (GRID + 1), 1)
+    margin = (size - GRID * cell) // 2
+    tail = size - margin - GRID * cell
+    blank = b'\x00' + bytes(size)
+    lines = [blank * margin]
+    for row in cells:
+        line = b'\x00' + bytes(margin) + b''.join((b'\x01' if on else b'\x00') * cell for on in row) \
+            + bytes(tail)
+        lines.append(line * cell)
+    lines.append(blank * tail)
+
+    palette = bytes(BACKGROUND) + bytes(round(channel * 255) for channel in (red, green, blue))
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        _chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 3, 0, 0, 0)),
+        _chunk(b'PLTE', palette),
+        _chunk(b'IDAT', zlib.compress(b''.join(lines), 9)),
+        _chunk(b'IEND', b''),
+    ))
+
+
+class AvatarCache:
+    """
+    Дисковый кэш отрисованных аватаров с ограничением общего размера.
+
+    Файл каждого аватара записывается атомарно (временный файл и os.replace()), поэтому
+    несколько рабочих процессов могут пользоваться одним каталогом. Когда размер каталога
+    превышает max_bytes, удаляются самые старые файлы, пока не останется 90% лимита;
+    удаленный аватар просто отрисуется заново при следующем запросе.
+
+    Args:
+        directory (Optional[str]): Каталог кэша; None - аватары отрисовываются при каждом запросе.
+        max_bytes (int): Максимальный размер каталога в байтах.
+    """
+
+    def __init__(self, directory: Optional[str], max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._bytes: Optional[int] = None
+        self._lock = Lock()
+
+    def path(self, digest: str, size: int) -> str:
+        return os.path.join(self.directory, digest[:2], f'{digest}-{size}.png')
+
+    def get(self, digest: str, size: int, store: Union[bool, Callable[[], bool]] = True) -> bytes:
+        """
+        Возвращает PNG аватара из кэша, отрисовывая его при промахе.
+
+        Args:
+            digest (str): Хеш адреса электронной почты.
+            size (int): Размер в пикселях.
+            store: Сохранять ли отрисованный аватар в кэш; функция вызывается только при промахе.
+        """
+        if not self.directory:
+            return render_identicon(digest, size)
+        path = self.path(digest, size)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        data = render_identicon(digest, size)
+        if store() if callable(store) else store:
+            self._store(path, data)
+        return data
+
+    def _store(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in self._files())
+            else:
+                self._bytes += len(data)
+            if self._bytes > self.max_bytes:
+                self._bytes = self._prune(int(self.max_bytes * 0.9))
+
+    def _files(self) -> Iterable[Tuple[str, int, float]]:
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            for item in os.scandir(entry.path):
+                if item.name.endswith('.png'):
+                    try:
+                        stat = item.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield item.path, stat.st_size, stat.st_mtime
+
+    def _prune(self, target: int) -> int:
+        # Размер пересчитывается по каталогу: в него пишут и другие процессы.
+        files = sorted(self._files(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+
+def prerender(cache: AvatarCache, sizes: Iterable[int], batch_size: int = 1000) -> Tuple[int, float]:
+    """
+    Заранее отрисовывает в дисковый кэш аватары всех пользователей в размерах sizes.
+
+    Returns:
+        Tuple[int, float]: Количество отрисованных аватаров и затраченное время в секундах.
+    """
+    from app.models import User, email_digest
+    started = perf_counter()
+    sizes = list(sizes)
+    rendered = 0
+    emails = db.session.scalars(sa.select(User.email).execution_options(yield_per=batch_size))
+    for email in emails:
+        digest = email_digest(email)
+        for size in sizes:
+            if not os.path.exists(cache.path(digest, size)):
+                cache.get(digest, size)
+                rendered += 1
+    return rendered, perf_counter() - started
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+# Библиотеки третьей стороны
+from flask import abort, current_app, request, Response
+import sqlalchemy as sa
+
+# Собственные модули
+from app import db
+from app.avatars import bp
+from app.avatars.identicon import DIGEST, SIZES
+from app.models import User
+
+# Картинка однозначно определяется URL, поэтому браузер и прокси могут хранить ее сколько угодно.
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _known(digest: str) -> bool:
+    return db.session.scalar(sa.select(sa.exists().where(User.email_hash == digest)))
+
+
+@bp.route('/avatar/<digest>/<int:size>')
+def avatar(digest: str, size: int) -> Response:
+    """
+    Аватар пользователя (identicon) по хешу адреса электронной почты.
+
+    Маршрут вынесен в отдельный blueprint: обработчики main (обновление last_seen) для картинок
+    не нужны, а на странице ленты их до 50.
+
+    В дисковый кэш сохраняются только аватары существующих пользователей: по произвольным хешам
+    картинка отрисовывается без сохранения, чтобы запросы по ним не вытесняли настоящие аватары.
+
+    Args:
+        digest (str): Хеш MD5 адреса электронной почты.
+        size (int): Размер в пикселях (один из AVATAR_SIZES).
+
+    Returns:
+        Response: Изображение PNG.
+    """
+    if not DIGEST.match(digest) or size not in current_app.config.get('AVATAR_SIZES', SIZES):
+        abort(404)
+    response = Response(current_app.avatar_cache.get(digest, size, store=lambda: _known(digest)),
+                        mimetype='image/png')
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.set_etag(f'{digest}-{size}')
+    return response.make_conditional(request)
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import random
+import statistics
+import subprocess
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+# Библиотеки третьей стороны
+from flask import Flask
+import sqlalchemy as sa
+from werkzeug.security import generate_password_hash
+
+# Собственные модули
+from app import db
+from app.models import User, Post, Message, Conversation, followers
+
+WORDS = ('flask', 'python', 'database', 'index', 'cache', 'query', 'timeline', 'follow',
+         'message', 'search', 'latency', 'server', 'worker', 'template', 'render', 'page')
+SEED_PASSWORD = 'password'
+
+
+def _chunks(rows: list, size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _bulk_insert(table, rows: list, chunk_size: int = 5000) -> None:
+    """
+    Вставляет строки пачками одним executemany-запросом на пачку, минуя ORM.
+    """
+    for chunk in _chunks(rows, chunk_size):
+        db.session.execute(sa.insert(table), chunk)
+
+
+def seed(users: int = 1000, posts_per_user: int = 10, follows_per_user: int = 20,
+         messages: int = 5000, alpha: float = 1.2, seed_value: int = 42) -> Dict[str, int]:
+    """
+    Заполняет базу данных синтетическими пользователями, постами, подписками и сообщениями.
+
+    Граф подписок подчиняется степенному закону: вероятность подписаться на пользователя с рангом r
+    пропорциональна 1 / (r + 1) ** alpha, а количество подписок пользователя распределено по Парето
+    со средним около follows_per_user. Генерация детерминирована для одного и того же seed_value.
+    Вставка выполняется пачками без ORM; индекс Elasticsearch не обновляется (см. Post.reindex()).
+
+    Returns:
+        Dict[str, int]: Количество созданных строк по таблицам.
+    """
+    rng = random.Random(seed_value)
+    now = datetime.now(timezone.utc)
+    password_hash = generate_password_hash(SEED_PASSWORD)
+    first_id = (db.session.scalar(sa.select(sa.func.max(User.id))) or 0) + 1
+    ids = list(range(first_id, first_id + users))
+
+    _bulk_insert(User.__table__, [{
+        'id': user_id,
+        'username': f'bench{user_id}',
+        'email': f'bench{user_id}@example.com',
+        'password_hash': password_hash,
+        'about_me': ' '.join(rng.choices(WORDS, k=6)),
+        'last_seen': now - timedelta(minutes=rng.randrange(60 * 24 * 30)),
+    } for user_id in ids])
+
+    cumulative = []
+    total = 0.0
+    for rank in range(users):
+        total += 1.0 / (rank + 1) ** alpha
+        cumulative.append(total)
+    follow_rows = []
+    for user_id in ids:
+        # Распределение Парето с параметром 2 имеет среднее 2, поэтому делим цель пополам.
+        degree = min(users - 1, int(rng.paretovariate(2.0) * follows_per_user / 2))
+        targets = set(rng.choices(ids, cum_weights=cumulative, k=degree))
+        targets.discard(user_id)
+        follow_rows += [{'follower_id': user_id, 'followed_id': target} for target in sorted(targets)]
+    _bulk_insert(followers, follow_rows)
+
+    post_rows = []
+    for user_id in ids:
+        for _ in range(posts_per_user):
+            post_rows.append({
+                'body': ' '.join(rng.choices(WORDS, k=rng.randint(3, 12))),
+                'timestamp': now - timedelta(seconds=rng.randrange(60 * 60 * 24 * 30)),
+                'user_id': user_id,
+                'language': 'en',
+            })
+    post_rows.sort(key=lambda row: row['timestamp'])
+    _bulk_insert(Post.__table__, post_rows)
+
+    message_rows = [{
+        'sender_id': rng.choice(ids),
+        'recipient_id': rng.choices(ids, cum_weights=cumulative)[0],
+        'body': ' '.join(rng.choices(WORDS, k=rng.randint(3, 12))),
+        'timestamp': now - timedelta(seconds=rng.randrange(60 * 60 * 24 * 30)),
+    } for _ in range(messages)]
+    message_rows.sort(key=lambda row: row['timestamp'])
+
+    # Сводки переписок считаются здесь же, поэтому id сообщений и переписок назначаются явно.
+    next_message_id = (db.session.scalar(sa.select(sa.func.max(Message.id))) or 0) + 1
+    next_conversation_id = (db.session.scalar(sa.select(sa.func.max(Conversation.id))) or 0) + 1
+    conversations = {}
+    for message_id, row in enumerate(message_rows, next_message_id):
+        user_a_id, user_b_id = sorted((row['sender_id'], row['recipient_id']))
+        conversation = conversations.get((user_a_id, user_b_id))
+        if conversation is None:
+            conversation = conversations[user_a_id, user_b_id] = {
+                'id': next_conversation_id + len(conversations), 'user_a_id': user_a_id,
+                'user_b_id': user_b_id, 'unread_a': 0, 'unread_b': 0}
+        conversation.update(last_message_id=message_id, last_sender_id=row['sender_id'],
+                            last_body=row['body'], last_timestamp=row['timestamp'])
+        conversation['unread_a' if row['recipient_id'] == user_a_id else 'unread_b'] += 1
+        row.update(id=message_id, conversation_id=conversation['id'])
+    _bulk_insert(Conversation.__table__, list(conversations.values()))
+    _bulk_insert(Message.__table__, message_rows)
+
+    db.session.commit()
+    return {'users': users, 'followers': len(follow_rows), 'posts': len(post_rows),
+            'conversations': len(conversations), 'messages': len(message_rows)}
+
+
+def _measure(func: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """
+    Вызывает func один раз для прогрева и repeat раз с замером, считая также SQL-запросы.
+    """
+    statements = []
+
+    def count(*args):
+        statements.append(1)
+
+    func()
+    timings = []
+    sa.event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        for _ in range(repeat):
+            started = perf_counter()
+            func()
+            timings.append((perf_counter() - started) * 1000)
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', count)
+    timings.sort()
+    return {
+        'min_ms': timings[0],
+        'median_ms': statistics.median(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'mean_ms': statistics.fmean(timings),
+        'queries': len(statements) / repeat,
+    }
+
+
+def run_suite(app: Flask, repeat: int = 10, username: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """
+    Замеряет время ответа основных маршрутов через тестовый клиент Flask и методов модели User.
+
+    Args:
+        app (Flask): Приложение с заполненной базой данных.
+        repeat (int): Количество замеров для каждого случая.
+        username (Optional[str]): Пользователь, от имени которого выполняются запросы;
+            по умолчанию пользователь с медианным id.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Статистика по каждому случаю.
+    """
+    if username is None:
+        ids = db.session.scalars(sa.select(User.id).order_by(User.id)).all()
+        viewer = db.session.get(User, ids[len(ids) // 2])
+    else:
+        viewer = db.session.scalar(sa.select(User).where(User.username == username))
+    popular = db.session.get(User, db.session.scalar(
+        sa.select(followers.c.followed_id).group_by(followers.c.followed_id)
+        .order_by(sa.func.count().desc()).limit(1)) or viewer.id)
+    word = WORDS[0]
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(viewer.id)
+
+    routes = {
+        'route:index': '/index',
+        'route:explore': '/explore',
+        'route:explore_page_5': '/explore?page=5',
+        'route:user': f'/user/{popular.username}',
+        'route:search': f'/search?q={word}',
+        'route:messages': '/messages',
+        'route:notifications': '/notifications',
+    }
+    results = {}
+    for name, url in routes.items():
+        results[name] = _measure(lambda url=url: client.get(url), repeat)
+
+    per_page = app.config['POSTS_PER_PAGE']
+    helpers = {
+        'model:followers_count': lambda: popular.followers_count(),
+        'model:following_count': lambda: viewer.following_count(),
+        'model:following_posts': lambda: db.session.scalars(
+            viewer.following_posts().limit(per_page)).all(),
+        'model:unread_message_count': lambda: popular.unread_message_count(),
+        'model:is_following': lambda: viewer.is_following(popular),
+    }
+    for name, func in helpers.items():
+        results[name] = _measure(func, repeat)
+    return results
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results: Dict[str, Dict[str, float]], directory: str) -> str:
+    """
+    Сохраняет результаты в JSON-файл с отметкой времени и текущим коммитом.
+
+    Returns:
+        str: Путь к сохраненному файлу.
+    """
+    commit = current_commit()
+    created = datetime.now(timezone.utc)
+    counts = {name: db.session.scalar(sa.select(sa.func.count()).select_from(table))
+              for name, table in (('users', User.__table__), ('followers', followers),
+                                  ('posts', Post.__table__), ('messages', Message.__table__))}
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, '{}-{}.json'.format(created.strftime('%Y%m%dT%H%M%S'),
+                                                       commit or 'nogit'))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'commit': commit, 'created': created.isoformat(), 'counts': counts,
+                   'results': results}, f, indent=2)
+    return path
+
+
+def compare(old: dict, new: dict, threshold: float = 0.2, key: str = 'median_ms') -> List[dict]:
+    """
+    Сравнивает два набора результатов.
+
+    Returns:
+        List[dict]: Строки сравнения по каждому общему случаю с признаком регрессии
+        (новое значение больше старого более чем на threshold).
+    """
+    rows = []
+    for name in sorted(set(old['results']) & set(new['results'])):
+        before = old['results'][name][key]
+        after = new['results'][name][key]
+        ratio = after / before if before else float('inf')
+        rows.append({'name': name, 'before': before, 'after': after, 'ratio': ratio,
+                     'regression': ratio > 1 + threshold})
+    return rows
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Потокобезопасный кэш в памяти процесса с вытеснением давно не используемых записей (LRU)
+    и необязательным временем жизни записей (TTL).
+
+    Attributes:
+        maxsize (int): Максимальное количество записей в кэше.
+        ttl (Optional[float]): Время жизни записи в секундах, None - без ограничения.
+        hits (int): Количество попаданий в кэш.
+        misses (int): Количество промахов кэша.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Возвращает значение по ключу или default, если запись отсутствует или устарела.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (item[1] is not None and item[1] < monotonic()):
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Сохраняет значение в кэше, вытесняя самую старую запись при переполнении.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Возвращает значение из кэша или вычисляет его с помощью factory и сохраняет.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Удаляет все записи, ключи которых удовлетворяют predicate.
+
+        Returns:
+            int: Количество удаленных записей.
+        """
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
@@ -1,6 +1,14 @@
+from datetime import datetime, timedelta, timezone
+import io
+import json
 import os
+import pstats
+import time
+
 import click
 
+from app.profiling import list_dumps
+
 
 def register(app):
     @app.cli.group()
@@ -33,3 +41,246 @@ def register(app):
         """Compile all languages."""
         if os.system('pybabel compile -d app/translations'):
             raise RuntimeError('compile command failed')
+
+    @app.cli.group()
+    def templates():
+        """Jinja template commands."""
+        pass
+
+    @templates.command('compile')
+    def compile_templates():
+        """Compile all templates into the bytecode cache (TEMPLATE_CACHE_DIR)."""
+        if app.jinja_env.bytecode_cache is None:
+            raise click.ClickException('TEMPLATE_CACHE_DIR is not configured.')
+        from app.prefork import compile_templates as compile_all
+        started = time.perf_counter()
+        names = compile_all(app)
+        click.echo('Compiled {} templates in {:.2f} s'.format(len(names), time.perf_counter() - started))
+
+    @app.cli.group()
+    def profile():
+        """Request profiling dump commands."""
+        pass
+
+    @profile.command('list')
+    def list_profiles():
+        """List profiling dumps."""
+        directory = app.config['PROFILE_DIR']
+        for name in list_dumps(directory):
+            meta_path = os.path.join(directory, name + '.json')
+            meta = {}
+            if os.path.exists(meta_path):
+                with open(meta_path, encoding='utf-8') as f:
+                    meta = json.load(f)
+            click.echo('{}  {:>8.1f} ms  {} {}'.format(
+                name, meta.get('duration', 0) * 1000, meta.get('method', '?'),
+                meta.get('path', '?')))
+
+    @profile.command()
+    @click.argument('name')
+    @click.option('--limit', default=20, help='Number of rows to show.')
+    @click.option('--sort', default='cumulative', help='pstats sort key.')
+    def show(name, limit, sort):
+        """Summarize a profiling dump."""
+        directory = app.config['PROFILE_DIR']
+        path = os.path.join(directory, name + '.prof')
+        if not os.path.exists(path):
+            raise click.ClickException('dump not found: ' + name)
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats(sort).print_stats(limit)
+        click.echo(out.getvalue())
+        meta_path = os.path.join(directory, name + '.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            click.echo('Top allocations:')
+            for stat in meta['allocations'][:limit]:
+                click.echo('{:>10} B  {:>6}  {}'.format(
+                    stat['size_diff'], stat['count_diff'], stat['location']))
+
+    @app.cli.group()
+    def bench():
+        """Synthetic data and benchmark commands."""
+        pass
+
+    @bench.command('seed')
+    @click.option('--users', default=1000, help='Number of users.')
+    @click.option('--posts-per-user', default=10, help='Posts per user.')
+    @click.option('--follows-per-user', default=20, help='Average follows per user.')
+    @click.option('--messages', default=5000, help='Number of private messages.')
+    @click.option('--alpha', default=1.2, help='Power-law exponent of the follow graph.')
+    @click.option('--seed', 'seed_value', default=42, help='Random seed.')
+    def bench_seed(users, posts_per_user, follows_per_user, messages, alpha, seed_value):
+        """Fill the database with reproducible synthetic data."""
+        from app.bench import seed
+        started = time.perf_counter()
+        counts = seed(users=users, posts_per_user=posts_per_user,
+                      follows_per_user=follows_per_user, messages=messages,
+                      alpha=alpha, seed_value=seed_value)
+        click.echo('Seeded {} in {:.1f} s'.format(
+            ', '.join(f'{count} {name}' for name, count in counts.items()),
+            time.perf_counter() - started))
+
+    @bench.command('run')
+    @click.option('--repeat', default=10, help='Measurements per case.')
+    @click.option('--user', 'username', default=None, help='Username to run requests as.')
+    @click.option('--output', default='bench-results', help='Directory for JSON results.')
+    def bench_run(repeat, username, output):
+        """Time the core routes and model helpers."""
+        from app.bench import run_suite, save_results
+        results = run_suite(app, repeat=repeat, username=username)
+        for name, stats in results.items():
+            click.echo('{:<32} {:>9.2f} ms  p95 {:>9.2f} ms  {:>6.1f} queries'.format(
+                name, stats['median_ms'], stats['p95_ms'], stats['queries']))
+        click.echo('Saved ' + save_results(results, output))
+
+    @bench.command('compare')
+    @click.argument('old', type=click.File())
+    @click.argument('new', type=click.File())
+    @click.option('--threshold', default=0.2, help='Allowed slowdown ratio.')
+    def bench_compare(old, new, threshold):
+        """Compare two benchmark result files."""
+        from app.bench import compare
+        rows = compare(json.load(old), json.load(new), threshold=threshold)
+        for row in rows:
+            click.echo('{:<32} {:>9.2f} -> {:>9.2f} ms  x{:.2f}{}'.format(
+                row['name'], row['before'], row['after'], row['ratio'],
+                '  REGRESSION' if row['regression'] else ''))
+        if any(row['regression'] for row in rows):
+            raise SystemExit(1)
+
+    @app.cli.group()
+    def data():
+        """Bulk data import and export commands."""
+        pass
+
+    def report(stats):
+        for name, (count, seconds) in stats.items():
+            click.echo('{:<10} {:>10} rows  {:>8.2f} s  {:>10.0f} rows/s'.format(
+                name, count, seconds, count / seconds if seconds else 0))
+
+    @data.command('export')
+    @click.argument('output', type=click.File('w', encoding='utf-8'))
+    @click.option('--tables', default=None,
+                  help='Comma-separated tables to export (default: all of app.transfer.TABLES).')
+    @click.option('--batch-size', default=5000, help='Rows fetched per round trip.')
+    def data_export(output, tables, batch_size):
+        """Stream users, follows, posts, conversations and messages as JSONL."""
+        from app.transfer import TABLES, export_jsonl
+        tables = tables.split(',') if tables else list(TABLES)
+        report(export_jsonl(output, tables, batch_size=batch_size))
+
+    @data.command('import')
+    @click.argument('source', type=click.File(encoding='utf-8'))
+    @click.option('--chunk-size', default=5000, help='Rows per insert statement.')
+    @click.option('--workers', default=1, help='Processes used to parse JSON.')
+    @click.option('--reindex/--no-reindex', default=False,
+                  help='Rebuild the search index after loading.')
+    def data_import(source, chunk_size, workers, reindex):
+        """Load a JSONL export with chunked bulk inserts."""
+        from app.transfer import import_jsonl
+        report(import_jsonl(source, chunk_size=chunk_size, workers=workers, reindex=reindex))
+
+    @app.cli.group()
+    def posts():
+        """Post maintenance commands."""
+        pass
+
+    @posts.command()
+    @click.option('--days', default=None, type=int,
+                  help='Archive posts older than this (default POST_ARCHIVE_DAYS).')
+    @click.option('--batch-size', default=1000, help='Posts moved per transaction.')
+    def archive(days, batch_size):
+        """Move old posts into the post_archive table."""
+        from app.archive import archive_posts
+        days = days if days is not None else app.config.get('POST_ARCHIVE_DAYS', 365)
+        before = datetime.now(timezone.utc) - timedelta(days=days)
+        moved, seconds = archive_posts(before, batch_size=batch_size)
+        click.echo('Archived {} posts older than {} days in {:.2f} s'.format(moved, days, seconds))
+
+    @posts.command()
+    @click.option('--batch-size', default=1000, help='Posts scanned per batch.')
+    def rebalance(batch_size):
+        """Move posts to the shards that own them (see POST_SHARDS)."""
+        if app.extensions['shards'] is None:
+            raise click.ClickException('POST_SHARDS is not configured.')
+        from app.sharding import rebalance as rebalance_posts
+        moved, seconds = rebalance_posts(batch_size=batch_size)
+        for direction, count in sorted(moved.items()):
+            click.echo('{}: {} posts'.format(direction, count))
+        click.echo('Moved {} posts in {:.2f} s'.format(sum(moved.values()), seconds))
+
+    @posts.command('index-tags')
+    @click.option('--batch-size', default=1000, help='Post ids per chunk.')
+    @click.option('--workers', default=4, help='Chunks processed in parallel.')
+    def index_tags(batch_size, workers):
+        """Fill post_tag and post_mention for existing posts."""
+        from app.tags import backfill
+        totals, seconds = backfill(batch_size=batch_size, workers=workers)
+        click.echo('Indexed {posts} posts: {tags} tags, {mentions} mentions'.format(**totals)
+                   + ' in {:.2f} s'.format(seconds))
+
+    @app.cli.group()
+    def messages():
+        """Private message maintenance commands."""
+        pass
+
+    @messages.command('rebuild-conversations')
+    @click.option('--batch-size', default=1000, help='Messages processed per transaction.')
+    def rebuild_conversations(batch_size):
+        """Create conversation summaries for messages sent before they existed."""
+        from app.models import Conversation
+        started = time.perf_counter()
+        processed = Conversation.rebuild(batch_size=batch_size)
+        click.echo('Processed {} messages in {:.2f} s'.format(processed, time.perf_counter() - started))
+
+    @app.cli.group()
+    def notifications():
+        """Notification maintenance commands."""
+        pass
+
+    @notifications.command()
+    @click.option('--batch-size', default=500, help='Rows deleted per transaction.')
+    def prune(batch_size):
+        """Delete expired and superseded notifications."""
+        from app.notifications import prune_notifications
+        removed, seconds = prune_notifications(
+            app.config.get('NOTIFICATION_RETENTION', {}),
+            app.config.get('NOTIFICATION_RETENTION_DEFAULT', 30 * 24 * 3600),
+            batch_size=batch_size)
+        for name, count in removed.items():
+            click.echo('{:<30} {:>8}'.format(name, count))
+        click.echo('Removed {} notifications in {:.2f} s'.format(sum(removed.values()), seconds))
+
+    @app.cli.group()
+    def suggestions():
+        """Who-to-follow suggestion commands."""
+        pass
+
+    @suggestions.command()
+    @click.option('--top-k', default=10, help='Suggestions stored per user.')
+    @click.option('--batch-size', default=1000, help='Users written per transaction.')
+    def compute(top_k, batch_size):
+        """Recompute friends-of-friends suggestions from the follow graph."""
+        from app.suggestions import compute_suggestions
+        stats = compute_suggestions(k=top_k, batch_size=batch_size)
+        click.echo('{users} users, {edges} edges -> {suggestions} suggestions'.format(**stats))
+        click.echo('load {load_seconds:.2f} s, score {score_seconds:.2f} s, '
+                   'write {write_seconds:.2f} s'.format(**stats))
+
+    @app.cli.group()
+    def avatars():
+        """Avatar cache commands."""
+        pass
+
+    @avatars.command()
+    @click.option('--sizes', default='70,256', help='Comma-separated sizes to render.')
+    @click.option('--batch-size', default=1000, help='Users fetched per round trip.')
+    def render(sizes, batch_size):
+        """Pre-render avatars of all users into the disk cache."""
+        if not app.avatar_cache.directory:
+            raise click.ClickException('AVATAR_CACHE_DIR is not configured.')
+        from app.avatars.identicon import prerender
+        rendered, seconds = prerender(app.avatar_cache, [int(size) for size in sizes.split(',')],
+                                      batch_size=batch_size)
+        click.echo('Rendered {} avatars in {:.2f} s'.format(rendered, seconds))
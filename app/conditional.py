@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from datetime import datetime, timezone
+from hashlib import md5
+from typing import Any, Optional
+
+# Библиотеки третьей стороны
+from flask import make_response, request, session
+from werkzeug import Response
+
+
+def weak_etag(*markers: Any) -> str:
+    """
+    Строит значение слабого ETag из дешевых маркеров версии (максимальный id, время, счетчики).
+
+    Args:
+        *markers: Значения, от которых зависит содержимое ответа.
+
+    Returns:
+        str: Значение ETag без кавычек и префикса W/.
+    """
+    return md5(repr(markers).encode('utf-8')).hexdigest()
+
+
+def _as_http_date(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Приводит время к UTC с точностью до секунды, как в HTTP-заголовках.
+    """
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """
+    Проверяет условные заголовки запроса до выполнения основного запроса к базе данных.
+
+    Args:
+        etag (str): Текущее значение ETag ресурса.
+        last_modified (Optional[datetime]): Время последнего изменения ресурса.
+
+    Returns:
+        Optional[Response]: Ответ 304, если у клиента актуальная версия, иначе None.
+
+    Notes:
+        - Пока в сессии есть неотображенные flash-сообщения, ответ 304 не отдается,
+          иначе сообщения не увидит пользователь.
+        - If-Modified-Since учитывается только при отсутствии If-None-Match.
+    """
+    if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+        return None
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    else:
+        last_modified = _as_http_date(last_modified)
+        fresh = (last_modified is not None and request.if_modified_since is not None
+                 and last_modified <= request.if_modified_since)
+    if not fresh:
+        return None
+    return with_validators(Response(status=304), etag, last_modified)
+
+
+def with_validators(rv: Any, etag: str, last_modified: Optional[datetime] = None) -> Response:
+    """
+    Добавляет к ответу заголовки ETag, Last-Modified и Cache-Control для повторной проверки.
+
+    Args:
+        rv: Возвращаемое значение представления (строка, список, Response).
+        etag (str): Значение ETag ресурса.
+        last_modified (Optional[datetime]): Время последнего изменения ресурса.
+
+    Returns:
+        Response: Ответ с заголовками валидации кэша.
+    """
+    response = make_response(rv)
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = _as_http_date(last_modified)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
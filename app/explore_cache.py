@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from dataclasses import dataclass, replace
+from datetime import datetime
+from threading import Event, Lock
+from time import monotonic
+from typing import List, Optional, Tuple
+
+# Библиотеки третьей стороны
+from flask import current_app
+import sqlalchemy as sa
+
+# Собственные модули
+from app import db
+from app.models import Post, User, avatar_url
+from app.sharding import newest_rows, with_authors
+
+
+@dataclass(frozen=True)
+class CachedAuthor:
+    """
+    Неизменяемый снимок автора поста с полями, нужными шаблону '_post.html'.
+    """
+    id: int
+    username: str
+    email: str
+
+    def avatar(self, size: int) -> str:
+        return avatar_url(self.email, size)
+
+
+@dataclass(frozen=True)
+class CachedPost:
+    """
+    Неизменяемый снимок поста, который можно безопасно разделять между потоками и запросами.
+    """
+    __tablename__ = 'post'
+
+    id: int
+    body: str
+    timestamp: datetime
+    language: Optional[str]
+    author: CachedAuthor
+
+    @classmethod
+    def from_post(cls, post: Post) -> 'CachedPost':
+        author = post.author
+        return cls(id=post.id, body=post.body, timestamp=post.timestamp, language=post.language,
+                   author=CachedAuthor(id=author.id, username=author.username, email=author.email))
+
+
+class ExploreCache:
+    """
+    Общий для всех пользователей кэш самых новых постов глобальной ленты ('main.explore').
+
+    Кэш хранит до size последних постов, обслуживает первые страницы ленты и обновляется на месте
+    при публикации поста. Пост, опубликованный в другом процессе, в снимок этого процесса
+    не попадает, поэтому снимок помнит максимальный id поста, который он отражает: если в базе
+    данных есть пост новее, снимок загружается заново. Одновременные промахи кэша объединяются
+    (singleflight): запрос к базе данных выполняет только первый поток, остальные ждут его результата.
+
+    Attributes:
+        size (int): Количество кэшируемых постов.
+        ttl (float): Время жизни снимка в секундах; ограничивает рассинхронизацию между процессами.
+        hits (int): Количество обращений, обслуженных из кэша.
+        loads (int): Количество загрузок из базы данных.
+    """
+
+    def __init__(self, size: int = 100, ttl: float = 10.0, wait_timeout: float = 5.0):
+        self.size = size
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.hits = 0
+        self.loads = 0
+        self._posts: Optional[List[CachedPost]] = None
+        self._complete = False
+        self._expires = 0.0
+        self._version = 0
+        self._generation = 0
+        self._loading: Optional[Event] = None
+        self._lock = Lock()
+
+    def page(self, page: int, per_page: int,
+             version: Optional[int] = None) -> Optional[Tuple[List[CachedPost], bool]]:
+        """
+        Возвращает страницу ленты из кэша.
+
+        Args:
+            page (int): Номер страницы, начиная с 1.
+            per_page (int): Количество постов на странице.
+            version (Optional[int]): Максимальный id поста в базе данных (из Post.version()),
+                по которому построен ETag ответа; снимок старше этой версии не используется.
+
+        Returns:
+            Optional[Tuple[List[CachedPost], bool]]: Посты страницы и признак наличия следующей страницы,
+            либо None, если страница не помещается в кэш или загрузка не удалась.
+        """
+        if page < 1 or page * per_page > self.size:
+            return None
+        snapshot = self._snapshot(version or 0)
+        if snapshot is None:
+            return None
+        posts, complete = snapshot
+        end = page * per_page
+        has_next = end < len(posts) or not complete
+        return posts[end - per_page:end], has_next
+
+    def add(self, post: Post) -> None:
+        """
+        Добавляет только что опубликованный пост в начало кэшированной ленты.
+        """
+        cached = CachedPost.from_post(post)
+        with self._lock:
+            self._generation += 1
+            if self._posts is None:
+                return
+            self._version = max(self._version, post.id)
+            posts = [cached] + self._posts
+            if len(posts) > self.size:
+                posts = posts[:self.size]
+                self._complete = False
+            self._posts = posts
+
+    def update_author(self, user: User) -> None:
+        """
+        Обновляет снимок автора во всех кэшированных постах после изменения профиля.
+        """
+        author = CachedAuthor(id=user.id, username=user.username, email=user.email)
+        with self._lock:
+            self._generation += 1
+            if self._posts is not None:
+                self._posts = [replace(post, author=author) if post.author.id == user.id else post
+                               for post in self._posts]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._posts = None
+
+    def _snapshot(self, version: int) -> Optional[Tuple[List[CachedPost], bool]]:
+        with self._lock:
+            if self._posts is not None and self._expires > monotonic() and self._version >= version:
+                self.hits += 1
+                return self._posts, self._complete
+            leader = self._loading is None
+            if leader:
+                self._loading = Event()
+            loading = self._loading
+            generation = self._generation
+
+        if not leader:
+            loading.wait(self.wait_timeout)
+            with self._lock:
+                if self._posts is None or self._version < version:
+                    return None
+                return self._posts, self._complete
+
+        try:
+            posts, complete = self._query()
+            with self._lock:
+                self.loads += 1
+                # Если во время загрузки был опубликован пост, снимок мог его пропустить.
+                if generation == self._generation:
+                    self._posts, self._complete = posts, complete
+                    # Запрос выполнен после чтения version, поэтому снимок не старше ее.
+                    self._version = max([version] + [post.id for post in posts])
+                    self._expires = monotonic() + self.ttl
+            return posts, complete
+        finally:
+            with self._lock:
+                self._loading = None
+            loading.set()
+
+    def _query(self) -> Tuple[List[CachedPost], bool]:
+        """
+        Загружает из базы данных size последних постов, выбирая только нужные столбцы.
+        """
+        if current_app.extensions['shards'] is not None:
+            # Последние посты со всех шардов; авторы дочитываются из основной базы данных.
+            rows = [(row.id, row.body, row.timestamp, row.language, row.user_id, row.username, row.email)
+                    for row in with_authors(newest_rows(limit=self.size + 1))]
+        else:
+            rows = self._query_rows()
+        posts = [CachedPost(id=row[0], body=row[1], timestamp=row[2], language=row[3],
+                            author=CachedAuthor(id=row[4], username=row[5], email=row[6]))
+                 for row in rows[:self.size]]
+        return posts, len(rows) <= self.size
+
+    def _query_rows(self) -> list:
+        query = (
+            sa.select(Post.id, Post.body, Post.timestamp, Post.language,
+                      User.id, User.username, User.email)
+            .join(Post.author)
+            .order_by(Post.timestamp.desc())
+            .limit(self.size + 1)
+        )
+        return db.session.execute(query).all()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from hashlib import md5
+
+# Библиотеки третьей стороны
+from flask import current_app, g, render_template
+from markupsafe import Markup
+
+
+def author_version(user) -> str:
+    """
+    Возвращает короткую версию профиля автора для ключа кэша фрагментов.
+
+    Версия вычисляется из полей профиля, которые попадают в разметку поста (имя пользователя
+    и email для аватара), поэтому любое изменение профиля автоматически меняет ключ.
+
+    Args:
+        user (User): Автор поста.
+
+    Returns:
+        str: Шестнадцатеричная строка версии.
+    """
+    return md5(f'{user.username}\0{user.email}'.encode('utf-8')).hexdigest()[:12]
+
+
+def render_post(post) -> Markup:
+    """
+    Отрисовывает шаблон '_post.html' для поста, используя кэш фрагментов приложения.
+
+    Ключ кэша: (тип записи, id, язык интерфейса, версия автора). HTML поста после создания
+    не меняется, а время публикации отрисовывается на стороне клиента через moment.js,
+    поэтому фрагмент можно переиспользовать между запросами и пользователями.
+
+    Args:
+        post (Post | Message): Запись, которую нужно отобразить.
+
+    Returns:
+        Markup: Готовый HTML-фрагмент.
+    """
+    cache = current_app.fragment_cache
+    if cache is None:
+        return Markup(render_template('_post.html', post=post))
+    author = post.author
+    key = (post.__tablename__, post.id, g.get('locale'), author.id, author_version(author))
+    return cache.get_or_set(key, lambda: Markup(render_template('_post.html', post=post)))
+
+
+def invalidate_author(user) -> int:
+    """
+    Удаляет из кэша все фрагменты постов указанного автора.
+
+    Args:
+        user (User): Автор, профиль которого изменился.
+
+    Returns:
+        int: Количество удаленных фрагментов.
+    """
+    cache = current_app.fragment_cache
+    if cache is None:
+        return 0
+    return cache.delete_where(lambda key: key[3] == user.id)
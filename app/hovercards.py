@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from typing import Dict, Iterable, List, Set
+
+# Библиотеки третьей стороны
+from flask import current_app, session, url_for
+import sqlalchemy as sa
+
+# Собственные модули
+from app import db
+from app.models import User, avatar_url, followers
+
+
+def _query_cards(usernames: List[str]) -> Dict[str, dict]:
+    """
+    Загружает карточки пользователей тремя запросами на всю пачку: профили, число подписчиков
+    и число подписок (группировкой по таблице followers).
+    """
+    users = db.session.execute(
+        sa.select(User.id, User.username, User.email, User.about_me, User.last_seen)
+        .where(User.username.in_(usernames))).all()
+    ids = [user.id for user in users]
+    if not ids:
+        return {}
+    counts = {}
+    for column, name in ((followers.c.followed_id, 'followers'), (followers.c.follower_id, 'following')):
+        for user_id, count in db.session.execute(
+                sa.select(column, sa.func.count()).where(column.in_(ids)).group_by(column)):
+            counts[(user_id, name)] = count
+    return {user.username: {
+        'id': user.id,
+        'username': user.username,
+        'url': url_for('main.user', username=user.username),
+        'avatar': avatar_url(user.email, 64),
+        'about_me': user.about_me,
+        'last_seen': user.last_seen.replace(tzinfo=None).isoformat() + 'Z' if user.last_seen else None,
+        'followers': counts.get((user.id, 'followers'), 0),
+        'following': counts.get((user.id, 'following'), 0),
+        'follow_url': url_for('main.follow', username=user.username),
+        'unfollow_url': url_for('main.unfollow', username=user.username),
+    } for user in users}
+
+
+def get_cards(usernames: Iterable[str]) -> Dict[str, dict]:
+    """
+    Возвращает общие для всех зрителей данные карточек пользователей по именам.
+
+    Карточки хранятся в кэше приложения app.hover_cards с коротким TTL (HOVER_CARD_TTL);
+    отсутствующие в кэше загружаются одной пачкой. Несуществующие имена пропускаются.
+
+    Args:
+        usernames (Iterable[str]): Имена пользователей.
+
+    Returns:
+        Dict[str, dict]: Карточки по именам пользователей.
+    """
+    usernames = list(dict.fromkeys(usernames))
+    cache = current_app.hover_cards
+    if cache is None:
+        return _query_cards(usernames)
+    cards, missing = {}, []
+    for username in usernames:
+        card = cache.get(username)
+        if card is None:
+            missing.append(username)
+        else:
+            cards[username] = card
+    if missing:
+        loaded = _query_cards(missing)
+        for username, card in loaded.items():
+            cache.set(username, card)
+        cards.update(loaded)
+    return cards
+
+
+def followed_ids(follower_id: int, user_ids: Iterable[int]) -> Set[int]:
+    """
+    Возвращает id тех пользователей из user_ids, на которых подписан follower_id (один запрос).
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+    return set(db.session.scalars(
+        sa.select(followers.c.followed_id)
+        .where(followers.c.follower_id == follower_id, followers.c.followed_id.in_(user_ids))))
+
+
+def invalidate_cards(*usernames: str) -> None:
+    """
+    Удаляет карточки пользователей из кэша (после подписки или изменения профиля).
+    """
+    cache = current_app.hover_cards
+    if cache is not None:
+        for username in usernames:
+            cache.delete(username)
+
+
+def follow_changed(follower: User, followed: User) -> None:
+    """
+    Сбрасывает карточки обоих пользователей и меняет версию подписок в сессии: страницы
+    запросят карточки по новому URL, а не возьмут из кэша браузера ответ со старым состоянием.
+    """
+    invalidate_cards(follower.username, followed.username)
+    session['follow_version'] = session.get('follow_version', 0) + 1
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+import atexit
+import copy
+from datetime import datetime, timezone
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, SMTPHandler
+import os
+from queue import SimpleQueue
+import re
+import sys
+from time import monotonic, perf_counter
+from typing import Dict, Optional, Tuple
+import uuid
+
+# Библиотеки третьей стороны
+from flask import Flask, current_app, g, has_request_context, request
+from flask.logging import default_handler
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Идентификатор запроса от прокси принимается, только если он похож на идентификатор.
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Добавляет к записи лога идентификатор, маршрут и время от начала текущего запроса.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+            record.endpoint = request.endpoint
+            started = g.get('log_started')
+            if started is not None and not hasattr(record, 'duration_ms'):
+                record.elapsed_ms = round((perf_counter() - started) * 1000, 3)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирует запись лога одной строкой JSON.
+    """
+
+    FIELDS = ('request_id', 'method', 'path', 'endpoint', 'status', 'duration_ms', 'elapsed_ms')
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'source': f'{record.pathname}:{record.lineno}',
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class QueueingHandler(QueueHandler):
+    """
+    QueueHandler, сохраняющий трассировку исключения отдельно от сообщения.
+
+    Стандартный prepare() форматирует запись целиком и дописывает трассировку в сообщение;
+    здесь в потоке запроса только подставляются аргументы сообщения и трассировка переводится
+    в текст (объект исключения с кадрами стека нельзя передавать в другой поток),
+    а форматирование выполняют обработчики в потоке QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
+class RateLimitedSMTPHandler(SMTPHandler):
+    """
+    SMTPHandler, отправляющий не больше одного письма за interval секунд на место ошибки.
+
+    Ошибки из одной строки кода, случившиеся в течение интервала, не отправляются, а
+    подсчитываются; их количество указывается в следующем письме об этой ошибке.
+    """
+
+    def __init__(self, *args, interval: float = 300.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.interval = interval
+        self._sent: Dict[Tuple[str, int], float] = {}
+        self._suppressed: Dict[Tuple[str, int], int] = {}
+
+    def emit(self, record: logging.LogRecord) -> None:
+        key = (record.pathname, record.lineno)
+        now = monotonic()
+        last = self._sent.get(key)
+        if last is not None and now - last < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return
+        self._sent[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record = copy.copy(record)
+            record.msg = f'{record.getMessage()}\n\n({suppressed} more in the last {self.interval:g} s not sent)'
+            record.args = None
+        super().emit(record)
+
+
+def _start_request() -> None:
+    request_id = request.headers.get(REQUEST_ID_HEADER, '')
+    g.request_id = request_id if _REQUEST_ID.match(request_id) else uuid.uuid4().hex
+    g.log_started = perf_counter()
+
+
+def _finish_request(response):
+    request_id = g.get('request_id')
+    if request_id is None:
+        return response
+    response.headers[REQUEST_ID_HEADER] = request_id
+    if current_app.config.get('LOG_REQUESTS', True):
+        duration = round((perf_counter() - g.log_started) * 1000, 3)
+        current_app.logger.info('%s %s %s', request.method, request.full_path.rstrip('?'),
+                                response.status_code,
+                                extra={'status': response.status_code, 'duration_ms': duration})
+    return response
+
+
+def init_request_logging(app: Flask) -> None:
+    """
+    Присваивает каждому запросу идентификатор (заголовок X-Request-ID) и пишет строку лога
+    о каждом ответе со статусом и временем обработки (LOG_REQUESTS, по умолчанию True).
+    """
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def start_logging(app: Flask) -> QueueListener:
+    """
+    Подключает к app.logger неблокирующий конвейер логирования.
+
+    Поток запроса только кладет запись в очередь (QueueingHandler); запись в файл и отправку
+    писем об ошибках выполняет поток QueueListener. Файл пишется строками JSON и ротируется
+    по LOG_MAX_BYTES; при нескольких рабочих процессах лучше LOG_TO_STDOUT = True (ротация
+    одного файла из нескольких процессов ненадежна).
+
+    Конфигурация:
+        LOG_TO_STDOUT (bool): Писать в стандартный вывод вместо файла, по умолчанию False.
+        LOG_FILE (str): Путь к файлу лога, по умолчанию 'logs/microblog.log'.
+        LOG_MAX_BYTES (int): Размер файла, при котором он ротируется, по умолчанию 10 МБ.
+        LOG_BACKUP_COUNT (int): Количество хранимых старых файлов, по умолчанию 10.
+        ERROR_EMAIL_INTERVAL (float): Не чаще одного письма на место ошибки за этот интервал,
+            по умолчанию 300 секунд.
+
+    Returns:
+        QueueListener: Запущенный слушатель (также в app.extensions['log_listener']).
+    """
+    formatter = JsonFormatter()
+    if app.config.get('LOG_TO_STDOUT'):
+        output = logging.StreamHandler(sys.stdout)
+    else:
+        path = app.config.get('LOG_FILE', 'logs/microblog.log')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        output = RotatingFileHandler(path, maxBytes=app.config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+                                     backupCount=app.config.get('LOG_BACKUP_COUNT', 10),
+                                     encoding='utf-8')
+    output.setFormatter(formatter)
+    output.setLevel(logging.INFO)
+    handlers = [output]
+
+    if app.config.get('MAIL_SERVER'):
+        auth = None
+        if app.config.get('MAIL_USERNAME') or app.config.get('MAIL_PASSWORD'):
+            auth = (app.config['MAIL_USERNAME'], app.config['MAIL_PASSWORD'])
+        secure = () if app.config.get('MAIL_USE_TLS') else None
+        mail_handler = RateLimitedSMTPHandler(
+            mailhost=(app.config['MAIL_SERVER'], app.config['MAIL_PORT']),
+            fromaddr='no-reply@' + app.config['MAIL_SERVER'],
+            toaddrs=app.config['ADMINS'],
+            subject='Microblog Failure',
+            credentials=auth,
+            secure=secure,
+            interval=app.config.get('ERROR_EMAIL_INTERVAL', 300.0))
+        mail_handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s [%(request_id)s %(method)s %(path)s]: %(message)s',
+            defaults={'request_id': '-', 'method': '-', 'path': '-'}))
+        mail_handler.setLevel(logging.ERROR)
+        handlers.append(mail_handler)
+
+    queue = SimpleQueue()
+    queue_handler = QueueingHandler(queue)
+    queue_handler.addFilter(RequestContextFilter())
+    # Обработчик Flask по умолчанию пишет в stderr синхронно, из потока запроса.
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(queue_handler)
+    app.logger.setLevel(logging.INFO)
+    listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    listener.start()
+    app.extensions['log_listener'] = listener
+    # Записи, оставшиеся в очереди, дописываются при завершении процесса.
+    atexit.register(stop_logging, app)
+    return listener
+
+
+def stop_logging(app: Flask) -> None:
+    """
+    Дописывает записи из очереди и останавливает поток QueueListener.
+    """
+    listener = app.extensions.pop('log_listener', None)
+    if listener is not None:
+        listener.stop()
+
+
+def restart_after_fork(app: Flask) -> Optional[QueueListener]:
+    """
+    Запускает в процессе-потомке новый поток QueueListener с новой очередью.
+
+    Потоки не переживают fork(), поэтому без перезапуска записи воркера копились бы в очереди,
+    которую никто не читает.
+    """
+    listener = app.extensions.get('log_listener')
+    if listener is None:
+        return None
+    queue = SimpleQueue()
+    for handler in app.logger.handlers:
+        if isinstance(handler, QueueingHandler):
+            handler.queue = queue
+    listener = QueueListener(queue, *listener.handlers,
+                             respect_handler_level=listener.respect_handler_level)
+    listener.start()
+    app.extensions['log_listener'] = listener
+    return listener
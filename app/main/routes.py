@@ -1,23 +1,26 @@
 # -*- coding: utf-8 -*-
 
 # Стандартные библиотеки Python
+import json
 from typing import Union
 from datetime import datetime, timezone
 
 # Библиотеки третьей стороны
-from flask import current_app, flash, g, redirect, render_template, Response, request, url_for
+from flask import current_app, flash, g, redirect, render_template, Response, request, session, url_for
 from flask_babel import gettext as _, get_locale
 from flask_login import current_user, login_required
-from langdetect import detect, LangDetectException
 import sqlalchemy as sa
 
 # Собственные модули
 from werkzeug import Response
 
-from app import db
+from app import db, sharding, tags
+from app.conditional import not_modified, weak_etag, with_validators
+from app.fragments import invalidate_author
+from app.hovercards import follow_changed, followed_ids, get_cards, invalidate_cards
 from app.main import bp
 from app.main.forms import EditProfileForm, EmptyForm, PostForm, SearchForm, MessageForm
-from app.models import User, Post, Message, Notification
+from app.models import User, Post, PostArchive, PostMention, PostTag, Message, Conversation, Notification
 
 
 @bp.before_request
@@ -57,20 +60,31 @@ def index() -> Union[str, 'Response']:
     """
     form = PostForm()
     if form.validate_on_submit():
+        # langdetect импортируется лениво: он нужен только при публикации поста.
+        from langdetect import detect, LangDetectException
         try:
             language = detect(form.post.data)
         except LangDetectException:
             language = ''
         post = Post(body=form.post.data, author=current_user, language=language)
         db.session.add(post)
+        db.session.flush()
+        tags.index_post(post)
         db.session.commit()
+        if current_app.explore_cache is not None:
+            current_app.explore_cache.add(post)
         flash(_('Ваш пост опубликован.'))
         return redirect(url_for('main.index'))
 
     page = request.args.get('page', 1, type=int)
-    posts = db.paginate(current_user.following_posts(), page=page,
-                        per_page=current_app.config['POSTS_PER_PAGE'],
-                        error_out=False)
+    if current_app.extensions['shards'] is not None:
+        # Посты авторов ленты лежат на разных шардах: страница собирается слиянием ответов шардов.
+        posts = sharding.paginate_newest(sharding.timeline_user_ids(current_user.id), page,
+                                         current_app.config['POSTS_PER_PAGE'])
+    else:
+        posts = db.paginate(current_user.following_posts(), page=page,
+                            per_page=current_app.config['POSTS_PER_PAGE'],
+                            error_out=False)
     next_url = url_for('main.index', page=posts.next_num) if posts.has_next else None
     prev_url = url_for('main.index', page=posts.prev_num) if posts.has_prev else None
 
@@ -80,7 +94,7 @@ def index() -> Union[str, 'Response']:
 
 @bp.route('/explore')
 @login_required
-def explore() -> str:
+def explore() -> Union[str, Response]:
     """
     Маршрут для страницы "Поиск".
 
@@ -90,22 +104,47 @@ def explore() -> str:
     Notes:
         - Этот маршрут доступен только для авторизованных пользователей (пользователей, которые вошли в систему).
         - Список постов на странице "Поиск" также пагинируется, и пользователь может переключаться между страницами.
+        - ETag строится из максимального id/времени поста, версии подписок в сессии и маркера
+          уведомлений пользователя и проверяется до выполнения запроса страницы; при совпадении
+          возвращается 304.
+        - Первые страницы отдаются из общего кэша новых постов (app.explore_cache).
 
     """
     page = request.args.get('page', 1, type=int)
-    query = sa.select(Post).order_by(Post.timestamp.desc())
-    posts = db.paginate(query, page=page,
-                        per_page=current_app.config['POSTS_PER_PAGE'],
-                        error_out=False)
-    next_url = url_for('main.explore', page=posts.next_num) if posts.has_next else None
-    prev_url = url_for('main.explore', page=posts.prev_num) if posts.has_prev else None
-    return render_template('index.html', title=_('Обзор'),
-                           posts=posts.items, next_url=next_url, prev_url=prev_url)
+    newest_id, newest_at = Post.version()
+    # Версия подписок в сессии (follow_changed) входит в URL карточек пользователей на странице.
+    etag = weak_etag('explore', current_user.id, g.locale, page, newest_id, newest_at,
+                     session.get('follow_version', 0), current_user.notification_watermark())
+    response = not_modified(etag, newest_at)
+    if response is not None:
+        return response
+
+    # Первые страницы ленты одинаковы для всех пользователей и берутся из общего кэша.
+    per_page = current_app.config['POSTS_PER_PAGE']
+    # Снимок должен содержать пост newest_id, иначе под новым ETag отдалась бы устаревшая страница.
+    cached = current_app.explore_cache.page(page, per_page, newest_id) \
+        if current_app.explore_cache is not None else None
+    if cached is not None:
+        items, has_next = cached
+        next_url = url_for('main.explore', page=page + 1) if has_next else None
+        prev_url = url_for('main.explore', page=page - 1) if page > 1 else None
+    else:
+        if current_app.extensions['shards'] is not None:
+            posts = sharding.paginate_newest(None, page, per_page)
+        else:
+            query = sa.select(Post).order_by(Post.timestamp.desc())
+            posts = db.paginate(query, page=page, per_page=per_page, error_out=False)
+        items = posts.items
+        next_url = url_for('main.explore', page=posts.next_num) if posts.has_next else None
+        prev_url = url_for('main.explore', page=posts.prev_num) if posts.has_prev else None
+    return with_validators(render_template('index.html', title=_('Обзор'),
+                                           posts=items, next_url=next_url, prev_url=prev_url),
+                           etag, newest_at)
 
 
 @bp.route('/user/<username>')
 @login_required
-def user(username: str) -> str:
+def user(username: str) -> Union[str, Response]:
     """
     Обработчик маршрута для отображения профиля пользователя и его постов.
 
@@ -119,21 +158,86 @@ def user(username: str) -> str:
         - Этот маршрут доступен только для авторизованных пользователей (пользователей, которые вошли в систему).
         - Пользователь, чьей страницей является профиль, и его посты отображаются на странице.
         - Список постов на странице профиля пагинируется, и пользователь может переключаться между страницами.
+        - Строки post_archive читаются, только если страница выходит за пределы горячих постов пользователя.
+        - ETag строится из полей и версии профиля, последнего поста пользователя, версии профиля
+          и подписок в сессии читателя, маркера уведомлений и рекомендаций читателя; при совпадении возвращается 304
+          без запроса постов и подсчетов подписок.
+        - Боковая панель "на кого подписаться" читается одним запросом из предрасчитанной таблицы.
 
     Raises:
         404 Not Found: Если пользователь с указанным именем не найден.
     """
     user = db.first_or_404(sa.select(User).where(User.username == username))
     page = request.args.get('page', 1, type=int)
+    suggestions = current_user.suggested_users()
+    # Свой last_seen обновляется в before_request на каждом запросе, поэтому в ETag своего профиля
+    # он не входит. Подписки и архивирование учитываются версиями профиля (User.profile_version):
+    # пользователя страницы - счетчики и архив, читателя - состояние кнопки подписки.
+    last_seen = None if user == current_user else user.last_seen
+    etag = weak_etag('user', current_user.id, g.locale, page, user.id, user.username, user.email,
+                     user.about_me, last_seen, user.profile_version, current_user.profile_version,
+                     session.get('follow_version', 0), Post.version(user.id),
+                     current_user.notification_watermark(),
+                     [(u.id, u.username, u.email) for u in suggestions])
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    per_page = current_app.config['POSTS_PER_PAGE']
     query = user.posts.select().order_by(Post.timestamp.desc())
-    posts = db.paginate(query, page=page,
-                        per_page=current_app.config['POSTS_PER_PAGE'],
-                        error_out=False)
-    next_url = url_for('main.user', username=user.username, page=posts.next_num) if posts.has_next else None
-    prev_url = url_for('main.user', username=user.username, page=posts.prev_num) if posts.has_prev else None
+    with sharding.on_shard(user.id):
+        posts = db.paginate(query, page=page, per_page=per_page, error_out=False)
+    items, has_next = posts.items, posts.has_next
+    if page * per_page > posts.total:
+        # Страница выходит за пределы горячих постов: дополняем ее из архива.
+        limit = per_page - len(items)
+        offset = max(0, (page - 1) * per_page - posts.total)
+        archived = db.session.scalars(
+            user.archived_posts.select().order_by(PostArchive.timestamp.desc())
+            .offset(offset).limit(limit + 1)).all()
+        items, has_next = items + archived[:limit], len(archived) > limit
+    elif not has_next:
+        # Последняя горячая страница заполнена целиком: следующая есть, если у пользователя есть архив.
+        has_next = db.session.scalar(sa.select(sa.exists().where(PostArchive.user_id == user.id)))
+    next_url = url_for('main.user', username=user.username, page=page + 1) if has_next else None
+    prev_url = url_for('main.user', username=user.username, page=page - 1) if page > 1 else None
     form = EmptyForm()
-    return render_template('user.html', user=user, posts=posts.items,
-                           next_url=next_url, prev_url=prev_url, form=form)
+    return with_validators(render_template('user.html', user=user, posts=items,
+                                           next_url=next_url, prev_url=prev_url, form=form,
+                                           suggestions=suggestions),
+                           etag)
+
+
+def _tag_page(model, key, endpoint: str, title: str, **values) -> str:
+    """
+    Страница постов с хэштегом или упоминанием с keyset-пагинацией (?before=<курсор>).
+    """
+    before = tags.decode_cursor(request.args.get('before'))
+    ids, cursor = tags.timeline(model, key, before, current_app.config['POSTS_PER_PAGE'])
+    next_url = url_for(endpoint, before=cursor, **values) if cursor else None
+    # Курсор ведет только к более старым постам; "новее" - это возврат к первой странице.
+    prev_url = url_for(endpoint, **values) if before else None
+    return render_template('index.html', title=title, posts=tags.load_posts(ids),
+                           next_url=next_url, prev_url=prev_url)
+
+
+@bp.route('/tag/<tag>')
+@login_required
+def tag(tag: str) -> str:
+    """
+    Посты с хэштегом #tag, начиная с новых.
+    """
+    return _tag_page(PostTag, tag.lower(), 'main.tag', '#' + tag.lower(), tag=tag.lower())
+
+
+@bp.route('/mentions/<username>')
+@login_required
+def mentions(username: str) -> str:
+    """
+    Посты, в которых упомянут пользователь @username, начиная с новых.
+    """
+    user = db.first_or_404(sa.select(User).where(User.username == username))
+    return _tag_page(PostMention, user.id, 'main.mentions', '@' + user.username, username=user.username)
 
 
 @bp.route('/user/<username>/popup')
@@ -144,6 +248,35 @@ def user_popup(username):
     return render_template('user_popup.html', user=user, form=form)
 
 
+@bp.route('/users/cards')
+@login_required
+def user_cards() -> Response:
+    """
+    Данные карточек пользователей для всплывающих подсказок одним запросом на страницу.
+
+    Страница передает имена всех авторов на ней (параметр u, до HOVER_CARD_BATCH имен) и номер
+    версии подписок из сессии (параметр v). Общие данные карточек берутся из кэша приложения,
+    а состояние подписки текущего пользователя - одним запросом. Ответ можно хранить в кэше
+    браузера HOVER_CARD_TTL секунд: после подписки или отписки v меняется, и страница
+    запрашивает новый URL.
+
+    Returns:
+        Response: JSON {'cards': {имя: карточка}} с заголовками ETag и Cache-Control.
+    """
+    usernames = request.args.getlist('u')[:current_app.config.get('HOVER_CARD_BATCH', 100)]
+    cards = get_cards(usernames)
+    followed = followed_ids(current_user.id, [card['id'] for card in cards.values()])
+    payload = {'cards': {username: dict(card, is_self=card['id'] == current_user.id,
+                                        is_following=card['id'] in followed)
+                         for username, card in cards.items()}}
+    response = current_app.response_class(json.dumps(payload, sort_keys=True),
+                                          mimetype='application/json')
+    response.set_etag(weak_etag(response.get_data()), weak=True)
+    response.cache_control.private = True
+    response.cache_control.max_age = int(current_app.config.get('HOVER_CARD_TTL', 30))
+    return response.make_conditional(request)
+
+
 @bp.route('/edit_profile', methods=['GET', 'POST'])
 @login_required
 def edit_profile() -> Union[str, Response]:
@@ -165,9 +298,13 @@ def edit_profile() -> Union[str, Response]:
 
     if form.validate_on_submit():
         # Сохранение изменений профиля пользователя
+        invalidate_cards(current_user.username, form.username.data)
         current_user.username = form.username.data
         current_user.about_me = form.about_me.data
         db.session.commit()
+        invalidate_author(current_user)
+        if current_app.explore_cache is not None:
+            current_app.explore_cache.update_author(current_user)
         flash(_('Ваши изменения сохранены'))
         return redirect(url_for('main.edit_profile'))
 
@@ -211,6 +348,7 @@ def follow(username: str) -> Response:
 
         current_user.follow(user)  # Вызываем метод подписки текущего пользователя на другого
         db.session.commit()  # Сохраняем изменения в базе данных
+        follow_changed(current_user, user)
         flash(_(f"Вы подписались на {username}."))
         # Перенаправляем на страницу пользователя, на которого подписались
         return redirect(url_for('main.user', username=username))
@@ -248,6 +386,7 @@ def unfollow(username: str) -> Response:
 
         current_user.unfollow(user)
         db.session.commit()
+        follow_changed(current_user, user)
         flash(_(f"Вы отписались от {username}."))
         return redirect(url_for('main.user', username=username))
     else:
@@ -266,9 +405,15 @@ def search():
     # Извлекаем номер страницы из запроса, по умолчанию равен 1
     page = request.args.get('page', 1, type=int)
 
-    # Выполняем поиск записей по заданному запросу и странице
-    posts, total = Post.search(g.search_form.q.data, page,
-                               current_app.config['POSTS_PER_PAGE'])
+    # Выполняем поиск записей по заданному запросу и странице.
+    # В асинхронном режиме (app.asgi) запрос к Elasticsearch уже выполнен шлюзом,
+    # и его результат передается через окружение WSGI.
+    results = request.environ.get('microblog.search')
+    if results is not None:
+        posts, total = Post.from_search(*results)
+    else:
+        posts, total = Post.search(g.search_form.q.data, page,
+                                   current_app.config['POSTS_PER_PAGE'])
 
     # Генерируем URL для следующей страницы, если она существует
     next_url = url_for('main.search', q=g.search_form.q.data, page=page + 1) \
@@ -292,6 +437,8 @@ def send_message(recipient):
         msg = Message(author=current_user, recipient=user,
                       body=form.message.data)
         db.session.add(msg)
+        db.session.flush()
+        Conversation.record(msg)
         user.add_notification('unread_message_count',
                               user.unread_message_count())
         db.session.commit()
@@ -307,29 +454,50 @@ def messages():
     current_user.last_message_read_time = datetime.now(timezone.utc)
     current_user.add_notification('unread_message_count', 0)
     db.session.commit()
-    page = request.args.get('page', 1, type=int)
-    query = current_user.messages_received.select().order_by(
-        Message.timestamp.desc())
-    messages = db.paginate(query, page=page,
-                           per_page=current_app.config['POSTS_PER_PAGE'],
-                           error_out=False)
-    next_url = url_for('main.messages', page=messages.next_num) \
-        if messages.has_next else None
-    prev_url = url_for('main.messages', page=messages.prev_num) \
-        if messages.has_prev else None
-    return render_template('messages.html', messages=messages.items,
-                           next_url=next_url, prev_url=prev_url)
+    before = request.args.get('before', type=int)
+    per_page = current_app.config['POSTS_PER_PAGE']
+    conversations = Conversation.inbox(current_user, before=before, limit=per_page)
+    next_url = url_for('main.messages', before=conversations[per_page - 1].last_message_id) \
+        if len(conversations) > per_page else None
+    return render_template('messages.html', conversations=conversations[:per_page],
+                           next_url=next_url)
+
+
+@bp.route('/messages/<username>')
+@login_required
+def conversation(username):
+    user = db.first_or_404(sa.select(User).where(User.username == username))
+    conversation = Conversation.between(current_user.id, user.id)
+    if conversation is None:
+        return redirect(url_for('main.send_message', recipient=username))
+    if conversation.unread_for(current_user):
+        conversation.mark_read(current_user)
+        db.session.commit()
+    before = request.args.get('before', type=int)
+    per_page = current_app.config['POSTS_PER_PAGE']
+    messages = conversation.messages(before=before, limit=per_page)
+    next_url = url_for('main.conversation', username=username, before=messages[per_page - 1].id) \
+        if len(messages) > per_page else None
+    return render_template('conversation.html', title=_('Messages'), user=user,
+                           messages=messages[:per_page], next_url=next_url)
 
 
 @bp.route('/notifications')
 @login_required
 def notifications():
     since = request.args.get('since', 0.0, type=float)
+    latest, count = current_user.notification_watermark()
+    etag = weak_etag('notifications', current_user.id, since, latest, count)
+    last_modified = datetime.fromtimestamp(latest, timezone.utc) if latest else None
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+
     query = current_user.notifications.select().where(
         Notification.timestamp > since).order_by(Notification.timestamp.asc())
     notifications = db.session.scalars(query)
-    return [{
+    return with_validators([{
         'name': n.name,
         'data': n.get_data(),
         'timestamp': n.timestamp
-    } for n in notifications]
+    } for n in notifications], etag, last_modified)
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from bisect import bisect_left
+import hmac
+from threading import Lock
+from time import perf_counter
+from typing import Dict, Optional
+
+# Библиотеки третьей стороны
+from flask import Flask, abort, current_app, g, has_request_context, request
+import sqlalchemy as sa
+from werkzeug import Response
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин в формате Prometheus (накопительные счетчики).
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Расширение, собирающее метрики запросов и SQL и отдающее их в текстовом формате Prometheus.
+
+    Для каждого HTTP-запроса считаются количество и суммарное время SQL-запросов (g.sql_queries,
+    g.sql_time); запросы дольше SLOW_QUERY_SECONDS записываются в лог вместе с маршрутом.
+
+    Конфигурация:
+        SLOW_QUERY_SECONDS (float): Порог медленного запроса, по умолчанию 0.5 секунды.
+        METRICS_ENDPOINT (bool): Регистрировать ли маршрут /metrics, по умолчанию False.
+        METRICS_TOKEN (str): Если задан, /metrics отвечает только на запросы с заголовком
+            'Authorization: Bearer <METRICS_TOKEN>'; без него маршрут нужно закрыть на прокси.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self._lock = Lock()
+        self.latency: Dict[str, Histogram] = {}
+        self.requests: Dict[tuple, int] = {}
+        self.sql_queries: Dict[str, int] = {}
+        self.sql_time: Dict[str, float] = {}
+        self.slow_queries: Dict[str, int] = {}
+        self.counters: Dict[tuple, int] = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Подключает обработчики событий движков SQLAlchemy и запросов Flask.
+
+        Должен вызываться после db.init_app(app), чтобы движки уже были созданы.
+        """
+        from app import db
+
+        app.config.setdefault('SLOW_QUERY_SECONDS', 0.5)
+        app.config.setdefault('METRICS_ENDPOINT', False)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.extensions['metrics'] = self
+        with app.app_context():
+            engines = list(db.engines.values()) + app.extensions.get('replicas', [])
+            for engine in engines:
+                sa.event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                sa.event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+                sa.event.listen(engine, 'handle_error', self._handle_error)
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        if app.config['METRICS_ENDPOINT']:
+            app.add_url_rule('/metrics', 'metrics', self.view)
+
+    @staticmethod
+    def _before_request() -> None:
+        g.request_started = perf_counter()
+        g.sql_queries = 0
+        g.sql_time = 0.0
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault('query_started', []).append(perf_counter())
+
+    @staticmethod
+    def _handle_error(context) -> None:
+        # after_cursor_execute для неудачного запроса не вызывается: снимаем его время со стека,
+        # иначе стек рос бы, а следующие запросы получали бы чужое время начала.
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started and context.statement is not None:
+            started.pop()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed = perf_counter() - conn.info['query_started'].pop()
+        if not has_request_context() or 'sql_queries' not in g:
+            return
+        g.sql_queries += 1
+        g.sql_time += elapsed
+        if elapsed >= current_app.config['SLOW_QUERY_SECONDS']:
+            endpoint = request.endpoint or 'none'
+            with self._lock:
+                self.slow_queries[endpoint] = self.slow_queries.get(endpoint, 0) + 1
+            current_app.logger.warning('Slow query (%.3f s) in %s %s [%s]: %s',
+                                       elapsed, request.method, request.path, endpoint,
+                                       ' '.join(statement.split()))
+
+    def _teardown_request(self, exc: Optional[BaseException]) -> None:
+        if 'request_started' not in g:
+            return
+        endpoint = request.endpoint or 'none'
+        elapsed = perf_counter() - g.request_started
+        with self._lock:
+            self.latency.setdefault(endpoint, Histogram()).observe(elapsed)
+            key = (endpoint, request.method)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.sql_queries[endpoint] = self.sql_queries.get(endpoint, 0) + g.sql_queries
+            self.sql_time[endpoint] = self.sql_time.get(endpoint, 0.0) + g.sql_time
+
+    def inc(self, name: str, value: int = 1, **labels: str) -> None:
+        """
+        Увеличивает произвольный счетчик name с метками labels (например, отказы контроля допуска).
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def _cache_stats(self) -> Dict[str, tuple]:
+        stats = {}
+        fragment_cache = getattr(current_app, 'fragment_cache', None)
+        if fragment_cache is not None:
+            stats['fragment'] = (fragment_cache.hits, fragment_cache.misses)
+        explore_cache = getattr(current_app, 'explore_cache', None)
+        if explore_cache is not None:
+            stats['explore'] = (explore_cache.hits, explore_cache.loads)
+        return stats
+
+    def render(self) -> str:
+        """
+        Возвращает все метрики в текстовом формате экспозиции Prometheus.
+        """
+        lines = [
+            '# HELP microblog_request_duration_seconds Request latency by endpoint.',
+            '# TYPE microblog_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            for endpoint, histogram in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'microblog_request_duration_seconds_bucket'
+                                 f'{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'microblog_request_duration_seconds_bucket'
+                             f'{{endpoint="{endpoint}",le="+Inf"}} {histogram.count}')
+                lines.append(f'microblog_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram.sum}')
+                lines.append(f'microblog_request_duration_seconds_count{{endpoint="{endpoint}"}} {histogram.count}')
+
+            lines += ['# HELP microblog_requests_total Requests by endpoint and method.',
+                      '# TYPE microblog_requests_total counter']
+            lines += [f'microblog_requests_total{{endpoint="{endpoint}",method="{method}"}} {count}'
+                      for (endpoint, method), count in sorted(self.requests.items())]
+
+            lines += ['# HELP microblog_sql_queries_total SQL statements executed by endpoint.',
+                      '# TYPE microblog_sql_queries_total counter']
+            lines += [f'microblog_sql_queries_total{{endpoint="{endpoint}"}} {count}'
+                      for endpoint, count in sorted(self.sql_queries.items())]
+
+            lines += ['# HELP microblog_sql_duration_seconds_total Time spent in SQL by endpoint.',
+                      '# TYPE microblog_sql_duration_seconds_total counter']
+            lines += [f'microblog_sql_duration_seconds_total{{endpoint="{endpoint}"}} {seconds}'
+                      for endpoint, seconds in sorted(self.sql_time.items())]
+
+            lines += ['# HELP microblog_slow_queries_total Slow SQL statements by endpoint.',
+                      '# TYPE microblog_slow_queries_total counter']
+            lines += [f'microblog_slow_queries_total{{endpoint="{endpoint}"}} {count}'
+                      for endpoint, count in sorted(self.slow_queries.items())]
+
+            names = set()
+            for (name, labels), count in sorted(self.counters.items()):
+                if name not in names:
+                    names.add(name)
+                    lines.append(f'# TYPE {name} counter')
+                label_text = ','.join(f'{label}="{value}"' for label, value in labels)
+                lines.append(f'{name}{{{label_text}}} {count}')
+
+        cache_stats = sorted(self._cache_stats().items())
+        lines += ['# HELP microblog_cache_hits_total Cache hits by cache.',
+                  '# TYPE microblog_cache_hits_total counter']
+        lines += [f'microblog_cache_hits_total{{cache="{cache}"}} {hits}'
+                  for cache, (hits, misses) in cache_stats]
+        lines += ['# HELP microblog_cache_misses_total Cache misses by cache.',
+                  '# TYPE microblog_cache_misses_total counter']
+        lines += [f'microblog_cache_misses_total{{cache="{cache}"}} {misses}'
+                  for cache, (hits, misses) in cache_stats]
+        return '\n'.join(lines) + '\n'
+
+    def view(self) -> Response:
+        token = current_app.config['METRICS_TOKEN']
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
@@ -4,11 +4,11 @@
 from datetime import datetime, timezone
 import json
 from time import time
-from typing import Union, Optional
+from typing import Iterable, Union, Optional
 
 # Библиотеки третьей стороны
 import jwt
-from flask import current_app
+from flask import current_app, url_for
 from flask_login import UserMixin
 from hashlib import md5
 import sqlalchemy as sa
@@ -20,13 +20,50 @@ from app import db, login
 from app.search import add_to_index, remove_from_index, query_index
 
 
+def email_digest(email: str) -> str:
+    """
+    Хеш MD5 адреса электронной почты в нижнем регистре (как в URL Gravatar).
+    """
+    return md5(email.lower().encode('utf-8')).hexdigest()
+
+
+def avatar_url(email: str, size: int, external: bool = False) -> str:
+    """
+    Генерирует URL аватара для адреса электронной почты.
+
+    По умолчанию аватар - identicon, отрисованный самим приложением (маршрут avatars.avatar);
+    при AVATAR_PROVIDER = 'gravatar' - URL сервиса Gravatar.
+
+    Args:
+        email (str): Адрес электронной почты пользователя.
+        size (int): Размер аватара в пикселях (один из AVATAR_SIZES).
+        external (bool): Абсолютный URL (для ответов API).
+
+    Returns:
+        str: URL аватара.
+    """
+    digest = email_digest(email)
+    if current_app.config.get('AVATAR_PROVIDER', 'local') == 'gravatar':
+        return f'https://www.gravatar.com/avatar/{digest}?d=identicon&s={size}'
+    return url_for('avatars.avatar', digest=digest, size=size, _external=external)
+
+
+def _email_hash_default(context) -> str:
+    return email_digest(context.get_current_parameters()['email'])
+
+
 class SearchableMixin:
     @classmethod
     def search(cls, expression, page, per_page):
         # Выполняем поиск по индексу
         ids, total = query_index(cls.__tablename__, expression, page, per_page)
-        if total == 0:  # Если результаты не найдены
-            return [], 0  # Возвращаем пустой список и ноль
+        return cls.from_search(ids, total)
+
+    @classmethod
+    def from_search(cls, ids, total):
+        # Загружает объекты по id из результатов поиска (синхронного или асинхронного)
+        if total == 0 or not ids:  # Если результаты не найдены
+            return [], total  # Возвращаем пустой список и общее количество
         when = []  # Создаем список для определения порядка результатов
         for i in range(len(ids)):
             when.append((ids[i], i))  # Добавляем идентификаторы и их порядковый номер в список when
@@ -78,10 +115,39 @@ followers = sa.Table(
     sa.Column('follower_id', sa.Integer, sa.ForeignKey('user.id'),
               primary_key=True),
     sa.Column('followed_id', sa.Integer, sa.ForeignKey('user.id'),
-              primary_key=True)
+              primary_key=True),
+    # Обратный индекс для выборки подписчиков пользователя (первичный ключ начинается с follower_id).
+    sa.Index('ix_followers_followed_id_follower_id', 'followed_id', 'follower_id')
 )
 
 
+def _insert_ignore(table: sa.Table) -> sa.Insert:
+    """
+    Возвращает INSERT, который пропускает строки с уже существующим первичным ключом.
+
+    Конструкция зависит от диалекта: ON CONFLICT DO NOTHING в SQLite и PostgreSQL,
+    INSERT IGNORE в MySQL.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    return sa.insert(table).prefix_with('IGNORE')
+
+
+def bump_profile_version(user_ids: Iterable[int]) -> None:
+    """
+    Увеличивает версию профиля пользователей (User.profile_version) одним запросом UPDATE.
+    """
+    user_ids = list(set(user_ids))
+    if user_ids:
+        db.session.execute(sa.update(User).where(User.id.in_(user_ids))
+                           .values(profile_version=User.profile_version + 1))
+
+
 class User(UserMixin, db.Model):
     """
     Модель пользователя для базы данных.
@@ -91,14 +157,23 @@ class User(UserMixin, db.Model):
                                                 unique=True)
     email: so.Mapped[str] = so.mapped_column(sa.String(120), index=True,
                                              unique=True)
+    # Хеш адреса для аватара: по нему маршрут аватаров проверяет, что хеш принадлежит пользователю.
+    # Значение по умолчанию заполняет и массовые вставки через таблицу (bench seed, импорт).
+    email_hash: so.Mapped[Optional[str]] = so.mapped_column(sa.String(32), index=True,
+                                                            default=_email_hash_default)
     password_hash: so.Mapped[Optional[str]] = so.mapped_column(sa.String(256))
     about_me: so.Mapped[Optional[str]] = so.mapped_column(sa.String(140))
     last_seen: so.Mapped[Optional[datetime]] = so.mapped_column(
         default=lambda: datetime.now(timezone.utc))
     last_message_read_time: so.Mapped[Optional[datetime]]
+    # Версия данных профиля, которых нет в строке user: подписки пользователя и на него, архив постов.
+    # Входит в ETag страницы профиля вместо подсчетов по таблицам followers и post_archive.
+    profile_version: so.Mapped[int] = so.mapped_column(default=0, server_default='0')
 
     posts: so.WriteOnlyMapped['Post'] = so.relationship(
         back_populates='author')
+    archived_posts: so.WriteOnlyMapped['PostArchive'] = so.relationship(
+        back_populates='author')
     following: so.WriteOnlyMapped['User'] = so.relationship(
         secondary=followers, primaryjoin=(followers.c.follower_id == id),
         secondaryjoin=(followers.c.followed_id == id),
@@ -132,9 +207,14 @@ class User(UserMixin, db.Model):
         """
         return check_password_hash(self.password_hash, password)
 
+    @so.validates('email')
+    def _update_email_hash(self, key: str, email: str) -> str:
+        self.email_hash = email_digest(email) if email else None
+        return email
+
     def avatar(self, size: int) -> str:
         """
-        Генерирует URL аватара пользователя на основе Gravatar.
+        Генерирует URL аватара пользователя (см. avatar_url()).
 
         Args:
             size (int): Размер аватара в пикселях.
@@ -145,10 +225,9 @@ class User(UserMixin, db.Model):
         Note:
             Для генерации аватара используется хеш от адреса электронной почты пользователя (email),
             который приводится к нижнему регистру, кодируется в формате UTF-8 и хешируется с помощью MD5.
-            Полученный хеш используется в URL для получения аватара с сервиса Gravatar.
+            По полученному хешу приложение рисует identicon (или его получают с сервиса Gravatar).
         """
-        digest = md5(self.email.lower().encode('utf-8')).hexdigest()
-        return f'https://www.gravatar.com/avatar/{digest}?d=identicon&s={size}'
+        return avatar_url(self.email, size)
 
     def is_following(self, user: 'User') -> bool:
         """
@@ -163,25 +242,72 @@ class User(UserMixin, db.Model):
         query = self.following.select().where(User.id == user.id)
         return db.session.scalar(query) is not None
 
-    def follow(self, user: 'User') -> None:
+    def follow(self, user: 'User') -> bool:
         """
         Начать подписку на указанного пользователя.
 
+        Подписка выполняется одним запросом INSERT с игнорированием дубликата, поэтому повторный
+        или одновременный вызов не приводит к нарушению первичного ключа таблицы followers.
+        Новая подписка увеличивает версию профиля обоих пользователей.
+
         Args:
             user (User): Пользователь, на которого нужно подписаться.
+
+        Returns:
+            bool: True, если подписка была создана, False, если она уже существовала.
         """
-        if not self.is_following(user):
-            self.following.add(user)
+        if self.id is None or user.id is None:
+            db.session.flush()
+        result = db.session.execute(_insert_ignore(followers).values(
+            follower_id=self.id, followed_id=user.id))
+        if result.rowcount > 0:
+            bump_profile_version((self.id, user.id))
+        return result.rowcount > 0
+
+    def follow_many(self, user_ids: Iterable[int], chunk_size: int = 5000) -> int:
+        """
+        Подписаться сразу на несколько пользователей (регистрация, импорт).
+
+        Все строки записываются одним многострочным INSERT с игнорированием уже существующих
+        подписок (по одному запросу на chunk_size строк). Собственный id пропускается.
 
-    def unfollow(self, user: 'User') -> None:
+        Args:
+            user_ids (Iterable[int]): id пользователей, на которых нужно подписаться.
+            chunk_size (int): Максимальное количество строк в одном запросе.
+
+        Returns:
+            int: Количество созданных подписок.
         """
-        Прекратить подписку на указанного пользователя.
+        if self.id is None:
+            db.session.flush()
+        rows = [{'follower_id': self.id, 'followed_id': user_id}
+                for user_id in sorted(set(user_ids) - {self.id})]
+        created = 0
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            result = db.session.execute(_insert_ignore(followers).values(chunk))
+            if result.rowcount:
+                bump_profile_version([self.id] + [row['followed_id'] for row in chunk])
+            created += result.rowcount
+        return created
+
+    def unfollow(self, user: 'User') -> bool:
+        """
+        Прекратить подписку на указанного пользователя одним запросом DELETE.
+
+        Удаление подписки увеличивает версию профиля обоих пользователей.
 
         Args:
             user (User): Пользователь, от которого нужно отписаться.
+
+        Returns:
+            bool: True, если подписка была удалена, False, если ее не было.
         """
-        if self.is_following(user):
-            self.following.remove(user)
+        result = db.session.execute(followers.delete().where(
+            followers.c.follower_id == self.id, followers.c.followed_id == user.id))
+        if result.rowcount > 0:
+            bump_profile_version((self.id, user.id))
+        return result.rowcount > 0
 
     def followers_count(self):
         query = sa.select(sa.func.count()).select_from(
@@ -242,6 +368,37 @@ class User(UserMixin, db.Model):
             return
         return db.session.get(User, id)
 
+    def get_api_token(self, expires_in: int = 86400) -> str:
+        """
+        Генерирует токен доступа к API.
+
+        Токен самодостаточен (JWT), поэтому его проверка не требует запроса к базе данных.
+
+        Args:
+            expires_in (int): Время жизни токена в секундах. По умолчанию сутки.
+
+        Returns:
+            str: Токен доступа.
+        """
+        return jwt.encode({'api': self.id, 'exp': time() + expires_in},
+                          current_app.config['SECRET_KEY'], algorithm='HS256')
+
+    @staticmethod
+    def verify_api_token(token: str) -> Optional[int]:
+        """
+        Проверяет токен доступа к API.
+
+        Args:
+            token (str): Токен доступа.
+
+        Returns:
+            Optional[int]: id пользователя или None, если токен недействителен или истек.
+        """
+        try:
+            return jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])['api']
+        except Exception:
+            return None
+
     def unread_message_count(self):
         last_read_time = self.last_message_read_time or datetime(1900, 1, 1)
         query = sa.select(Message).where(Message.recipient == self,
@@ -256,6 +413,37 @@ class User(UserMixin, db.Model):
         db.session.add(n)
         return n
 
+    def suggested_users(self, limit: int = 5) -> list:
+        """
+        Возвращает рекомендованных пользователей одним запросом к предрасчитанной таблице suggestion.
+
+        Пользователи, на которых уже оформлена подписка после расчета рекомендаций, пропускаются.
+
+        Args:
+            limit (int): Максимальное количество рекомендаций.
+
+        Returns:
+            list: Пользователи в порядке убывания оценки.
+        """
+        query = (sa.select(User)
+                 .join(Suggestion, Suggestion.suggested_id == User.id)
+                 .where(Suggestion.user_id == self.id,
+                        ~sa.select(followers.c.followed_id).where(
+                            followers.c.follower_id == self.id,
+                            followers.c.followed_id == Suggestion.suggested_id).exists())
+                 .order_by(Suggestion.rank).limit(limit))
+        return db.session.scalars(query).all()
+
+    def notification_watermark(self) -> tuple:
+        """
+        Возвращает маркер версии уведомлений пользователя: время последнего уведомления и их количество.
+
+        Используется для ETag страниц, в которых отображаются счетчики из уведомлений.
+        """
+        query = sa.select(sa.func.max(Notification.timestamp), sa.func.count()).where(
+            Notification.user_id == self.id)
+        return tuple(db.session.execute(query).one())
+
 
 @login.user_loader
 def load_user(id):
@@ -267,6 +455,9 @@ class Post(SearchableMixin, db.Model):
     Модель поста для базы данных.
     """
     __searchable__ = ['body']
+    __table_args__ = (
+        sa.Index('ix_post_user_id_timestamp', 'user_id', 'timestamp'),
+    )
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     body: so.Mapped[str] = so.mapped_column(sa.String(140))
     timestamp: so.Mapped[datetime] = so.mapped_column(
@@ -280,8 +471,142 @@ class Post(SearchableMixin, db.Model):
     def __repr__(self):
         return '<Post {}>'.format(self.body)
 
+    @staticmethod
+    def version(user_id: Optional[int] = None) -> tuple:
+        """
+        Возвращает маркер версии ленты: максимальный id и время последнего поста.
+
+        Args:
+            user_id (Optional[int]): Ограничить маркер постами одного автора.
+
+        Returns:
+            tuple: (max id, max timestamp); оба значения None, если постов нет.
+
+        Note:
+            Каждый максимум читается своим подзапросом: запрос с двумя агрегатами SQLite выполняет
+            полным просмотром индекса, а одиночный max() - поиском последней записи индекса.
+        """
+        newest_id = sa.select(sa.func.max(Post.id))
+        newest_at = sa.select(sa.func.max(Post.timestamp))
+        if user_id is not None:
+            newest_id = newest_id.where(Post.user_id == user_id)
+            newest_at = newest_at.where(Post.user_id == user_id)
+        query = sa.select(newest_id.scalar_subquery(), newest_at.scalar_subquery())
+        if current_app.extensions.get('shards') is not None:
+            from app.sharding import on_shard, scatter
+            if user_id is None:
+                # Маркер глобальной ленты - максимум по всем шардам.
+                rows = [row for rows in scatter(query).values() for row in rows if row[0] is not None]
+                return (max(row[0] for row in rows), max(row[1] for row in rows)) if rows else (None, None)
+            with on_shard(user_id):
+                return tuple(db.session.execute(query).one())
+        return tuple(db.session.execute(query).one())
+
+    @classmethod
+    def from_search(cls, ids, total):
+        if ids and current_app.extensions.get('shards') is not None:
+            # Шард поста по id неизвестен: посты читаются со всех шардов.
+            from app.sharding import get_posts
+            return get_posts(ids), total
+        return super().from_search(ids, total)
+
+
+class PostIdCounter(db.Model):
+    """
+    Счетчик id постов для шардированной таблицы post.
+
+    Автоинкремент каждого шарда выдавал бы пересекающиеся id, поэтому при шардировании id постов
+    выдаются из единственной строки этой таблицы в основной базе данных (app.sharding.allocate_post_ids()).
+    Значения растут со временем, как и автоинкремент, поэтому сортировка и keyset-пагинация
+    по id работают и после слияния результатов шардов. Строку создает миграция.
+    """
+    __tablename__ = 'post_id_counter'
+    id: so.Mapped[int] = so.mapped_column(primary_key=True, autoincrement=False)
+    value: so.Mapped[int] = so.mapped_column(sa.BigInteger)
+
+
+class PostTag(db.Model):
+    """
+    Строка инвертированного индекса хэштегов: хэштег и пост, в котором он встречается.
+
+    Время поста денормализовано, поэтому лента хэштега читается диапазоном индекса
+    (tag, timestamp, post_id) без обращения к таблице post; сами посты затем загружаются по id
+    (при шардировании - с шардов, поэтому внешнего ключа на post нет).
+    """
+    __tablename__ = 'post_tag'
+    __table_args__ = (
+        sa.Index('ix_post_tag_tag_timestamp', 'tag', 'timestamp', 'post_id'),
+        sa.Index('ix_post_tag_post_id', 'post_id'),
+    )
+    tag: so.Mapped[str] = so.mapped_column(sa.String(64), primary_key=True)
+    post_id: so.Mapped[int] = so.mapped_column(primary_key=True, autoincrement=False)
+    timestamp: so.Mapped[datetime]
+
+    def __repr__(self):
+        return '<PostTag #{} {}>'.format(self.tag, self.post_id)
+
+
+class PostMention(db.Model):
+    """
+    Строка инвертированного индекса упоминаний: упомянутый пользователь и пост.
+    """
+    __tablename__ = 'post_mention'
+    __table_args__ = (
+        sa.Index('ix_post_mention_user_id_timestamp', 'user_id', 'timestamp', 'post_id'),
+        sa.Index('ix_post_mention_post_id', 'post_id'),
+    )
+    user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id), primary_key=True)
+    post_id: so.Mapped[int] = so.mapped_column(primary_key=True, autoincrement=False)
+    timestamp: so.Mapped[datetime]
+
+    def __repr__(self):
+        return '<PostMention @{} {}>'.format(self.user_id, self.post_id)
+
+
+class Suggestion(db.Model):
+    """
+    Модель рекомендации "на кого подписаться".
+
+    Строки заполняются пакетным заданием compute_suggestions() (друзья друзей по графу подписок),
+    по K строк на пользователя; rank задает порядок, поэтому чтение идет по первичному ключу.
+    """
+    user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id), primary_key=True)
+    rank: so.Mapped[int] = so.mapped_column(primary_key=True, autoincrement=False)
+    suggested_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id))
+    score: so.Mapped[float]
+
+    def __repr__(self):
+        return '<Suggestion {} -> {}>'.format(self.user_id, self.suggested_id)
+
+
+class PostArchive(db.Model):
+    """
+    Модель архивного (холодного) поста.
+
+    Посты старше горизонта архивации переносятся сюда заданием archive_posts(), чтобы таблица
+    post и ее индексы оставались небольшими. Первичный ключ совпадает с id исходного поста.
+    """
+    __tablename__ = 'post_archive'
+    __table_args__ = (
+        sa.Index('ix_post_archive_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+    id: so.Mapped[int] = so.mapped_column(primary_key=True, autoincrement=False)
+    body: so.Mapped[str] = so.mapped_column(sa.String(140))
+    timestamp: so.Mapped[datetime]
+    user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id))
+    language: so.Mapped[Optional[str]] = so.mapped_column(sa.String(5))
+
+    author: so.Mapped[User] = so.relationship(back_populates='archived_posts')
+
+    def __repr__(self):
+        return '<PostArchive {}>'.format(self.body)
+
 
 class Message(db.Model):
+    __table_args__ = (
+        sa.Index('ix_message_recipient_id_timestamp', 'recipient_id', 'timestamp'),
+        sa.Index('ix_message_conversation_id_id', 'conversation_id', 'id'),
+    )
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     sender_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id),
                                                  index=True)
@@ -290,6 +615,8 @@ class Message(db.Model):
     body: so.Mapped[str] = so.mapped_column(sa.String(140))
     timestamp: so.Mapped[datetime] = so.mapped_column(
         index=True, default=lambda: datetime.now(timezone.utc))
+    conversation_id: so.Mapped[Optional[int]] = so.mapped_column(
+        sa.ForeignKey('conversation.id'))
 
     author: so.Mapped[User] = so.relationship(
         foreign_keys='Message.sender_id',
@@ -302,7 +629,174 @@ class Message(db.Model):
         return '<Message {}>'.format(self.body)
 
 
+class Conversation(db.Model):
+    """
+    Модель переписки двух пользователей с денормализованной сводкой последнего сообщения.
+
+    Пара участников хранится упорядоченной (user_a_id <= user_b_id), поэтому на каждую пару
+    приходится одна строка. Счетчики непрочитанных ведутся отдельно для каждой стороны.
+    Список переписок пользователя и сообщения переписки читаются по индексам с keyset-пагинацией
+    по id последнего сообщения и id сообщения соответственно.
+    """
+    __table_args__ = (
+        sa.UniqueConstraint('user_a_id', 'user_b_id', name='uq_conversation_user_a_id_user_b_id'),
+        sa.Index('ix_conversation_user_a_id_last_message_id', 'user_a_id', 'last_message_id'),
+        sa.Index('ix_conversation_user_b_id_last_message_id', 'user_b_id', 'last_message_id'),
+    )
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    user_a_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id))
+    user_b_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id))
+    last_message_id: so.Mapped[Optional[int]]
+    last_sender_id: so.Mapped[Optional[int]]
+    last_body: so.Mapped[Optional[str]] = so.mapped_column(sa.String(140))
+    last_timestamp: so.Mapped[Optional[datetime]]
+    unread_a: so.Mapped[int] = so.mapped_column(default=0)
+    unread_b: so.Mapped[int] = so.mapped_column(default=0)
+
+    user_a: so.Mapped[User] = so.relationship(foreign_keys='Conversation.user_a_id')
+    user_b: so.Mapped[User] = so.relationship(foreign_keys='Conversation.user_b_id')
+
+    def __repr__(self):
+        return '<Conversation {} {}>'.format(self.user_a_id, self.user_b_id)
+
+    def other(self, user: User) -> User:
+        """
+        Возвращает собеседника указанного участника.
+        """
+        return self.user_b if user.id == self.user_a_id else self.user_a
+
+    def unread_for(self, user: User) -> int:
+        """
+        Возвращает количество непрочитанных сообщений для указанного участника.
+        """
+        return self.unread_a if user.id == self.user_a_id else self.unread_b
+
+    def mark_read(self, user: User) -> None:
+        """
+        Сбрасывает счетчик непрочитанных сообщений указанного участника.
+        """
+        if user.id == self.user_a_id:
+            self.unread_a = 0
+        if user.id == self.user_b_id:
+            self.unread_b = 0
+
+    @classmethod
+    def between(cls, user1_id: int, user2_id: int) -> Optional['Conversation']:
+        """
+        Возвращает переписку двух пользователей или None, если ее еще нет.
+        """
+        user_a_id, user_b_id = sorted((user1_id, user2_id))
+        return db.session.scalar(sa.select(cls).where(cls.user_a_id == user_a_id,
+                                                      cls.user_b_id == user_b_id))
+
+    @classmethod
+    def record(cls, message: Message, unread: bool = True) -> 'Conversation':
+        """
+        Обновляет сводку переписки после отправки сообщения, создавая переписку при необходимости.
+
+        Сообщение должно быть уже записано в сессию (flush), чтобы у него был id.
+        Счетчик непрочитанных получателя увеличивается выражением SQL, а не в Python,
+        чтобы одновременные отправки не теряли обновления.
+
+        Args:
+            message (Message): Новое сообщение.
+            unread (bool): Увеличивать ли счетчик непрочитанных получателя.
+
+        Returns:
+            Conversation: Переписка, к которой относится сообщение.
+        """
+        conversation = cls.between(message.sender_id, message.recipient_id)
+        if conversation is None:
+            user_a_id, user_b_id = sorted((message.sender_id, message.recipient_id))
+            conversation = cls(user_a_id=user_a_id, user_b_id=user_b_id, unread_a=0, unread_b=0)
+            try:
+                with db.session.begin_nested():
+                    db.session.add(conversation)
+            except sa.exc.IntegrityError:
+                # Переписку одновременно создал другой запрос.
+                conversation = cls.between(message.sender_id, message.recipient_id)
+        message.conversation_id = conversation.id
+        conversation.last_message_id = message.id
+        conversation.last_sender_id = message.sender_id
+        conversation.last_body = message.body
+        conversation.last_timestamp = message.timestamp
+        if unread:
+            if message.recipient_id == conversation.user_a_id:
+                conversation.unread_a = cls.unread_a + 1
+            else:
+                conversation.unread_b = cls.unread_b + 1
+        return conversation
+
+    @classmethod
+    def inbox(cls, user: User, before: Optional[int] = None, limit: int = 20) -> list:
+        """
+        Возвращает переписки пользователя, отсортированные по последнему сообщению (сначала новые).
+
+        Выполняются два индексных запроса (пользователь на стороне a и на стороне b),
+        результаты которых сливаются в Python. Собеседники загружаются к каждому из них
+        одним запросом selectinload (для other() без ленивой загрузки на каждую строку);
+        сам пользователь берется из identity map.
+
+        Args:
+            user (User): Участник переписок.
+            before (Optional[int]): Курсор - id последнего сообщения, после которого продолжить.
+            limit (int): Размер страницы.
+
+        Returns:
+            list: До limit + 1 переписок; лишний элемент означает наличие следующей страницы.
+        """
+        rows = {}
+        for column, other in ((cls.user_a_id, cls.user_b), (cls.user_b_id, cls.user_a)):
+            query = sa.select(cls).options(so.selectinload(other)).where(column == user.id)
+            if before is not None:
+                query = query.where(cls.last_message_id < before)
+            query = query.order_by(cls.last_message_id.desc()).limit(limit + 1)
+            for conversation in db.session.scalars(query):
+                rows[conversation.id] = conversation
+        return sorted(rows.values(), key=lambda c: c.last_message_id or 0, reverse=True)[:limit + 1]
+
+    def messages(self, before: Optional[int] = None, limit: int = 20) -> list:
+        """
+        Возвращает сообщения переписки, начиная с новых, с keyset-пагинацией по id сообщения.
+
+        Returns:
+            list: До limit + 1 сообщений; лишний элемент означает наличие следующей страницы.
+        """
+        query = sa.select(Message).where(Message.conversation_id == self.id)
+        if before is not None:
+            query = query.where(Message.id < before)
+        return db.session.scalars(query.order_by(Message.id.desc()).limit(limit + 1)).all()
+
+    @classmethod
+    def rebuild(cls, batch_size: int = 1000) -> int:
+        """
+        Заполняет переписки для сообщений, созданных до появления таблицы conversation.
+
+        Непрочитанными считаются сообщения новее last_message_read_time получателя.
+
+        Returns:
+            int: Количество обработанных сообщений.
+        """
+        processed = 0
+        while True:
+            batch = db.session.scalars(
+                sa.select(Message).where(Message.conversation_id.is_(None))
+                .order_by(Message.id).limit(batch_size)).all()
+            if not batch:
+                return processed
+            for message in batch:
+                read_time = message.recipient.last_message_read_time
+                cls.record(message, unread=read_time is None or message.timestamp > read_time)
+                db.session.flush()
+            db.session.commit()
+            processed += len(batch)
+
+
 class Notification(db.Model):
+    __table_args__ = (
+        sa.Index('ix_notification_user_id_name', 'user_id', 'name'),
+        sa.Index('ix_notification_user_id_timestamp', 'user_id', 'timestamp'),
+    )
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     name: so.Mapped[str] = so.mapped_column(sa.String(128), index=True)
     user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id),
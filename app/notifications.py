@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from time import perf_counter, time
+from typing import Dict, Optional, Tuple
+
+# Библиотеки третьей стороны
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+
+# Собственные модули
+from app import db
+from app.models import Notification
+
+# Ключ отчета для дубликатов, удаленных при уплотнении.
+DUPLICATES = '(duplicates)'
+
+
+def _delete_batches(query: sa.Select, batch_size: int) -> int:
+    """
+    Удаляет уведомления, id которых выбирает query, пачками по batch_size в отдельных транзакциях.
+    """
+    removed = 0
+    while True:
+        ids = db.session.scalars(query.limit(batch_size)).all()
+        if not ids:
+            return removed
+        db.session.execute(sa.delete(Notification).where(Notification.id.in_(ids)))
+        db.session.commit()
+        removed += len(ids)
+
+
+def prune_notifications(retention: Dict[str, float], default: Optional[float] = None,
+                        batch_size: int = 500,
+                        now: Optional[float] = None) -> Tuple[Dict[str, int], float]:
+    """
+    Удаляет просроченные уведомления и уплотняет таблицу notification.
+
+    Срок хранения задается в секундах для каждого имени уведомления; для имен, которых нет в
+    retention, используется default (None - хранить бессрочно). Кроме просроченных, удаляются
+    устаревшие дубликаты: для пары (пользователь, имя) остается только самое новое уведомление,
+    как это и предполагает User.add_notification(). Удаление идет короткими транзакциями по
+    batch_size строк, чтобы не держать блокировки на таблице, которую постоянно опрашивают клиенты.
+
+    Args:
+        retention (Dict[str, float]): Срок хранения по именам уведомлений, в секундах.
+        default (Optional[float]): Срок хранения для остальных имен.
+        batch_size (int): Количество строк, удаляемых в одной транзакции.
+        now (Optional[float]): Текущее время (time()); задается в тестах.
+
+    Returns:
+        Tuple[Dict[str, int], float]: Количество удаленных строк по именам и затраченное время в секундах.
+    """
+    started = perf_counter()
+    now = time() if now is None else now
+    removed = {}
+    names = db.session.scalars(sa.select(Notification.name).distinct()).all()
+    for name in names:
+        ttl = retention.get(name, default)
+        if ttl is None:
+            continue
+        query = sa.select(Notification.id).where(Notification.name == name,
+                                                 Notification.timestamp < now - ttl)
+        count = _delete_batches(query, batch_size)
+        if count:
+            removed[name] = count
+
+    newer = so.aliased(Notification)
+    query = sa.select(Notification.id).where(
+        sa.select(newer.id).where(newer.user_id == Notification.user_id,
+                                  newer.name == Notification.name,
+                                  newer.id > Notification.id).exists())
+    count = _delete_batches(query, batch_size)
+    if count:
+        removed[DUPLICATES] = count
+    return removed, perf_counter() - started
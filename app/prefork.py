@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+import gc
+import os
+from threading import Lock
+from typing import List, Optional
+
+# Библиотеки третьей стороны
+from flask import Flask
+
+
+class LazyElasticsearch:
+    """
+    Клиент Elasticsearch, создаваемый при первом обращении.
+
+    Импорт пакета elasticsearch занимает заметную долю времени старта, а нужен только поиску
+    и индексации. Объект проксирует атрибуты настоящего клиента и помнит процесс, в котором
+    клиент был создан: после fork() клиент создается заново, чтобы воркеры не делили сокеты
+    пула соединений родителя.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self._client = None
+        self._pid: Optional[int] = None
+        self._lock = Lock()
+
+    @property
+    def client(self):
+        client = self._client
+        if client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    from elasticsearch import Elasticsearch
+                    self._client = Elasticsearch([self.url])
+                    self._pid = os.getpid()
+                client = self._client
+        return client
+
+    def reset(self) -> None:
+        """
+        Забывает созданный клиент, не закрывая его соединения (они принадлежат родителю).
+        """
+        self._client = None
+        self._pid = None
+        # Блокировку могли держать в момент fork() в другом потоке родителя.
+        self._lock = Lock()
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+
+def init_bytecode_cache(app: Flask) -> None:
+    """
+    Подключает к окружению Jinja дисковый кэш байт-кода шаблонов (TEMPLATE_CACHE_DIR).
+
+    Без него каждый рабочий процесс при первом обращении к шаблону разбирает его исходный текст
+    и компилирует в код Python; с кэшем загружается готовый байт-код. Кэш заполняется командой
+    flask templates compile при сборке образа или первым процессом, скомпилировавшим шаблон;
+    запись привязана к контрольной сумме исходного текста, поэтому измененный шаблон
+    компилируется заново. Пустое значение TEMPLATE_CACHE_DIR отключает кэш.
+    """
+    directory = app.config.get('TEMPLATE_CACHE_DIR', 'template-cache')
+    if not directory:
+        return
+    from jinja2 import FileSystemBytecodeCache
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def compile_templates(app: Flask) -> List[str]:
+    """
+    Загружает все шаблоны приложения в окружение Jinja (и в кэш байт-кода, если он подключен).
+
+    Returns:
+        List[str]: Имена загруженных шаблонов.
+    """
+    names = app.jinja_env.list_templates(extensions=['html', 'txt'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+
+def warm_up(app: Flask) -> None:
+    """
+    Загружает в мастер-процессе то, что иначе загрузил бы первый запрос каждого воркера.
+
+    Вызывается один раз после создания приложения и до fork(): импортирует пакет elasticsearch
+    (сам клиент не создается), загружает профили языков langdetect, компилирует все шаблоны
+    Jinja (или загружает их байт-код из кэша) и замораживает сборщик мусора, чтобы его проходы в воркерах не записывали в
+    разделяемые страницы памяти и не разрушали copy-on-write.
+    """
+    if app.elasticsearch:
+        import elasticsearch  # noqa: F401
+    from langdetect.detector_factory import init_factory
+    init_factory()
+    compile_templates(app)
+    gc.freeze()
+
+
+def reinit_after_fork(app: Flask) -> None:
+    """
+    Сбрасывает унаследованные от мастер-процесса соединения и потоки; вызывается в воркере
+    после fork().
+
+    Пулы SQLAlchemy освобождаются с close=False: соединения родителя не закрываются (иначе
+    воркер оборвал бы их на стороне сервера), а просто забываются, и воркер открывает свои.
+    """
+    with app.app_context():
+        from app import db
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    for engine in app.extensions.get('replicas', []):
+        engine.dispose(close=False)
+    if isinstance(app.elasticsearch, LazyElasticsearch):
+        app.elasticsearch.reset()
+    # Поток записи лога не переживает fork(): запускаем новый.
+    from app.logs import restart_after_fork
+    restart_after_fork(app)
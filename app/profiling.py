@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+import cProfile
+from datetime import datetime, timezone
+import hmac
+import json
+import os
+import random
+from threading import Lock
+from time import perf_counter
+import tracemalloc
+from typing import List, Optional
+
+# Библиотеки третьей стороны
+from flask import Flask, current_app, g, request
+
+# tracemalloc включается на весь процесс: его запускает первый профилируемый запрос,
+# а останавливает последний из одновременных (счетчик под блокировкой).
+_tracing_lock = Lock()
+_tracing_requests = 0
+_tracing_started = False
+
+
+def _start_tracing() -> None:
+    global _tracing_requests, _tracing_started
+    with _tracing_lock:
+        if _tracing_requests == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_requests += 1
+
+
+def _stop_tracing() -> None:
+    global _tracing_requests, _tracing_started
+    with _tracing_lock:
+        _tracing_requests -= 1
+        # Трассировку, включенную не профилировщиком (PYTHONTRACEMALLOC), не выключаем.
+        if _tracing_requests == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+class Profiler:
+    """
+    Расширение для профилирования отдельных запросов в рабочем окружении.
+
+    Запрос профилируется, если в нем передан заголовок PROFILE_HEADER со значением PROFILE_TOKEN,
+    либо случайно с вероятностью PROFILE_SAMPLE_RATE. Для такого запроса сохраняются статистика
+    cProfile (файл .prof, читается модулем pstats) и top выделений памяти tracemalloc (файл .json)
+    в каталог PROFILE_DIR; хранится не более PROFILE_MAX_DUMPS последних дампов.
+
+    Note:
+        tracemalloc работает на уровне процесса, поэтому в многопоточном сервере в статистику
+        выделений памяти могут попасть параллельные запросы; трассировка выключается, когда
+        завершается последний из них.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.config.setdefault('PROFILE_DIR', 'profiles')
+        app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+        app.config.setdefault('PROFILE_HEADER', 'X-Profile')
+        app.config.setdefault('PROFILE_TOKEN', None)
+        app.config.setdefault('PROFILE_MAX_DUMPS', 50)
+        app.config.setdefault('PROFILE_TOP_ALLOCATIONS', 20)
+        if not app.config['PROFILE_TOKEN'] and not app.config['PROFILE_SAMPLE_RATE']:
+            return
+        app.before_request(self._start)
+        app.teardown_request(self._stop)
+
+    @staticmethod
+    def _requested() -> bool:
+        token = current_app.config['PROFILE_TOKEN']
+        header = request.headers.get(current_app.config['PROFILE_HEADER'])
+        if token and header and hmac.compare_digest(header, token):
+            return True
+        return random.random() < current_app.config['PROFILE_SAMPLE_RATE']
+
+    def _start(self) -> None:
+        if not self._requested():
+            return
+        _start_tracing()
+        g.profile_snapshot = tracemalloc.take_snapshot()
+        g.profile_started = perf_counter()
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # В этом потоке уже работает другой профилировщик.
+            _stop_tracing()
+            return
+        g.profiler = profiler
+
+    def _stop(self, exc: Optional[BaseException]) -> None:
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        profiler.disable()
+        elapsed = perf_counter() - g.profile_started
+        try:
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            _stop_tracing()
+        top = snapshot.compare_to(g.profile_snapshot, 'lineno')[:current_app.config['PROFILE_TOP_ALLOCATIONS']]
+
+        directory = current_app.config['PROFILE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        endpoint = request.endpoint or 'none'
+        name = '{}-{}-{}'.format(datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f'),
+                                 endpoint.replace('.', '_'), int(elapsed * 1000))
+        profiler.dump_stats(os.path.join(directory, name + '.prof'))
+        with open(os.path.join(directory, name + '.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'method': request.method,
+                'path': request.full_path,
+                'endpoint': endpoint,
+                'duration': elapsed,
+                'sql_queries': g.get('sql_queries'),
+                'allocations': [{
+                    'location': str(stat.traceback),
+                    'size_diff': stat.size_diff,
+                    'count_diff': stat.count_diff,
+                } for stat in top],
+            }, f, ensure_ascii=False, indent=2)
+        rotate_dumps(directory, current_app.config['PROFILE_MAX_DUMPS'])
+
+
+def list_dumps(directory: str) -> List[str]:
+    """
+    Возвращает имена дампов профилирования (без расширения), от старых к новым.
+    """
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len('.prof')] for name in os.listdir(directory) if name.endswith('.prof'))
+
+
+def rotate_dumps(directory: str, keep: int) -> None:
+    """
+    Удаляет самые старые дампы, оставляя не более keep последних.
+    """
+    dumps = list_dumps(directory)
+    for name in dumps[:max(len(dumps) - keep, 0)]:
+        for extension in ('.prof', '.json'):
+            path = os.path.join(directory, name + extension)
+            if os.path.exists(path):
+                os.remove(path)
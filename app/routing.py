@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from concurrent.futures import ThreadPoolExecutor
+import os
+import random
+from time import time
+from typing import Any, List, Optional
+from zlib import crc32
+
+# Библиотеки третьей стороны
+from flask import Flask, current_app, g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+import sqlalchemy as sa
+
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+STICKY_KEY = '_primary_until'
+# Таблицы, строки которых распределяются по шардам по user_id (см. ShardRouter).
+SHARDED_TABLES = frozenset(('post',))
+
+
+class RoutingSession(Session):
+    """
+    Сессия SQLAlchemy, которая отправляет чтения в безопасных запросах на реплику.
+
+    Движок реплики выбирается один раз на HTTP-запрос (g.db_replica). Запись (flush, INSERT, UPDATE,
+    DELETE и текстовые SQL-выражения) всегда выполняется на основной базе данных.
+
+    Если настроены шарды постов (POST_SHARDS), сессия также выбирает шард: при flush - по user_id
+    каждого сохраняемого поста, при выполнении запроса - по аргументу shard (bind_arguments) или
+    по шарду, выбранному в блоке app.sharding.use_shard().
+    """
+
+    def __init__(self, db, **kwargs: Any):
+        super().__init__(db, **kwargs)
+        if has_app_context() and current_app.extensions.get('shards') is not None:
+            # Выбор соединения для каждого сохраняемого объекта; ORM-вставки списком словарей
+            # (session.execute(insert(Model), rows)) при этом не поддерживаются, поэтому массовые
+            # вставки в приложении выполняются через таблицы (Model.__table__).
+            self.connection_callable = self._connection_for_instance
+
+    def get_bind(self, mapper: Any = None, clause: Any = None, bind: Any = None,
+                 shard: Optional[str] = None, **kwargs: Any):
+        if bind is None and shard is None and not self._flushing:
+            shard = self.info.get('shard')
+            # Внутри use_shard() объекты других моделей (например, автор поста) читаются как обычно.
+            if shard is not None and mapper is not None \
+                    and sa.inspect(mapper).local_table.name not in SHARDED_TABLES:
+                shard = None
+        if bind is None and shard is not None:
+            return self._db.engines[shard]
+        if bind is None and not self._flushing and isinstance(clause, sa.Select):
+            replica = g.get('db_replica') if has_request_context() else None
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _connection_for_instance(self, mapper: Any, instance: Any):
+        shard = None
+        if mapper.local_table.name in SHARDED_TABLES:
+            state = sa.inspect(instance)
+            shard = state.key[2] if state.key else state.identity_token
+            if shard is None:
+                user_id = instance.user_id if instance.user_id is not None else instance.author.id
+                shard = current_app.extensions['shards'].shard_for(user_id)
+                # Шард становится частью ключа объекта в identity map: по нему обновляются
+                # атрибуты, устаревшие после commit().
+                if not state.key:
+                    state.identity_token = shard
+        return self.connection(bind_arguments={'mapper': mapper, 'shard': shard})
+
+
+@sa.event.listens_for(RoutingSession, 'do_orm_execute')
+def _route_to_shard(orm_execute_state: Any) -> None:
+    """
+    Направляет ORM-запрос к таблице post на шард и помечает загруженные объекты ключом шарда.
+
+    Шард берется из ключа обновляемого объекта (загрузка устаревших атрибутов) или из блока
+    app.sharding.use_shard().
+    """
+    session = orm_execute_state.session
+    if session.connection_callable is None or not orm_execute_state.is_select:
+        return
+    shard = orm_execute_state.load_options._identity_token
+    mapper = orm_execute_state.bind_mapper
+    if shard is None and mapper is not None and mapper.local_table.name in SHARDED_TABLES:
+        shard = session.info.get('shard')
+    if shard is not None:
+        orm_execute_state.update_execution_options(identity_token=shard)
+        orm_execute_state.bind_arguments['shard'] = shard
+
+
+class ReplicaRouter:
+    """
+    Расширение, направляющее чтения GET/HEAD-запросов на реплики базы данных.
+
+    Конфигурация:
+        SQLALCHEMY_REPLICA_URIS (list): URI реплик; пустой список отключает маршрутизацию.
+        REPLICA_STICKY_SECONDS (float): Окно "read-your-writes" после запроса, изменяющего данные.
+            Пока оно не истекло, чтения пользователя идут на основную базу данных. Отметка
+            хранится в подписанной cookie сессии, поэтому работает во всех процессах.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Создает движки реплик и регистрирует обработчики запросов.
+
+        Движки хранятся в app.extensions['replicas'], а не в SQLALCHEMY_BINDS, чтобы db.create_all()
+        и Flask-Migrate не считали реплики отдельными базами данных.
+        """
+        uris = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+        app.extensions['replicas'] = [sa.create_engine(uri, **options) for uri in uris]
+        if not uris:
+            return
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 5.0)
+        app.before_request(self._choose_bind)
+        app.after_request(self._mark_sticky)
+
+    def _choose_bind(self) -> None:
+        if request.method in SAFE_METHODS and session.get(STICKY_KEY, 0) <= time():
+            g.db_replica = random.choice(current_app.extensions['replicas'])
+
+    def _mark_sticky(self, response):
+        if request.method not in SAFE_METHODS:
+            session[STICKY_KEY] = time() + current_app.config['REPLICA_STICKY_SECONDS']
+        return response
+
+
+class ShardMap:
+    """
+    Список шардов постов и выбор шарда по user_id.
+
+    Шард выбирается rendezvous-хешированием: для каждого ключа считается crc32('<ключ>:<user_id>'),
+    и побеждает ключ с наибольшим значением. При добавлении шарда на него переезжает примерно
+    1/N пользователей, а остальные остаются на месте (при хешировании по модулю переехали бы почти все).
+    """
+
+    def __init__(self, keys: List[str], threads: int = 8):
+        self.keys = list(keys)
+        self.threads = threads
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+
+    def shard_for(self, user_id: int, keys: Optional[List[str]] = None) -> str:
+        return max(keys or self.keys, key=lambda key: crc32(f'{key}:{user_id}'.encode()))
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """
+        Пул потоков для параллельных запросов к шардам (создается заново после fork()).
+        """
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='shard')
+            self._pid = os.getpid()
+        return self._executor
+
+
+class ShardRouter:
+    """
+    Расширение, включающее горизонтальное шардирование таблицы post по user_id.
+
+    Шарды - ключи SQLALCHEMY_BINDS; на каждом из них таблица post создается без внешних ключей
+    (app.sharding.create_shards()). Пользователи и остальные таблицы остаются в основной базе данных.
+
+    Конфигурация:
+        POST_SHARDS (list): Ключи SQLALCHEMY_BINDS шардов; пустой список отключает шардирование.
+        SHARD_THREADS (int): Количество потоков для параллельных запросов к шардам, по умолчанию 8.
+        POST_ID_BLOCK_SIZE (int): Сколько id постов процесс резервирует за одно обращение
+            к счетчику post_id_counter, по умолчанию 1 (app.sharding.PostIdBlocks).
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        keys = app.config.get('POST_SHARDS') or []
+        missing = set(keys) - set(app.config.get('SQLALCHEMY_BINDS') or {})
+        if missing:
+            raise RuntimeError('POST_SHARDS refers to unknown binds: ' + ', '.join(sorted(missing)))
+        app.extensions['shards'] = ShardMap(keys, app.config.get('SHARD_THREADS', 8)) if keys else None
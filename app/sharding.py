@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from contextlib import contextmanager
+import heapq
+from itertools import islice
+import os
+from threading import Lock
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Библиотеки третьей стороны
+from flask import current_app, has_app_context
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+
+# Собственные модули
+from app import db
+from app.models import Post, PostArchive, PostIdCounter, User, followers
+from app.routing import ShardMap
+
+# Ключ основной базы данных в db.engines (источник постов, созданных до шардирования).
+DEFAULT_BIND = None
+
+
+def shard_map() -> Optional[ShardMap]:
+    return current_app.extensions.get('shards')
+
+
+@contextmanager
+def use_shard(key: str) -> Iterator[None]:
+    """
+    Направляет запросы к таблице post внутри блока на шард key.
+
+    Запросы к другим моделям (mapper которых известен сессии) идут в основную базу данных как обычно;
+    flush внутри блока выбирает шард по каждому посту сам.
+    """
+    session = db.session()
+    previous = session.info.get('shard')
+    session.info['shard'] = key
+    try:
+        yield
+    finally:
+        session.info['shard'] = previous
+
+
+@contextmanager
+def on_shard(user_id: int) -> Iterator[None]:
+    """
+    То же, что use_shard(), для шарда постов пользователя user_id; без шардирования ничего не делает.
+    """
+    shards = shard_map()
+    if shards is None:
+        yield
+        return
+    with use_shard(shards.shard_for(user_id)):
+        yield
+
+
+def shard_metadata() -> sa.MetaData:
+    """
+    Возвращает схему таблицы post для шардов: те же столбцы и индексы, без внешних ключей
+    (таблица user находится в основной базе данных).
+    """
+    metadata = sa.MetaData()
+    source = Post.__table__
+    table = sa.Table(source.name, metadata, *[
+        sa.Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable,
+                  autoincrement=False)
+        for column in source.columns])
+    for index in source.indexes:
+        sa.Index(index.name, *[table.c[column.name] for column in index.columns])
+    return metadata
+
+
+def create_shards() -> None:
+    """
+    Создает таблицу post на всех шардах, где ее еще нет.
+    """
+    metadata = shard_metadata()
+    for key in shard_map().keys:
+        metadata.create_all(db.engines[key])
+
+
+def scatter(statements: Union[sa.Executable, Dict[str, sa.Executable]]) -> Dict[str, list]:
+    """
+    Выполняет запросы на шардах параллельно, каждый в своем соединении.
+
+    Args:
+        statements: Один запрос для всех шардов или словарь {ключ шарда: запрос}.
+
+    Returns:
+        Dict[str, list]: Строки результата по ключам шардов.
+    """
+    if not isinstance(statements, dict):
+        statements = {key: statements for key in shard_map().keys}
+    engines = db.engines
+
+    def run(key: str) -> list:
+        with engines[key].connect() as connection:
+            return connection.execute(statements[key]).all()
+
+    keys = list(statements)
+    if len(keys) <= 1:
+        return {key: run(key) for key in keys}
+    return dict(zip(keys, shard_map().executor.map(run, keys)))
+
+
+def _group_by_shard(user_ids: Optional[Iterable[int]]) -> Dict[str, Optional[List[int]]]:
+    shards = shard_map()
+    if user_ids is None:
+        return {key: None for key in shards.keys}
+    groups: Dict[str, List[int]] = {}
+    for user_id in set(user_ids):
+        groups.setdefault(shards.shard_for(user_id), []).append(user_id)
+    return groups
+
+
+def newest_rows(user_ids: Optional[Iterable[int]] = None, limit: int = 20, offset: int = 0,
+                before_id: Optional[int] = None, order: str = 'timestamp') -> list:
+    """
+    Scatter-gather самых новых постов: каждый шард отдает свои offset + limit первых строк,
+    и отсортированные списки сливаются (heapq.merge) без повторной сортировки.
+
+    Args:
+        user_ids (Optional[Iterable[int]]): Авторы постов; None - все посты. Опрашиваются
+            только шарды этих авторов.
+        limit (int): Размер страницы.
+        offset (int): Смещение страницы.
+        before_id (Optional[int]): Только посты с id меньше заданного (keyset-пагинация).
+        order (str): 'timestamp' - по времени (затем по id), 'id' - по id.
+
+    Returns:
+        list: Строки таблицы post страницы в порядке убывания.
+    """
+    table = Post.__table__
+    if order == 'timestamp':
+        columns, sort_key = (table.c.timestamp.desc(), table.c.id.desc()), lambda row: (row.timestamp, row.id)
+    else:
+        columns, sort_key = (table.c.id.desc(),), lambda row: row.id
+    statements = {}
+    for key, ids in _group_by_shard(user_ids).items():
+        query = sa.select(table)
+        if ids is not None:
+            query = query.where(table.c.user_id.in_(ids))
+        if before_id is not None:
+            query = query.where(table.c.id < before_id)
+        statements[key] = query.order_by(*columns).limit(offset + limit)
+    merged = heapq.merge(*scatter(statements).values(), key=sort_key, reverse=True)
+    return list(islice(merged, offset, offset + limit))
+
+
+def load_posts(rows: Iterable) -> List[Post]:
+    """
+    Превращает строки таблицы post, прочитанные с шардов, в объекты Post сессии без новых запросов
+    к шардам. Авторы загружаются одним запросом, поэтому post.author не выполняет SQL.
+    """
+    rows = list(rows)
+    author_ids = {row.user_id for row in rows}
+    if author_ids:
+        db.session.scalars(sa.select(User).where(User.id.in_(author_ids))).all()
+    shards = shard_map()
+    posts = []
+    for row in rows:
+        post = Post(**row._mapping)
+        sa.inspect(post).identity_token = shards.shard_for(row.user_id)
+        so.make_transient_to_detached(post)
+        posts.append(db.session.merge(post, load=False))
+    return posts
+
+
+def with_authors(rows: Iterable) -> list:
+    """
+    Дополняет строки постов полями автора (username, email) одним запросом к основной базе данных.
+    """
+    rows = list(rows)
+    authors = {}
+    if rows:
+        authors = {author.id: author for author in db.session.execute(
+            sa.select(User.id, User.username, User.email)
+            .where(User.id.in_({row.user_id for row in rows})))}
+    return [SimpleNamespace(**row._mapping, username=authors[row.user_id].username,
+                            email=authors[row.user_id].email)
+            for row in rows if row.user_id in authors]
+
+
+class ShardPage:
+    """
+    Страница постов с шардов с атрибутами flask_sqlalchemy.pagination.Pagination,
+    которые используют маршруты (items, has_next, has_prev, next_num, prev_num).
+    """
+
+    def __init__(self, items: List[Post], page: int, has_next: bool):
+        self.items = items
+        self.page = page
+        self.has_next = has_next
+        self.has_prev = page > 1
+        self.next_num = page + 1 if has_next else None
+        self.prev_num = page - 1 if self.has_prev else None
+
+
+def paginate_newest(user_ids: Optional[Iterable[int]], page: int, per_page: int) -> ShardPage:
+    """
+    Страница самых новых постов авторов user_ids (None - всех авторов) со всех шардов.
+    """
+    page = max(page, 1)
+    rows = newest_rows(user_ids, limit=per_page + 1, offset=(page - 1) * per_page)
+    return ShardPage(load_posts(rows[:per_page]), page, len(rows) > per_page)
+
+
+def timeline_user_ids(user_id: int) -> List[int]:
+    """
+    Авторы ленты пользователя: он сам и те, на кого он подписан.
+    """
+    followed = db.session.scalars(
+        sa.select(followers.c.followed_id).where(followers.c.follower_id == user_id)).all()
+    return followed + [user_id]
+
+
+def get_rows(ids: List[int]) -> list:
+    """
+    Строки постов по id со всех шардов в порядке ids; отсутствующие id пропускаются.
+    """
+    table = Post.__table__
+    found = {row.id: row for rows in scatter(sa.select(table).where(table.c.id.in_(ids))).values()
+             for row in rows}
+    return [found[post_id] for post_id in ids if post_id in found]
+
+
+def get_posts(ids: List[int]) -> List[Post]:
+    return load_posts(get_rows(ids))
+
+
+def _max_post_id(connection: sa.Connection) -> int:
+    table = Post.__table__
+    # id архивных постов тоже заняты: архив хранит их без изменений.
+    ids = [connection.scalar(sa.select(sa.func.max(table.c.id))),
+           connection.scalar(sa.select(sa.func.max(PostArchive.__table__.c.id)))]
+    ids += [rows[0][0] for rows in scatter(sa.select(sa.func.max(table.c.id))).values()]
+    return max([post_id for post_id in ids if post_id is not None], default=0)
+
+
+def allocate_post_ids(count: int) -> range:
+    """
+    Выделяет count новых id постов из счетчика post_id_counter.
+
+    Выделение выполняется короткой отдельной транзакцией на основной базе данных, а не в транзакции
+    сессии: блокировка строки счетчика снимается сразу, а не держится до фиксации поста.
+    Строку счетчика создает миграция; если ее нет (база данных создана db.create_all()), она
+    создается со значением максимального id постов (включая архив) в основной базе данных и на шардах.
+    """
+    engine = db.engines[DEFAULT_BIND]
+    counter = PostIdCounter.__table__
+    while True:
+        with engine.begin() as connection:
+            if connection.execute(sa.update(counter).where(counter.c.id == 1)
+                                  .values(value=counter.c.value + count)).rowcount:
+                last = connection.scalar(sa.select(counter.c.value).where(counter.c.id == 1))
+                return range(last - count + 1, last + 1)
+        try:
+            with engine.begin() as connection:
+                connection.execute(sa.insert(counter).values(id=1, value=_max_post_id(connection)))
+        except sa.exc.IntegrityError:
+            # Счетчик одновременно создал другой процесс: повторяем UPDATE.
+            pass
+
+
+class PostIdBlocks:
+    """
+    Выдача id постов блоками из счетчика post_id_counter (hi/lo).
+
+    Процесс резервирует сразу size id одним обращением к счетчику и раздает их новым постам без
+    запросов к базе данных; после fork() остаток блока родителя отбрасывается. При size > 1 id
+    постов разных процессов перестают строго следовать порядку публикации, поэтому по умолчанию
+    блок состоит из одного id.
+    """
+
+    def __init__(self, size: int = 1):
+        self.size = max(size, 1)
+        self._ids: Iterator[int] = iter(())
+        self._pid: Optional[int] = None
+        self._lock = Lock()
+
+    def take(self, count: int) -> List[int]:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._ids, self._pid = iter(()), os.getpid()
+            ids = list(islice(self._ids, count))
+            if len(ids) < count:
+                self._ids = iter(allocate_post_ids(max(count - len(ids), self.size)))
+                ids += islice(self._ids, count - len(ids))
+            return ids
+
+
+def post_id_blocks() -> PostIdBlocks:
+    blocks = current_app.extensions.get('post_id_blocks')
+    if blocks is None:
+        blocks = current_app.extensions['post_id_blocks'] = \
+            PostIdBlocks(current_app.config.get('POST_ID_BLOCK_SIZE', 1))
+    return blocks
+
+
+def _assign_post_ids(session: so.Session, flush_context, instances) -> None:
+    if not has_app_context() or shard_map() is None:
+        return
+    new = [obj for obj in session.new if isinstance(obj, Post) and obj.id is None]
+    if new:
+        for post, post_id in zip(new, post_id_blocks().take(len(new))):
+            post.id = post_id
+
+
+db.event.listen(db.session, 'before_flush', _assign_post_ids)
+
+
+def rebalance(batch_size: int = 1000) -> Tuple[Dict[str, int], float]:
+    """
+    Переносит посты на шарды, которым они принадлежат.
+
+    Просматриваются основная база данных (посты, созданные до включения шардирования), все шарды
+    (после изменения POST_SHARDS часть пользователей принадлежит другому шарду) и остальные базы
+    SQLALCHEMY_BINDS с таблицей post (шарды, исключенные из POST_SHARDS). Посты переносятся
+    пачками по batch_size: вставка в целевой шард, затем удаление из источника, каждая в своей
+    транзакции. Перед вставкой строки с теми же id удаляются из цели, поэтому прерванный перенос
+    можно безопасно запустить повторно. В конце счетчик id подтягивается к максимальному id.
+
+    Returns:
+        Tuple[Dict[str, int], float]: Количество перенесенных постов по направлениям
+        ('источник -> шард') и затраченное время в секундах.
+    """
+    started = perf_counter()
+    shards = shard_map()
+    create_shards()
+    table = Post.__table__
+    moved: Dict[str, int] = {}
+    retired = [key for key, engine in db.engines.items()
+               if key not in shards.keys and key != DEFAULT_BIND and sa.inspect(engine).has_table(table.name)]
+    for source in [DEFAULT_BIND] + shards.keys + retired:
+        engine = db.engines[source]
+        last_id = 0
+        while True:
+            with engine.connect() as connection:
+                rows = connection.execute(sa.select(table).where(table.c.id > last_id)
+                                          .order_by(table.c.id).limit(batch_size)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            targets: Dict[str, list] = {}
+            for row in rows:
+                target = shards.shard_for(row.user_id)
+                if target != source:
+                    targets.setdefault(target, []).append(row._asdict())
+            for target, items in targets.items():
+                ids = [item['id'] for item in items]
+                with db.engines[target].begin() as connection:
+                    connection.execute(sa.delete(table).where(table.c.id.in_(ids)))
+                    connection.execute(sa.insert(table), items)
+                with engine.begin() as connection:
+                    connection.execute(sa.delete(table).where(table.c.id.in_(ids)))
+                direction = '{} -> {}'.format(source or 'default', target)
+                moved[direction] = moved.get(direction, 0) + len(items)
+
+    sync_post_id_counter()
+    return moved, perf_counter() - started
+
+
+def sync_post_id_counter() -> None:
+    """
+    Подтягивает счетчик id постов к максимальному id (включая архив) в основной базе данных и на шардах
+    (после переноса или загрузки постов с готовыми id).
+    """
+    counter = PostIdCounter.__table__
+    with db.engines[DEFAULT_BIND].begin() as connection:
+        top = _max_post_id(connection)
+        if not connection.execute(sa.update(counter).where(counter.c.id == 1, counter.c.value < top)
+                                  .values(value=top)).rowcount:
+            if connection.scalar(sa.select(counter.c.value).where(counter.c.id == 1)) is None:
+                connection.execute(sa.insert(counter).values(id=1, value=top))
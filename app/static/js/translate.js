@@ -45,13 +45,22 @@ document.addEventListener('DOMContentLoaded', function() {
     function translateText(postTextElement, link) {
         const originalText = postTextElement.textContent;
         const postId = postTextElement.dataset.postid;
-        const url = `https://translate.googleapis.com/translate_a/single?client=gtx&sl=${sourceLanguage}&tl=${targetLanguage}&dt=t&q=${encodeURIComponent(originalText)}`;
-
-        $.ajax({
-            url: url,
-            type: 'GET',
+        const request = server_translation ? {
+            url: '/translate',
+            type: 'POST',
+            contentType: 'application/json',
+            data: JSON.stringify({
+                text: originalText,
+                source_language: sourceLanguage,
+                dest_language: targetLanguage
+            })
+        } : {
+            url: `https://translate.googleapis.com/translate_a/single?client=gtx&sl=${sourceLanguage}&tl=${targetLanguage}&dt=t&q=${encodeURIComponent(originalText)}`,
+            type: 'GET'
+        };
+        $.ajax(Object.assign(request, {
             success: function (data) {
-                var translation = data[0][0][0];
+                var translation = server_translation ? data.text : data[0][0][0];
                 postTextElement.textContent = translation;
                 link.textContent = 'Original';
                 postStates[postId] = { state: "translation", originalText: originalText };
@@ -59,6 +68,6 @@ document.addEventListener('DOMContentLoaded', function() {
             error: function() {
                 console.log("Translation request failed");
             }
-        });
+        }));
     }
 });
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import re
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Библиотеки третьей стороны
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+
+# Собственные модули
+from app import db, sharding
+from app.models import Post, PostArchive, PostMention, PostTag, User
+
+# Хэштег и упоминание начинаются с # или @ не внутри слова (не 'a#b', не адрес 'me@example.com').
+HASHTAG = re.compile(r'(?<![\w#&])#(\w{1,64})')
+MENTION = re.compile(r'(?<![\w@.])@(\w{1,64})')
+
+# Разделитель времени и id поста в курсоре keyset-пагинации.
+CURSOR_SEPARATOR = '_'
+
+
+def extract(body: str) -> Tuple[Set[str], Set[str]]:
+    """
+    Находит в тексте поста хэштеги (в нижнем регистре) и имена упомянутых пользователей.
+
+    Returns:
+        Tuple[Set[str], Set[str]]: Хэштеги и имена пользователей.
+    """
+    return {tag.lower() for tag in HASHTAG.findall(body)}, set(MENTION.findall(body))
+
+
+def _index_rows(connection: sa.Connection, posts: Iterable) -> Tuple[List[dict], List[dict]]:
+    """
+    Строки post_tag и post_mention для постов (объектов или строк с полями id, body, timestamp).
+
+    Имена упомянутых пользователей всей пачки разрешаются в id одним запросом; упоминания
+    несуществующих пользователей пропускаются.
+    """
+    tag_rows, mentions = [], []
+    for post in posts:
+        tags, usernames = extract(post.body)
+        tag_rows += [{'tag': tag, 'post_id': post.id, 'timestamp': post.timestamp} for tag in tags]
+        mentions += [(username, post.id, post.timestamp) for username in usernames]
+    user_ids = {}
+    if mentions:
+        user_ids = dict(connection.execute(
+            sa.select(User.username, User.id)
+            .where(User.username.in_({username for username, _, _ in mentions}))).all())
+    mention_rows = [{'user_id': user_ids[username], 'post_id': post_id, 'timestamp': timestamp}
+                    for username, post_id, timestamp in mentions if username in user_ids]
+    return tag_rows, mention_rows
+
+
+def index_post(post: Post) -> None:
+    """
+    Записывает хэштеги и упоминания нового поста в post_tag и post_mention в транзакции сессии.
+
+    Пост должен быть уже записан в сессию (flush), чтобы у него был id.
+    """
+    connection = db.session.connection(bind_arguments={'mapper': PostTag})
+    tag_rows, mention_rows = _index_rows(connection, [post])
+    if tag_rows:
+        connection.execute(sa.insert(PostTag.__table__), tag_rows)
+    if mention_rows:
+        connection.execute(sa.insert(PostMention.__table__), mention_rows)
+
+
+def encode_cursor(timestamp: datetime, post_id: int) -> str:
+    return f'{timestamp.isoformat()}{CURSOR_SEPARATOR}{post_id}'
+
+
+def decode_cursor(value: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """
+    Разбирает курсор '<время ISO 8601>_<id поста>'; для пустого или неверного значения - None.
+    """
+    if not value:
+        return None
+    timestamp, _, post_id = value.rpartition(CURSOR_SEPARATOR)
+    try:
+        return datetime.fromisoformat(timestamp), int(post_id)
+    except ValueError:
+        return None
+
+
+def timeline(model, key, before: Optional[Tuple[datetime, int]] = None,
+             limit: int = 20) -> Tuple[List[int], Optional[str]]:
+    """
+    Страница id постов с хэштегом или упоминанием, начиная с новых, с keyset-пагинацией.
+
+    Читается только диапазон индекса (tag, timestamp, post_id) или (user_id, timestamp, post_id):
+    условие курсора (timestamp, post_id) < before записано через OR, чтобы его понимали
+    все СУБД.
+
+    Args:
+        model: PostTag или PostMention.
+        key: Хэштег (для PostTag) или id упомянутого пользователя (для PostMention).
+        before (Optional[Tuple[datetime, int]]): Курсор - время и id последнего поста предыдущей страницы.
+        limit (int): Размер страницы.
+
+    Returns:
+        Tuple[List[int], Optional[str]]: id постов страницы и курсор следующей страницы (или None).
+    """
+    column = model.tag if model is PostTag else model.user_id
+    query = sa.select(model.post_id, model.timestamp).where(column == key)
+    if before is not None:
+        timestamp, post_id = before
+        query = query.where(sa.or_(model.timestamp < timestamp,
+                                   sa.and_(model.timestamp == timestamp, model.post_id < post_id)))
+    rows = db.session.execute(query.order_by(model.timestamp.desc(), model.post_id.desc())
+                              .limit(limit + 1)).all()
+    cursor = encode_cursor(rows[limit - 1].timestamp, rows[limit - 1].post_id) \
+        if len(rows) > limit else None
+    return [row.post_id for row in rows[:limit]], cursor
+
+
+def load_posts(ids: List[int]) -> List:
+    """
+    Объекты Post по id в порядке ids (с авторами); отсутствующие посты пропускаются.
+
+    Посты, перенесенные в архив, дочитываются из post_archive (объектами PostArchive) вторым
+    запросом, только если их не оказалось в таблице post.
+    """
+    if not ids:
+        return []
+    if sharding.shard_map() is not None:
+        posts = sharding.get_posts(ids)
+    else:
+        posts = db.session.scalars(
+            sa.select(Post).where(Post.id.in_(ids)).options(so.joinedload(Post.author))).all()
+    found = {post.id: post for post in posts}
+    missing = set(ids) - set(found)
+    if missing:
+        found.update((post.id, post) for post in db.session.scalars(
+            sa.select(PostArchive).where(PostArchive.id.in_(missing))
+            .options(so.joinedload(PostArchive.author))))
+    return [found[post_id] for post_id in ids if post_id in found]
+
+
+def _backfill_chunk(engines: dict, source: Optional[str], table: sa.Table,
+                    low: int, high: int) -> Tuple[int, int, int]:
+    with engines[source].connect() as connection:
+        posts = connection.execute(
+            sa.select(table.c.id, table.c.body, table.c.timestamp)
+            .where(table.c.id >= low, table.c.id < high)).all()
+    if not posts:
+        return 0, 0, 0
+    ids = [post.id for post in posts]
+    with engines[None].begin() as connection:
+        tag_rows, mention_rows = _index_rows(connection, posts)
+        # Повторный запуск не создает дубликатов: строки этих постов записываются заново.
+        for model, rows in ((PostTag, tag_rows), (PostMention, mention_rows)):
+            connection.execute(sa.delete(model.__table__).where(model.post_id.in_(ids)))
+            if rows:
+                connection.execute(sa.insert(model.__table__), rows)
+    return len(posts), len(tag_rows), len(mention_rows)
+
+
+def backfill(batch_size: int = 1000, workers: int = 4) -> Tuple[Dict[str, int], float]:
+    """
+    Заполняет post_tag и post_mention для существующих постов.
+
+    Диапазон id постов (основной базы данных или каждого шарда, а также архива post_archive)
+    делится на куски по batch_size
+    id, которые обрабатываются параллельно в workers потоках: каждый кусок читается своим
+    соединением и записывается своей транзакцией. Задание можно прерывать и запускать повторно.
+
+    Returns:
+        Tuple[Dict[str, int], float]: Количество обработанных постов, хэштегов и упоминаний
+        и затраченное время в секундах.
+    """
+    started = perf_counter()
+    shards = sharding.shard_map()
+    sources = [(shard, Post.__table__) for shard in (shards.keys if shards is not None else [None])]
+    # Архив всегда лежит в основной базе данных.
+    sources.append((None, PostArchive.__table__))
+    engines = dict(db.engines)
+    chunks = []
+    for source, table in sources:
+        with engines[source].connect() as connection:
+            low, high = connection.execute(sa.select(sa.func.min(table.c.id), sa.func.max(table.c.id))).one()
+        if low is not None:
+            chunks += [(source, table, start, start + batch_size)
+                       for start in range(low, high + 1, batch_size)]
+    totals = {'posts': 0, 'tags': 0, 'mentions': 0}
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='backfill') as executor:
+        for counts in executor.map(lambda chunk: _backfill_chunk(engines, *chunk), chunks):
+            for name, count in zip(totals, counts):
+                totals[name] += count
+    return totals, perf_counter() - started
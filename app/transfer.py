@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+# Стандартные библиотеки Python
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from datetime import datetime
+from itertools import islice
+import json
+from time import perf_counter
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+# Библиотеки третьей стороны
+import sqlalchemy as sa
+
+# Собственные модули
+from app import db, sharding
+from app.models import User, Post, PostArchive, PostMention, PostTag, Message, Conversation, followers
+
+# Порядок таблиц соответствует внешним ключам: при импорте пользователи создаются первыми.
+# Архив постов и индексы тегов и упоминаний переносятся как есть, без повторного разбора текста.
+TABLES = {
+    'user': User.__table__,
+    'followers': followers,
+    'post': Post.__table__,
+    'post_archive': PostArchive.__table__,
+    'post_tag': PostTag.__table__,
+    'post_mention': PostMention.__table__,
+    'conversation': Conversation.__table__,
+    'message': Message.__table__,
+}
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def export_jsonl(stream: IO[str], tables: Iterable[str] = tuple(TABLES),
+                 batch_size: int = 5000) -> Dict[str, Tuple[int, float]]:
+    """
+    Выгружает строки таблиц в поток в формате JSONL: {"table": ..., "row": {...}} на строку.
+
+    Строки читаются потоково (yield_per), поэтому расход памяти ограничен batch_size строками.
+    При шардировании посты читаются с основной базы данных и со всех шардов по очереди.
+
+    Returns:
+        Dict[str, Tuple[int, float]]: Количество строк и время выгрузки по таблицам.
+    """
+    stats = {}
+    shards = sharding.shard_map()
+    for name in tables:
+        table = TABLES[name]
+        started = perf_counter()
+        count = 0
+        query = sa.select(table).order_by(*table.primary_key.columns)
+        sources = [sharding.DEFAULT_BIND] + shards.keys if name == 'post' and shards is not None else [None]
+        for shard in sources:
+            result = db.session.execute(query, execution_options={'yield_per': batch_size},
+                                        bind_arguments={'shard': shard})
+            for partition in result.mappings().partitions():
+                stream.write(''.join(json.dumps({'table': name, 'row': dict(row)}, default=_encode) + '\n'
+                                     for row in partition))
+                count += len(partition)
+        stats[name] = (count, perf_counter() - started)
+    return stats
+
+
+def _datetime_columns() -> Dict[str, List[str]]:
+    return {name: [column.name for column in table.columns if isinstance(column.type, sa.DateTime)]
+            for name, table in TABLES.items()}
+
+
+def _decode_block(lines: List[str]) -> List[Tuple[str, dict]]:
+    """
+    Разбирает пачку строк JSONL; выполняется в процессе-обработчике при параллельном чтении.
+    """
+    datetimes = _datetime_columns()
+    records = []
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        name, row = record['table'], record['row']
+        for column in datetimes[name]:
+            if row.get(column) is not None:
+                row[column] = datetime.fromisoformat(row[column])
+        records.append((name, row))
+    return records
+
+
+def _read_blocks(stream: IO[str], block_size: int) -> Iterator[List[str]]:
+    while True:
+        block = list(islice(stream, block_size))
+        if not block:
+            return
+        yield block
+
+
+def _decoded(stream: IO[str], block_size: int, workers: int) -> Iterator[Tuple[str, dict]]:
+    """
+    Возвращает записи файла по порядку; при workers > 1 разбор JSON идет в нескольких процессах
+    с ограниченным окном незавершенных пачек, чтобы не читать весь файл в память.
+    """
+    if workers <= 1:
+        for block in _read_blocks(stream, block_size):
+            yield from _decode_block(block)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for block in _read_blocks(stream, block_size):
+            pending.append(executor.submit(_decode_block, block))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def import_jsonl(stream: IO[str], chunk_size: int = 5000, workers: int = 1,
+                 reindex: bool = False) -> Dict[str, Tuple[int, float]]:
+    """
+    Загружает строки из потока JSONL пачками executemany-вставок, минуя ORM.
+
+    Индексация в Elasticsearch во время загрузки не выполняется; при reindex=True посты
+    переиндексируются одним проходом после загрузки. Первичные ключи сохраняются как в выгрузке,
+    поэтому загружать данные нужно в пустую базу данных. При шардировании посты записываются
+    на шарды своих авторов, а счетчик id постов затем подтягивается к максимальному id.
+
+    Args:
+        stream: Текстовый поток с JSONL, созданным export_jsonl().
+        chunk_size (int): Количество строк в одной вставке.
+        workers (int): Количество процессов для разбора JSON (1 - без параллелизма).
+        reindex (bool): Переиндексировать посты после загрузки.
+
+    Returns:
+        Dict[str, Tuple[int, float]]: Количество строк и время загрузки по таблицам.
+    """
+    stats: Dict[str, List[float]] = {}
+    shards = sharding.shard_map()
+    if shards is not None:
+        sharding.create_shards()
+    buffer: List[dict] = []
+    current: Optional[str] = None
+    started = perf_counter()
+
+    def flush() -> None:
+        nonlocal started
+        if buffer:
+            if current == 'post' and shards is not None:
+                # Посты записываются на шард автора; commit() сессии фиксирует все шарды.
+                groups: Dict[str, List[dict]] = {}
+                for row in buffer:
+                    groups.setdefault(shards.shard_for(row['user_id']), []).append(row)
+                for key, rows in groups.items():
+                    db.session.execute(sa.insert(TABLES[current]), rows, bind_arguments={'shard': key})
+            else:
+                db.session.execute(sa.insert(TABLES[current]), buffer)
+            entry = stats.setdefault(current, [0, 0.0])
+            entry[0] += len(buffer)
+            entry[1] += perf_counter() - started
+            buffer.clear()
+        started = perf_counter()
+
+    for name, row in _decoded(stream, chunk_size, workers):
+        if name != current or len(buffer) >= chunk_size:
+            flush()
+            current = name
+        buffer.append(row)
+    flush()
+    db.session.commit()
+    if shards is not None:
+        sharding.sync_post_id_counter()
+
+    if reindex:
+        Post.reindex()
+    return {name: (int(count), seconds) for name, (count, seconds) in stats.items()}
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+DEFAULT_TRANSLATOR_URL = 'https://translate.googleapis.com/translate_a/single'
+
+
+class TranslationError(Exception):
+    """
+    Ошибка обращения к сервису перевода.
+    """
+
+
+def _params(text: str, source_language: str, dest_language: str) -> dict:
+    return {'client': 'gtx', 'sl': source_language or 'auto', 'tl': dest_language,
+            'dt': 't', 'q': text}
+
+
+def _parse(data) -> str:
+    # Ответ - вложенные списки, первый элемент которых содержит переведенные сегменты текста.
+    try:
+        return ''.join(segment[0] for segment in data[0] if segment[0])
+    except (IndexError, TypeError) as e:
+        raise TranslationError('unexpected translator response') from e
+
+
+async def translate_async(client, url: str, text: str, source_language: str,
+                          dest_language: str) -> str:
+    """
+    Переводит текст через асинхронный HTTP-клиент (интерфейс httpx.AsyncClient).
+
+    Серверный перевод есть только в асинхронном режиме (app.asgi): в WSGI-режиме браузер
+    обращается к сервису перевода сам (static/js/translate.js) и не занимает обработчик сервера.
+
+    Raises:
+        TranslationError: Если сервис недоступен или вернул неожиданный ответ.
+    """
+    try:
+        response = await client.get(url, params=_params(text, source_language, dest_language))
+        response.raise_for_status()
+        data = response.json()
+    except Exception as e:
+        raise TranslationError(str(e)) from e
+    return _parse(data)
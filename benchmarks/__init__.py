@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарки производительности микроблога.
+
+Каждый модуль запускается отдельно, например: python -m benchmarks.post_fragments
+"""
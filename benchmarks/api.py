@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк JSON API против HTML-маршрутов с теми же данными.
+
+Запуск: python -m benchmarks.api
+"""
+
+# Стандартные библиотеки Python
+from timeit import repeat
+
+# Библиотеки третьей стороны
+import sqlalchemy as sa
+
+# Собственные модули
+from app import create_app, db
+from app.bench import seed
+from app.models import User
+from config import Config
+
+
+class BenchConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    ELASTICSEARCH_URL = None
+
+
+def _best(func, number: int, repeats: int) -> float:
+    func()
+    return min(repeat(func, number=number, repeat=repeats)) / number * 1000
+
+
+def main(number: int = 20, repeats: int = 5) -> None:
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        seed(users=500, posts_per_user=20, follows_per_user=20, messages=0)
+        viewer = db.session.scalar(sa.select(User).order_by(User.id).offset(250).limit(1))
+        author = db.session.scalar(sa.select(User).order_by(User.id).limit(1))
+        token = viewer.get_api_token()
+        post_ids = ','.join(str(i) for i in range(1000, 1000 + app.config['POSTS_PER_PAGE']))
+
+        html = app.test_client()
+        with html.session_transaction() as sess:
+            sess['_user_id'] = str(viewer.id)
+        api = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+
+        cases = (
+            ('timeline', lambda: html.get('/index'), lambda: api.get('/api/timeline', headers=headers)),
+            ('explore', lambda: html.get('/explore?page=2'),
+             lambda: api.get('/api/explore', headers=headers)),
+            ('user', lambda: html.get(f'/user/{author.username}'),
+             lambda: api.get(f'/api/users/{author.username}', headers=headers)),
+            ('posts', None, lambda: api.get(f'/api/posts?ids={post_ids}', headers=headers)),
+        )
+        print(f'{"case":<10} {"html ms":>9} {"api ms":>9} {"speedup":>8}')
+        for name, html_call, api_call in cases:
+            api_ms = _best(api_call, number, repeats)
+            if html_call is None:
+                print(f'{name:<10} {"-":>9} {api_ms:>9.2f} {"-":>8}')
+                continue
+            html_ms = _best(html_call, number, repeats)
+            print(f'{name:<10} {html_ms:>9.2f} {api_ms:>9.2f} {html_ms / api_ms:>7.1f}x')
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк асинхронного режима: одновременные запросы на один рабочий процесс при медленных бэкендах.
+
+Elasticsearch и сервис перевода заменяются локальными заглушками, которые отвечают через --delay
+секунд (синхронные спят в потоке, асинхронные - в цикле событий). Пачка одновременных запросов
+отправляется:
+  - WSGI-процессу с N потоками (1 - синхронный воркер gunicorn, 4 - gthread): только /search,
+    так как в WSGI-режиме перевод выполняет браузер и сервер его не обслуживает;
+  - ASGI-процессу (app.asgi.AsyncGateway) с одним циклом событий: /search и /translate.
+Для каждого варианта выводится время, пропускная способность и эффективное число запросов,
+обслуживаемых процессом одновременно (запросы * задержка / время).
+
+Запуск: python -m benchmarks.async_io --requests 50 --delay 0.2
+"""
+
+# Стандартные библиотеки Python
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import tempfile
+from time import perf_counter, sleep
+from typing import List, Optional
+from unittest import mock
+
+# Собственные модули
+from app import create_app, db
+from app.asgi import AsyncGateway
+from app.bench import seed
+from app.models import User
+from config import Config
+
+
+class SlowSearch:
+    def __init__(self, delay: float, ids: list):
+        self.delay = delay
+        self.result = {'hits': {'hits': [{'_id': str(i)} for i in ids], 'total': {'value': len(ids)}}}
+
+    def search(self, **kwargs):
+        sleep(self.delay)
+        return self.result
+
+
+class SlowAsyncSearch(SlowSearch):
+    async def search(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        return self.result
+
+
+class SlowAsyncHttp:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def get(self, url, params=None):
+        await asyncio.sleep(self.delay)
+        return mock.Mock(json=lambda: [[[params['q'].upper(), params['q'], None]]])
+
+
+def run_wsgi(flask_app, cookie: str, requests: int, threads: int) -> dict:
+    client = flask_app.test_client()
+    client.set_cookie(flask_app.config['SESSION_COOKIE_NAME'], cookie)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        started = perf_counter()
+        statuses = list(executor.map(lambda i: client.get('/search?q=flask').status_code, range(requests)))
+        return {'seconds': perf_counter() - started, 'statuses': statuses}
+
+
+def run_asgi(gateway, cookie: str, requests: int) -> dict:
+    header = (b'cookie', '{}={}'.format(gateway.app.config['SESSION_COOKIE_NAME'], cookie).encode())
+
+    async def call(i: int) -> int:
+        path, method, body = ('/search', 'GET', b'') if i % 2 == 0 else \
+            ('/translate', 'POST', json.dumps({'text': 'flask', 'dest_language': 'ru'}).encode())
+        scope = {'type': 'http', 'method': method, 'path': path, 'root_path': '',
+                 'query_string': b'q=flask' if i % 2 == 0 else b'',
+                 'headers': [(b'host', b'localhost'), header]}
+        pending = [{'type': 'http.request', 'body': body}]
+        statuses = []
+
+        async def receive():
+            if pending:
+                return pending.pop()
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        await gateway(scope, receive, send)
+        return statuses[0]
+
+    async def main():
+        started = perf_counter()
+        statuses = await asyncio.gather(*(call(i) for i in range(requests)))
+        return {'seconds': perf_counter() - started, 'statuses': list(statuses)}
+
+    return asyncio.run(main())
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--delay', type=float, default=0.2, help='backend latency, seconds')
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(directory, 'bench.db')
+        ELASTICSEARCH_URL = None
+        TESTING = True
+        # Все запросы идут от одного пользователя: лимиты app.admission отклонили бы их с 429.
+        ADMISSION_CONTROL = False
+
+    flask_app = create_app(BenchConfig)
+    with flask_app.app_context():
+        db.create_all()
+        seed(users=100, posts_per_user=5, follows_per_user=5, messages=0)
+        user_id = db.session.get(User, 1).id
+    cookie = flask_app.session_interface.get_signing_serializer(flask_app).dumps({'_user_id': str(user_id)})
+    ids = list(range(1, flask_app.config['POSTS_PER_PAGE'] + 1))
+
+    flask_app.elasticsearch = SlowSearch(args.delay, ids)
+    print(f'{args.requests} concurrent requests (wsgi: /search, asgi: /search and /translate), '
+          f'backend delay {args.delay:.2f} s')
+    print(f'{"server":<20} {"seconds":>8} {"req/s":>8} {"in flight":>10} {"errors":>7}')
+    rows = []
+    for threads in (1, 4):
+        rows.append((f'wsgi, {threads} thread(s)', run_wsgi(flask_app, cookie, args.requests, threads)))
+    gateway = AsyncGateway(flask_app, search_client=SlowAsyncSearch(args.delay, ids),
+                           http_client=SlowAsyncHttp(args.delay), max_threads=4)
+    rows.append(('asgi, 1 loop', run_asgi(gateway, cookie, args.requests)))
+    asyncio.run(gateway.aclose())
+    for name, result in rows:
+        seconds = result['seconds']
+        errors = sum(1 for status in result['statuses'] if status >= 400)
+        print(f'{name:<20} {seconds:>8.2f} {args.requests / seconds:>8.1f} '
+              f'{args.requests * args.delay / seconds:>10.1f} {errors:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк первых запросов нового воркера с компиляцией шаблонов и с кэшем байт-кода Jinja.
+
+Каждое измерение выполняется в новом процессе интерпретатора, как в только что запущенном воркере.
+Сравниваются варианты:
+  - source: шаблоны разбираются и компилируются из исходного текста при первом обращении;
+  - bytecode: байт-код шаблонов заранее записан командой flask templates compile (как при сборке
+    образа) и загружается из TEMPLATE_CACHE_DIR.
+
+Запуск: python -m benchmarks.first_request --repeat 5
+"""
+
+# Стандартные библиотеки Python
+import argparse
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+PAGES = ('/index', '/explore', '/user/user0')
+
+
+def _app(database: str, cache_dir: str):
+    from app import create_app
+    from config import Config
+
+    class FirstRequestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + database
+        ELASTICSEARCH_URL = None
+        TEMPLATE_CACHE_DIR = cache_dir or None
+
+    return create_app(FirstRequestConfig)
+
+
+def seed(database: str) -> None:
+    from app import db
+    from app.models import User, Post
+    app = _app(database, '')
+    with app.app_context():
+        db.create_all()
+        users = [User(username=f'user{i}', email=f'user{i}@example.com') for i in range(10)]
+        db.session.add_all(users)
+        now = datetime.now(timezone.utc)
+        db.session.add_all([Post(body=f'post number {i}', author=users[i % len(users)], language='en',
+                                 timestamp=now - timedelta(minutes=i)) for i in range(50)])
+        db.session.flush()
+        for user in users[1:]:
+            users[0].follow(user)
+        db.session.commit()
+
+
+def child(mode: str, database: str, cache_dir: str) -> dict:
+    """
+    Одно измерение; выполняется в отдельном процессе (python -m benchmarks.first_request --child MODE).
+    """
+    if mode == 'compile':
+        from app.prefork import compile_templates
+        return {'templates': len(compile_templates(_app(database, cache_dir)))}
+    app = _app(database, cache_dir if mode == 'bytecode' else '')
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    result = {}
+    for page in PAGES:
+        for visit in ('first', 'second'):
+            started = perf_counter()
+            response = client.get(page)
+            result[f'{page} {visit}'] = perf_counter() - started
+            assert response.status_code == 200, (page, response.status_code)
+    return result
+
+
+def run(mode: str, database: str, cache_dir: str) -> dict:
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.first_request', '--child', mode,
+                             '--database', database, '--cache-dir', cache_dir],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', choices=('compile', 'source', 'bytecode'))
+    parser.add_argument('--database')
+    parser.add_argument('--cache-dir')
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(child(args.child, args.database, args.cache_dir)))
+        return
+
+    directory = tempfile.mkdtemp()
+    try:
+        database = os.path.join(directory, 'microblog.db')
+        cache_dir = os.path.join(directory, 'template-cache')
+        seed(database)
+        compiled = run('compile', database, cache_dir)['templates']
+        print(f'{compiled} templates compiled into the bytecode cache')
+        timings = {}
+        for mode in ('source', 'bytecode'):
+            runs = [run(mode, database, cache_dir) for _ in range(args.repeat)]
+            timings[mode] = {key: statistics.median(item[key] for item in runs) for key in runs[0]}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f'{"page":<24} {"source":>9} {"bytecode":>9}')
+    for key in timings['source']:
+        print(f'{key:<24} {timings["source"][key] * 1000:8.1f}ms {timings["bytecode"][key] * 1000:8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
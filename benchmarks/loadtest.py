@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест запущенного сервера микроблога с отчетом о задержках по маршрутам.
+
+Виртуальные пользователи входят под пользователями из 'flask bench seed' (bench<id> / password)
+и воспроизводят смесь запросов: главная, обзор, профиль, публикация, подписка, личное сообщение
+и опрос уведомлений. Для каждого маршрута считаются p50/p95/p99 и пропускная способность.
+
+Замеряется только запрос к самому маршруту: CSRF-токен получается заранее и переиспользуется,
+а перенаправление после POST не выполняется (ответ 302 - успешный результат).
+
+Запуск:
+    python -m benchmarks.loadtest --url http://localhost:5000 --users 100 --concurrency 20 \
+        --duration 60 --save-baseline loadtest-baseline.json
+    python -m benchmarks.loadtest --url http://localhost:5000 --baseline loadtest-baseline.json
+"""
+
+# Стандартные библиотеки Python
+import argparse
+from http.cookiejar import CookieJar
+import json
+import math
+import random
+import re
+import sys
+import threading
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+# Доли действий в смеси нагрузки.
+MIX = {
+    'index': 25,
+    'explore': 20,
+    'user': 15,
+    'notifications': 25,
+    'post': 5,
+    'follow': 5,
+    'send_message': 5,
+}
+
+
+class NoRedirect(HTTPRedirectHandler):
+    """
+    Не следует перенаправлениям: ответ 3xx возвращается как есть (через HTTPError).
+    """
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class VirtualUser:
+    """
+    Виртуальный пользователь со своей cookie-сессией.
+    """
+
+    def __init__(self, base_url: str, username: str, password: str, rng: random.Random):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.rng = rng
+        cookies = HTTPCookieProcessor(CookieJar())
+        self.opener = build_opener(cookies)
+        self.direct_opener = build_opener(cookies, NoRedirect())
+        self.notifications_etag: Optional[str] = None
+        self.csrf_token: Optional[str] = None
+
+    def request(self, path: str, data: Optional[dict] = None, headers: Optional[dict] = None,
+                follow: bool = True):
+        body = urlencode(data).encode('utf-8') if data is not None else None
+        req = Request(self.base_url + path, data=body, headers=headers or {})
+        try:
+            with (self.opener if follow else self.direct_opener).open(req, timeout=30) as response:
+                return response.status, response.headers, response.read()
+        except HTTPError as e:
+            return e.code, e.headers, e.read()
+
+    def csrf(self, path: str) -> str:
+        status, headers, body = self.request(path)
+        match = CSRF_RE.search(body.decode('utf-8', 'replace'))
+        return match.group(1) if match else ''
+
+    def login(self) -> bool:
+        token = self.csrf('/auth/login')
+        status, headers, body = self.request('/auth/login', {
+            'csrf_token': token, 'username': self.username, 'password': self.password})
+        return status == 200 and b'/auth/logout' in body
+
+    def timed(self, path: str, data: Optional[dict] = None,
+              headers: Optional[dict] = None) -> Tuple[int, dict, float]:
+        """
+        Выполняет один запрос без перенаправлений и возвращает статус, заголовки и время в мс.
+        """
+        started = perf_counter()
+        status, response_headers, _ = self.request(path, data, headers, follow=False)
+        return status, response_headers, (perf_counter() - started) * 1000
+
+    def submit(self, path: str, data: dict) -> Tuple[int, float]:
+        """
+        Отправляет форму с CSRF-токеном сессии; токен запрашивается вне замера и только
+        при первом обращении или после отказа (400 - токен истек).
+        """
+        if self.csrf_token is None:
+            self.csrf_token = self.csrf('/index')
+        status, _, elapsed = self.timed(path, dict(data, csrf_token=self.csrf_token))
+        if status == 400:
+            self.csrf_token = self.csrf('/index')
+            status, _, elapsed = self.timed(path, dict(data, csrf_token=self.csrf_token))
+        return status, elapsed
+
+    def act(self, action: str, usernames: List[str]) -> Tuple[int, float]:
+        """
+        Выполняет одно действие и возвращает HTTP-статус и время ответа маршрута в мс.
+        """
+        other = self.rng.choice(usernames)
+        if action == 'index':
+            return self.timed('/index')[::2]
+        if action == 'explore':
+            return self.timed('/explore?page={}'.format(self.rng.choice((1, 1, 1, 2, 3))))[::2]
+        if action == 'user':
+            return self.timed(f'/user/{other}')[::2]
+        if action == 'notifications':
+            headers = {'If-None-Match': self.notifications_etag} if self.notifications_etag else {}
+            status, response_headers, elapsed = self.timed('/notifications?since=0', headers=headers)
+            self.notifications_etag = response_headers.get('ETag') or self.notifications_etag
+            return status, elapsed
+        if action == 'post':
+            return self.submit('/index', {'post': f'load test post {self.rng.random():.6f}'})
+        if action == 'follow':
+            verb = self.rng.choice(('follow', 'unfollow'))
+            return self.submit(f'/{verb}/{other}', {})
+        if action == 'send_message':
+            return self.submit(f'/send_message/{other}', {'message': 'load test message'})
+        raise ValueError(action)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Возвращает q-й перцентиль (0..100) методом ближайшего ранга.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q * len(ordered) / 100) - 1))
+    return ordered[index]
+
+
+def run(url: str, users: int, concurrency: int, duration: float, first_id: int = 1,
+        prefix: str = 'bench', password: str = 'password', seed: int = 1) -> Dict[str, dict]:
+    """
+    Запускает нагрузку и возвращает статистику по каждому действию.
+    """
+    usernames = [f'{prefix}{first_id + i}' for i in range(users)]
+    vus = [VirtualUser(url, name, password, random.Random(seed + i)) for i, name in enumerate(usernames)]
+    failed_logins = [vu.username for vu in vus if not vu.login()]
+    if failed_logins:
+        raise SystemExit('login failed for: ' + ', '.join(failed_logins[:5]))
+
+    actions = list(MIX)
+    weights = [MIX[action] for action in actions]
+    latencies: Dict[str, List[float]] = {action: [] for action in actions}
+    errors: Dict[str, int] = {action: 0 for action in actions}
+    lock = threading.Lock()
+    deadline = perf_counter() + duration
+
+    def worker(index: int) -> None:
+        own = vus[index::concurrency]
+        rng = random.Random(seed * 1000 + index)
+        while perf_counter() < deadline:
+            vu = rng.choice(own)
+            action = rng.choices(actions, weights=weights)[0]
+            started = perf_counter()
+            try:
+                status, elapsed = vu.act(action, usernames)
+            except OSError:
+                status, elapsed = 0, (perf_counter() - started) * 1000
+            with lock:
+                latencies[action].append(elapsed)
+                if status == 0 or status >= 400:
+                    errors[action] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(min(concurrency, len(vus)))]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+
+    return {action: {
+        'count': len(values),
+        'errors': errors[action],
+        'rps': len(values) / elapsed,
+        'p50_ms': percentile(values, 50),
+        'p95_ms': percentile(values, 95),
+        'p99_ms': percentile(values, 99),
+    } for action, values in latencies.items()}
+
+
+def regressions(baseline: Dict[str, dict], results: Dict[str, dict], threshold: float,
+                key: str = 'p95_ms') -> List[str]:
+    """
+    Возвращает действия, у которых key вырос относительно базовой линии больше чем на threshold.
+    """
+    failed = []
+    for action, stats in results.items():
+        before = baseline.get(action, {}).get(key)
+        if before and stats['count'] and stats[key] > before * (1 + threshold):
+            failed.append(action)
+    return failed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--users', type=int, default=50, help='seeded users to log in as')
+    parser.add_argument('--first-id', type=int, default=1, help='id of the first seeded user')
+    parser.add_argument('--prefix', default='bench', help='seeded username prefix')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--baseline', metavar='FILE', help='fail if p95 regresses past --threshold')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = run(args.url, args.users, args.concurrency, args.duration, first_id=args.first_id,
+                  prefix=args.prefix, password=args.password, seed=args.seed)
+    print(f'{"endpoint":<15} {"count":>7} {"err":>5} {"rps":>8} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+    for action, stats in results.items():
+        print('{:<15} {count:>7} {errors:>5} {rps:>8.1f} {p50_ms:>9.1f} {p95_ms:>9.1f} {p99_ms:>9.1f}'
+              .format(action, **stats))
+    total = sum(stats['rps'] for stats in results.values())
+    print(f'total throughput: {total:.1f} req/s')
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            failed = regressions(json.load(f), results, args.threshold)
+        if failed:
+            print('p95 regression past {:.0%}: {}'.format(args.threshold, ', '.join(failed)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
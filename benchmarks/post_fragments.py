@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк отрисовки ленты из 50 постов с холодным и прогретым кэшем фрагментов.
+
+Запуск: python -m benchmarks.post_fragments
+"""
+
+# Стандартные библиотеки Python
+from datetime import datetime, timedelta, timezone
+from timeit import repeat
+
+# Библиотеки третьей стороны
+from flask import g, render_template_string
+
+# Собственные модули
+from app import create_app, db
+from app.models import User, Post
+from config import Config
+
+PAGE_TEMPLATE = "{% for post in posts %}{{ render_post(post) }}{% endfor %}"
+UNCACHED_TEMPLATE = "{% for post in posts %}{% include '_post.html' %}{% endfor %}"
+
+
+class BenchConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    ELASTICSEARCH_URL = None
+
+
+def seed(posts_count: int = 50) -> list:
+    users = [User(username=f'user{i}', email=f'user{i}@example.com') for i in range(10)]
+    db.session.add_all(users)
+    now = datetime.now(timezone.utc)
+    posts = [Post(body=f'post number {i}', author=users[i % len(users)], language='en',
+                  timestamp=now - timedelta(minutes=i))
+             for i in range(posts_count)]
+    db.session.add_all(posts)
+    db.session.commit()
+    return posts
+
+
+def main(number: int = 20, repeats: int = 5) -> None:
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        posts = seed()
+        with app.test_request_context('/explore'):
+            g.locale = 'ru'
+
+            def uncached():
+                render_template_string(UNCACHED_TEMPLATE, posts=posts)
+
+            def cold():
+                app.fragment_cache.clear()
+                render_template_string(PAGE_TEMPLATE, posts=posts)
+
+            def warm():
+                render_template_string(PAGE_TEMPLATE, posts=posts)
+
+            warm()
+            for name, func in (('uncached', uncached), ('cold', cold), ('warm', warm)):
+                best = min(repeat(func, number=number, repeat=repeats)) / number
+                print(f'{name:>8}: {best * 1000:8.3f} ms / page ({len(posts)} posts)')
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
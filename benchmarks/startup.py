@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк холодного старта: импорт приложения, create_app() и первый ответ воркера.
+
+Каждое измерение выполняется в новом процессе интерпретатора, поэтому кэши модулей и шаблонов
+не переживают между повторами. Сравниваются варианты:
+  - eager: тяжелые пакеты (elasticsearch, langdetect) импортируются заранее, как до ленивой загрузки;
+  - lazy: текущий код, тяжелые пакеты загружаются при первом использовании;
+  - preload: приложение создано и прогрето (app.prefork.warm_up) в родителе, воркер получен
+    через fork(), как при gunicorn --preload; время воркера - только первый ответ.
+
+Запуск: python -m benchmarks.startup --repeat 5
+"""
+
+# Стандартные библиотеки Python
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+
+HEAVY_MODULES = ('elasticsearch', 'langdetect', 'alembic')
+
+
+def _first_responses(app) -> dict:
+    client = app.test_client()
+    started = perf_counter()
+    client.get('/auth/login')
+    first = perf_counter() - started
+    started = perf_counter()
+    client.get('/auth/login')
+    return {'first_request': first, 'second_request': perf_counter() - started}
+
+
+def child(mode: str) -> dict:
+    """
+    Одно измерение; выполняется в отдельном процессе (python -m benchmarks.startup --child MODE).
+    """
+    started = perf_counter()
+    if mode == 'eager':
+        import elasticsearch  # noqa: F401
+        import langdetect  # noqa: F401
+    from app import create_app
+    from config import Config
+
+    class StartupConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite://'
+        ELASTICSEARCH_URL = 'http://localhost:9200'
+        WTF_CSRF_ENABLED = False
+
+    imported = perf_counter() - started
+    started = perf_counter()
+    app = create_app(StartupConfig)
+    result = {'import': imported, 'create_app': perf_counter() - started,
+              'loaded': [name for name in HEAVY_MODULES if name in sys.modules]}
+    if mode != 'preload':
+        result.update(_first_responses(app))
+        return result
+
+    from app.prefork import reinit_after_fork, warm_up
+    started = perf_counter()
+    warm_up(app)
+    result['warm_up'] = perf_counter() - started
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        started = perf_counter()
+        reinit_after_fork(app)
+        timings = {'reinit': perf_counter() - started, **_first_responses(app)}
+        os.write(write_fd, json.dumps(timings).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        result.update(json.loads(pipe.read()))
+    os.waitpid(pid, 0)
+    return result
+
+
+def measure(mode: str, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--child', mode],
+                                check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    timings = {key: statistics.median(run[key] for run in runs)
+               for key, value in runs[0].items() if isinstance(value, float)}
+    timings['loaded'] = runs[0]['loaded']
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', choices=('eager', 'lazy', 'preload'))
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(child(args.child)))
+        return
+
+    print(f'{"mode":>8} {"import":>8} {"create":>8} {"first":>8} {"second":>8} {"worker":>8}'
+          '  heavy modules after create_app()')
+    for mode in ('eager', 'lazy', 'preload'):
+        t = measure(mode, args.repeat)
+        # Время до первого ответа нового воркера: с preload воркер не импортирует и не создает
+        # приложение, а только сбрасывает унаследованные соединения.
+        worker = t['reinit'] + t['first_request'] if mode == 'preload' \
+            else t['import'] + t['create_app'] + t['first_request']
+        print(f'{mode:>8} {t["import"] * 1000:7.1f}ms {t["create_app"] * 1000:7.1f}ms '
+              f'{t["first_request"] * 1000:7.1f}ms {t["second_request"] * 1000:7.1f}ms '
+              f'{worker * 1000:7.1f}ms  {", ".join(t["loaded"]) or "-"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк расчета рекомендаций "на кого подписаться" на синтетическом графе из 1 млн подписок.
+
+Граф строится в памяти (без базы данных) со степенным распределением популярности. Замеряются
+построение CSR, векторная оценка кандидатов для всех пользователей пачками и, для сравнения,
+оценка по одному пользователю и наивный подсчет друзей друзей на множествах Python для выборки.
+
+Запуск: python -m benchmarks.suggestions --users 50000 --edges 1000000
+"""
+
+# Стандартные библиотеки Python
+import argparse
+from collections import Counter
+from time import perf_counter
+from typing import List, Optional
+
+# Библиотеки третьей стороны
+import numpy as np
+
+# Собственные модули
+from app.suggestions import FollowGraph
+
+
+def make_edges(users: int, edges: int, alpha: float, seed: int):
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, users + 1) ** alpha
+    src = rng.integers(1, users + 1, size=edges)
+    dst = rng.choice(np.arange(1, users + 1), size=edges, p=weights / weights.sum())
+    pairs = np.unique(src.astype(np.int64) * (users + 1) + dst)
+    src, dst = pairs // (users + 1), pairs % (users + 1)
+    keep = src != dst
+    return src[keep], dst[keep]
+
+
+def naive(following: List[set], user_id: int, k: int) -> list:
+    counts = Counter()
+    for followed in following[user_id]:
+        counts.update(following[followed])
+    for excluded in following[user_id] | {user_id}:
+        counts.pop(excluded, None)
+    return counts.most_common(k)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--edges', type=int, default=1000000)
+    parser.add_argument('--alpha', type=float, default=0.8)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=1000, help='users scored per batch')
+    parser.add_argument('--sample', type=int, default=1000, help='users for the naive baseline')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    src, dst = make_edges(args.users, args.edges, args.alpha, args.seed)
+    started = perf_counter()
+    graph = FollowGraph.from_edges(src, dst, args.users + 1)
+    print(f'graph: {args.users} users, {graph.edges} edges, '
+          f'{graph.indptr.nbytes + graph.indices.nbytes >> 20} MiB CSR, '
+          f'built in {perf_counter() - started:.2f} s')
+
+    started = perf_counter()
+    stored = 0
+    for start in range(1, args.users + 1, args.batch_size):
+        batch = np.arange(start, min(start + args.batch_size, args.users + 1))
+        stored += len(graph.suggest_many(batch, args.top_k)[0])
+    elapsed = perf_counter() - started
+    print(f'vectorized: {elapsed:.2f} s for all users, {elapsed / args.users * 1e6:.0f} us/user, '
+          f'{stored} suggestions')
+
+    sample = np.random.default_rng(args.seed).integers(1, args.users + 1, size=args.sample)
+    following = [set(graph.following(u).tolist()) for u in range(args.users + 1)]
+    for label, func in (('one by one', lambda u: graph.suggest(u, args.top_k)),
+                        ('python sets', lambda u: naive(following, u, args.top_k))):
+        started = perf_counter()
+        for user_id in sample:
+            func(int(user_id))
+        elapsed = perf_counter() - started
+        print(f'{label:>11}: {elapsed / args.sample * 1e6:8.0f} us/user (sample of {args.sample})')
+
+
+if __name__ == '__main__':
+    main()
@@ -7,4 +7,8 @@ while true; do
     echo Upgrade command failed, retrying in 5 secs...
     sleep 5
 done
-exec gunicorn -b :5000 --access-logfile - --error-logfile - microblog:app
+if [[ "$SERVER_MODE" == "asgi" ]]; then
+    # Асинхронный режим: поиск, перевод и поток уведомлений обслуживаются корутинами (app/asgi.py).
+    exec gunicorn -c gunicorn.conf.py -b :5000 -k uvicorn.workers.UvicornWorker --access-logfile - --error-logfile - microblog:asgi_app
+fi
+exec gunicorn -c gunicorn.conf.py -b :5000 --access-logfile - --error-logfile - microblog:app
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Настройки gunicorn; файл gunicorn.conf.py в текущей директории читается автоматически.
+
+# Стандартные библиотеки Python
+import os
+
+# Приложение создается один раз в мастер-процессе, воркеры получают его готовым через fork():
+# старт воркера не повторяет импорт модулей и create_app(), а память разделяется copy-on-write.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+
+
+def when_ready(server):
+    # Мастер-процесс: загружаем то, что иначе загрузил бы первый запрос каждого воркера.
+    if preload_app:
+        from app.prefork import warm_up
+        warm_up(_flask_app())
+
+
+def post_fork(server, worker):
+    # Воркер не должен пользоваться соединениями, открытыми в мастер-процессе.
+    if preload_app:
+        from app.prefork import reinit_after_fork
+        reinit_after_fork(_flask_app())
+
+
+def _flask_app():
+    from microblog import app
+    return app
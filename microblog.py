@@ -1,10 +1,14 @@
 from app import create_app, db, cli
+from app.asgi import AsyncGateway
 from app.models import User, Post
 
 
 app = create_app()
 cli.register(app)
 
+# Точка входа для асинхронного режима: uvicorn microblog:asgi_app
+asgi_app = AsyncGateway(app)
+
 
 @app.shell_context_processor
 def make_shell_context():
@@ -3,14 +3,49 @@
 # !/usr/bin/env python
 
 # Стандартные библиотеки Python
+import asyncio
+import gc
 from datetime import datetime, timedelta
+import io
+import json
+import logging
+from logging.handlers import SMTPHandler
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
 
 # Библиотеки третьей стороны
 import unittest
+from unittest import mock
+import numpy as np
+from flask import g
+from flask_migrate import upgrade
+import sqlalchemy as sa
 
 # Собственные модули
-from app import create_app, db
-from app.models import User, Post
+from app import cli, create_app, db
+from app.admission import Limiter, TokenBuckets
+from app.asgi import AsyncGateway
+from app.explore_cache import ExploreCache
+from app.logs import RateLimitedSMTPHandler, start_logging, stop_logging
+from app.prefork import LazyElasticsearch, init_bytecode_cache, reinit_after_fork, warm_up
+from app.notifications import DUPLICATES, prune_notifications
+from app.suggestions import FollowGraph, compute_suggestions
+from app.fragments import invalidate_author, render_post
+from app.profiling import _start_tracing, _stop_tracing, list_dumps
+from app.transfer import TABLES, export_jsonl, import_jsonl
+from app.archive import archive_posts
+from app.avatars.identicon import AvatarCache, prerender, render_identicon
+from app.routing import ShardMap
+from app.sharding import allocate_post_ids, create_shards, rebalance, shard_metadata
+from app import tags
+from app.tags import backfill, extract
+from app.bench import compare, run_suite, seed
+from benchmarks.loadtest import percentile, regressions
+from app.models import User, Post, PostArchive, PostIdCounter, PostMention, PostTag, Message, Conversation, Notification, followers
 from config import Config
 
 
@@ -23,10 +58,13 @@ class TestConfig(Config):
     Attributes:
         TESTING (bool): Устанавливает флаг тестирования в True.
         SQLALCHEMY_DATABASE_URI (str): Устанавливает URI для базы данных SQLite.
+        TEMPLATE_CACHE_DIR (None): Отключает дисковый кэш байт-кода шаблонов.
 
     """
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///test.db'
+    ELASTICSEARCH_URL = None
+    TEMPLATE_CACHE_DIR = None
 
 
 class UserModelCase(unittest.TestCase):
@@ -69,6 +107,9 @@ class UserModelCase(unittest.TestCase):
         Тест метода для получения аватара пользователя.
         """
         u = User(username='john', email='john@example.com')
+        with self.app.test_request_context():
+            self.assertEqual(u.avatar(128), '/avatar/d4c74594d841139328695756648b6bd6/128')
+        self.app.config['AVATAR_PROVIDER'] = 'gravatar'
         self.assertEqual(u.avatar(128), ('https://www.gravatar.com/avatar/'
                                          'd4c74594d841139328695756648b6bd6'
                                          '?d=identicon&s=128'))
@@ -141,5 +182,2083 @@ class UserModelCase(unittest.TestCase):
         self.assertEqual(f4, [p4])
 
 
+class PostFragmentCacheCase(unittest.TestCase):
+    """
+    Тестовый набор для кэша отрисованных фрагментов '_post.html'.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='john', email='john@example.com')
+        self.post = Post(body='hello', author=self.user, language='en')
+        db.session.add_all([self.user, self.post])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_render_post_is_cached(self):
+        """
+        Повторная отрисовка поста берется из кэша.
+        """
+        with self.app.test_request_context():
+            g.locale = 'ru'
+            first = render_post(self.post)
+            second = render_post(self.post)
+        self.assertEqual(first, second)
+        self.assertIn('john', first)
+        self.assertEqual(self.app.fragment_cache.hits, 1)
+        self.assertEqual(self.app.fragment_cache.misses, 1)
+
+    def test_profile_change_invalidates(self):
+        """
+        Изменение профиля автора приводит к новой отрисовке фрагмента.
+        """
+        with self.app.test_request_context():
+            g.locale = 'ru'
+            render_post(self.post)
+            self.user.username = 'johnny'
+            db.session.commit()
+            self.assertIn('johnny', render_post(self.post))
+            self.assertEqual(invalidate_author(self.user), 2)
+            self.assertEqual(len(self.app.fragment_cache), 0)
+
+
+
+class ConditionalGetCase(unittest.TestCase):
+    """
+    Тестовый набор для условных GET-запросов (ETag/Last-Modified).
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='john', email='john@example.com')
+        db.session.add_all([self.user, Post(body='hello', author=self.user)])
+        db.session.commit()
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user.id)
+        self.statements = []
+        sa.event.listen(db.engine, 'before_cursor_execute', self._record)
+
+    def tearDown(self):
+        sa.event.remove(db.engine, 'before_cursor_execute', self._record)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def test_explore_not_modified_skips_page_query(self):
+        """
+        Совпадающий ETag дает 304, и запрос страницы постов не выполняется.
+        """
+        response = self.client.get('/explore')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        self.statements.clear()
+        response = self.client.get('/explore', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([s for s in self.statements if 'ORDER BY post.timestamp DESC' in s])
+
+        db.session.add(Post(body='new post', author=self.user))
+        db.session.commit()
+        response = self.client.get('/explore', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_notifications_not_modified(self):
+        """
+        Опрос уведомлений без изменений возвращает 304, а новое уведомление меняет ETag.
+        """
+        response = self.client.get('/notifications')
+        etag = response.headers['ETag']
+        response = self.client.get('/notifications', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.user.add_notification('unread_message_count', 1)
+        db.session.commit()
+        response = self.client.get('/notifications', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()[0]['data'], 1)
+
+    def test_explore_follow_version(self):
+        """
+        После подписки страница "Обзор" отдается заново: в ней меняется URL карточек пользователей.
+        """
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        db.session.add(User(username='susan', email='susan@example.com'))
+        db.session.commit()
+        etag = self.client.get('/explore').headers['ETag']
+        self.assertEqual(self.client.get('/explore', headers={'If-None-Match': etag}).status_code, 304)
+        # Перенаправление на профиль показывает flash-сообщение, при котором 304 не отдается.
+        self.client.post('/follow/susan', follow_redirects=True)
+        response = self.client.get('/explore', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'v: 1', response.data)
+
+    def test_own_profile_not_modified(self):
+        """
+        Свой профиль отдает 304, хотя last_seen обновляется на каждом запросе,
+        а архивирование старого поста меняет ETag.
+        """
+        db.session.add(Post(body='old', author=self.user, timestamp=datetime.utcnow() - timedelta(days=30)))
+        db.session.add(Post(body='new', author=self.user))
+        db.session.commit()
+        response = self.client.get('/user/john')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        response = self.client.get('/user/john', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.assertEqual(archive_posts(datetime.utcnow() - timedelta(days=10))[0], 1)
+        response = self.client.get('/user/john', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'old', response.data)
+
+    def test_profile_version(self):
+        """
+        ETag профиля проверяется без подсчетов подписок и архива, а подписка другого
+        пользователя меняет его через версию профиля.
+        """
+        susan = User(username='susan', email='susan@example.com')
+        db.session.add(susan)
+        db.session.commit()
+        etag = self.client.get('/user/susan').headers['ETag']
+        self.statements.clear()
+        response = self.client.get('/user/susan', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        counts = [s for s in self.statements if 'count(' in s and 'followers' in s]
+        self.assertFalse(counts + [s for s in self.statements if 'post_archive' in s])
+
+        david = User(username='david', email='david@example.com')
+        db.session.add(david)
+        db.session.commit()
+        self.assertTrue(david.follow(susan))
+        db.session.commit()
+        response = self.client.get('/user/susan', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'1 followers', response.data)
+
+
+
+class ExploreCacheCase(unittest.TestCase):
+    """
+    Тестовый набор для общего кэша глобальной ленты.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='john', email='john@example.com')
+        now = datetime.utcnow()
+        self.posts = [Post(body=f'post {i}', author=self.user, timestamp=now + timedelta(seconds=i))
+                      for i in range(5)]
+        db.session.add_all([self.user] + self.posts)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_pages_and_add(self):
+        """
+        Кэш отдает первые страницы и принимает новый пост в начало ленты.
+        """
+        cache = ExploreCache(size=4)
+        items, has_next = cache.page(1, 2)
+        self.assertEqual([p.id for p in items], [self.posts[4].id, self.posts[3].id])
+        self.assertTrue(has_next)
+        self.assertTrue(cache.page(2, 2)[1])
+        self.assertIsNone(cache.page(3, 2))
+
+        post = Post(body='newest', author=self.user, timestamp=datetime.utcnow() + timedelta(minutes=1))
+        db.session.add(post)
+        db.session.commit()
+        cache.add(post)
+        self.assertEqual(cache.page(1, 2)[0][0].body, 'newest')
+        self.assertEqual(cache.loads, 1)
+
+    def test_post_from_another_worker(self):
+        """
+        Снимок, в котором нет самого нового поста базы данных, загружается заново.
+        """
+        cache = ExploreCache(size=4)
+        newest_id = Post.version()[0]
+        self.assertEqual(cache.page(1, 2, newest_id)[0][0].id, newest_id)
+        # Пост опубликован в другом процессе: add() этого кэша не вызывался.
+        post = Post(body='elsewhere', author=self.user, timestamp=datetime.utcnow() + timedelta(minutes=1))
+        db.session.add(post)
+        db.session.commit()
+        self.assertEqual(cache.page(1, 2, newest_id)[0][0].body, 'post 4')
+        self.assertEqual(cache.page(1, 2, Post.version()[0])[0][0].body, 'elsewhere')
+        self.assertEqual(cache.loads, 2)
+
+    def test_singleflight(self):
+        """
+        Одновременные промахи кэша приводят только к одному запросу к базе данных.
+        """
+        cache = ExploreCache(size=4)
+        calls = []
+
+        def slow_query():
+            calls.append(1)
+            time.sleep(0.1)
+            return [], True
+
+        cache._query = slow_query
+        threads = [threading.Thread(target=cache.page, args=(1, 2)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+
+
+
+class QueryPlanCase(unittest.TestCase):
+    """
+    Тестовый набор, проверяющий через EXPLAIN QUERY PLAN, что запросы маршрутов используют составные индексы.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='john', email='john@example.com')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def explain(self, query):
+        """
+        Возвращает план выполнения запроса SQLite одной строкой.
+        """
+        compiled = query.compile(db.engine)
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        rows = db.session.connection().exec_driver_sql(
+            'EXPLAIN QUERY PLAN ' + str(compiled), params)
+        return ' | '.join(row[-1] for row in rows)
+
+    def assertUsesIndex(self, query, index):
+        """
+        Проверяет, что запрос использует индекс и не сортирует результат во временном B-дереве.
+        """
+        plan = self.explain(query)
+        self.assertIn(f'USING INDEX {index}', plan.replace('COVERING INDEX', 'INDEX'))
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_user_posts(self):
+        """
+        Лента постов в профиле пользователя.
+        """
+        query = self.user.posts.select().order_by(Post.timestamp.desc()).limit(25)
+        self.assertUsesIndex(query, 'ix_post_user_id_timestamp')
+
+    def test_messages(self):
+        """
+        Список полученных сообщений.
+        """
+        query = self.user.messages_received.select().order_by(Message.timestamp.desc()).limit(25)
+        self.assertUsesIndex(query, 'ix_message_recipient_id_timestamp')
+
+    def test_notifications(self):
+        """
+        Опрос уведомлений и замена уведомления по имени.
+        """
+        query = self.user.notifications.select().where(
+            Notification.timestamp > 0.0).order_by(Notification.timestamp.asc())
+        self.assertUsesIndex(query, 'ix_notification_user_id_timestamp')
+        query = self.user.notifications.delete().where(Notification.name == 'unread_message_count')
+        self.assertUsesIndex(query, 'ix_notification_user_id_name')
+
+    def test_followers_count(self):
+        """
+        Подсчет подписчиков пользователя.
+        """
+        query = sa.select(sa.func.count()).select_from(self.user.followers.select().subquery())
+        self.assertUsesIndex(query, 'ix_followers_followed_id_follower_id')
+
+    def test_post_version(self):
+        """
+        Маркер версии ленты и профиля читает максимумы поиском по индексу, без просмотра таблицы.
+        """
+        user_id = self.user.id
+        executed = []
+        record = lambda *args: executed.append((args[2], args[3]))
+        sa.event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            Post.version()
+            Post.version(user_id)
+        finally:
+            sa.event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(len(executed), 2)
+        for statement, parameters in executed:
+            rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+            plan = ' | '.join(row[-1] for row in rows)
+            self.assertIn('SEARCH post', plan)
+            self.assertNotIn('SCAN post', plan)
+
+
+
+class MigrationCase(unittest.TestCase):
+    """
+    Тестовый набор для цепочки миграций Alembic.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        config = type('MigrationConfig', (TestConfig,), {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.directory, 'app.db')})
+        self.app = create_app(config)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_upgrade_fresh_database(self):
+        """
+        flask db upgrade на пустой базе данных создает всю схему и строку счетчика id постов.
+        """
+        upgrade()
+        tables = set(sa.inspect(db.engine).get_table_names())
+        self.assertTrue(set(db.metadata.tables) <= tables)
+        self.assertEqual(db.session.get(PostIdCounter, 1).value, 0)
+        db.session.add(User(username='john', email='john@example.com'))
+        db.session.commit()
+        self.assertIsNotNone(db.session.scalar(sa.select(User.email_hash)))
+
+
+class ReplicaConfig(TestConfig):
+    """
+    Конфигурация с репликой базы данных в отдельном файле SQLite.
+    """
+    SQLALCHEMY_REPLICA_URIS = ['sqlite:///' + os.path.join(tempfile.gettempdir(), 'microblog-test-replica.db')]
+    REPLICA_STICKY_SECONDS = 60
+    EXPLORE_CACHE_SIZE = 0
+
+
+class ReplicaRoutingCase(unittest.TestCase):
+    """
+    Тестовый набор для маршрутизации чтений на реплику с окном "read-your-writes".
+    """
+
+    def setUp(self):
+        self.app = create_app(ReplicaConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.replica = self.app.extensions['replicas'][0]
+        db.create_all()
+        db.metadata.create_all(self.replica)
+        self.user = User(username='john', email='john@example.com')
+        db.session.add(self.user)
+        db.session.commit()
+        self.replicate()
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.metadata.drop_all(self.replica)
+        self.app_context.pop()
+
+    def replicate(self):
+        """
+        Имитирует репликацию: копирует все таблицы основной базы данных в реплику.
+        """
+        with db.engine.connect() as source, self.replica.begin() as target:
+            for table in reversed(db.metadata.sorted_tables):
+                target.execute(table.delete())
+            for table in db.metadata.sorted_tables:
+                rows = [row._asdict() for row in source.execute(table.select())]
+                if rows:
+                    target.execute(table.insert(), rows)
+
+    def test_replicas_are_not_binds(self):
+        """
+        Реплики - собственные движки маршрутизатора, а не binds: db.create_all() и миграции их не трогают.
+        """
+        self.assertNotIn(self.replica, db.engines.values())
+        self.assertFalse(self.app.config.get('SQLALCHEMY_BINDS'))
+        self.assertEqual(list(db.metadatas), [None])
+        with self.app.test_request_context('/explore'):
+            self.app.preprocess_request()
+            self.assertIs(db.session.get_bind(clause=sa.select(User)), self.replica)
+            self.assertIs(db.session.get_bind(clause=sa.delete(User)), db.engine)
+
+    def test_reads_lag_until_replicated(self):
+        """
+        Чтения идут на отстающую реплику, пока изменения не реплицированы.
+        """
+        db.session.add(Post(body='fresh post', author=self.user))
+        db.session.commit()
+        self.assertNotIn(b'fresh post', self.client.get('/user/john').data)
+        self.replicate()
+        self.assertIn(b'fresh post', self.client.get('/user/john').data)
+
+    def test_read_your_writes_after_post(self):
+        """
+        После изменяющего запроса чтения пользователя идут на основную базу данных.
+        """
+        db.session.add(Post(body='fresh post', author=self.user))
+        db.session.commit()
+        self.client.post('/follow/john')
+        self.assertIn(b'fresh post', self.client.get('/user/john').data)
+
+        with self.client.session_transaction() as sess:
+            sess['_primary_until'] = 0
+        self.assertNotIn(b'fresh post', self.client.get('/user/john').data)
+
+
+
+class MetricsCase(unittest.TestCase):
+    """
+    Тестовый набор для инструментирования SQL и маршрута /metrics.
+    """
+
+    def setUp(self):
+        class MetricsConfig(TestConfig):
+            METRICS_ENDPOINT = True
+
+        self.app = create_app(MetricsConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='john', email='john@example.com')
+        db.session.add(self.user)
+        db.session.commit()
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_endpoint_disabled_or_protected(self):
+        """
+        По умолчанию маршрута /metrics нет; с METRICS_TOKEN он требует заголовок Authorization.
+        """
+        self.assertEqual(create_app(TestConfig).test_client().get('/metrics').status_code, 404)
+        self.app.config['METRICS_TOKEN'] = 'secret'
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code, 200)
+
+    def test_failed_query_timing(self):
+        """
+        Неудачный запрос не оставляет время начала на стеке соединения.
+        """
+        with db.engine.connect() as connection:
+            with self.assertRaises(sa.exc.OperationalError):
+                connection.execute(sa.text('SELECT * FROM missing_table'))
+            self.assertEqual(connection.info['query_started'], [])
+            connection.execute(sa.text('SELECT 1'))
+            self.assertEqual(connection.info['query_started'], [])
+
+    def test_metrics_exposition(self):
+        """
+        После запроса в /metrics появляются гистограмма задержки и счетчик SQL-запросов маршрута.
+        """
+        self.client.get('/explore')
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('microblog_request_duration_seconds_bucket{endpoint="main.explore",le="+Inf"}', text)
+        self.assertRegex(text, r'microblog_sql_queries_total\{endpoint="main.explore"\} [1-9]')
+        self.assertIn('microblog_cache_hits_total{cache="fragment"}', text)
+
+    def test_slow_query_log(self):
+        """
+        Запросы дольше порога записываются в лог вместе с маршрутом.
+        """
+        self.app.config['SLOW_QUERY_SECONDS'] = 0
+        with self.assertLogs(self.app.logger, level='WARNING') as logs:
+            self.client.get('/explore')
+        self.assertIn('[main.explore]', logs.output[0])
+
+
+
+class ProfilingCase(unittest.TestCase):
+    """
+    Тестовый набор для профилирования запросов по заголовку и команд просмотра дампов.
+    """
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+
+        class ProfileConfig(TestConfig):
+            PROFILE_DIR = self.profile_dir
+            PROFILE_TOKEN = 'secret'
+            PROFILE_MAX_DUMPS = 2
+
+        self.app = create_app(ProfileConfig)
+        cli.register(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.profile_dir)
+
+    def test_profile_by_header(self):
+        """
+        Запрос с заголовком администратора сохраняет дамп, без заголовка - нет.
+        """
+        self.client.get('/auth/login')
+        self.assertEqual(list_dumps(self.profile_dir), [])
+        self.client.get('/auth/login', headers={'X-Profile': 'wrong'})
+        self.assertEqual(list_dumps(self.profile_dir), [])
+
+        self.client.get('/auth/login', headers={'X-Profile': 'secret'})
+        dumps = list_dumps(self.profile_dir)
+        self.assertEqual(len(dumps), 1)
+        self.assertIn('auth_login', dumps[0])
+
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['profile', 'list'])
+        self.assertIn('/auth/login', result.output)
+        result = runner.invoke(args=['profile', 'show', dumps[0], '--limit', '5'])
+        self.assertIn('function calls', result.output)
+        self.assertIn('Top allocations', result.output)
+
+    def test_rotation(self):
+        """
+        В каталоге остается не более PROFILE_MAX_DUMPS дампов.
+        """
+        for _ in range(4):
+            self.client.get('/auth/login', headers={'X-Profile': 'secret'})
+        self.assertEqual(len(list_dumps(self.profile_dir)), 2)
+
+    def test_tracemalloc_stopped(self):
+        """
+        Трассировка памяти выключается после последнего из одновременных профилируемых запросов
+        и после запроса, который не удалось профилировать.
+        """
+        # В этом потоке уже работает другой профилировщик (Python 3.12+ отвечает ValueError).
+        with mock.patch('app.profiling.cProfile.Profile') as profile:
+            profile.return_value.enable.side_effect = ValueError
+            self.client.get('/auth/login', headers={'X-Profile': 'secret'})
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(list_dumps(self.profile_dir), [])
+
+        _start_tracing()
+        _start_tracing()
+        _stop_tracing()
+        self.assertTrue(tracemalloc.is_tracing())
+        tracemalloc.take_snapshot()
+        _stop_tracing()
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+
+class BenchSeedCase(unittest.TestCase):
+    """
+    Тестовый набор для генератора синтетических данных и набора бенчмарков.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def follow_rows(self):
+        return db.session.execute(sa.select(followers).order_by(
+            followers.c.follower_id, followers.c.followed_id)).all()
+
+    def test_seed_is_reproducible(self):
+        """
+        Один и тот же seed дает одинаковый граф подписок, а популярность распределена неравномерно.
+        """
+        counts = seed(users=50, posts_per_user=2, follows_per_user=5, messages=20, seed_value=7)
+        self.assertEqual(db.session.scalar(sa.select(sa.func.count(Post.id))), counts['posts'])
+        first = self.follow_rows()
+        in_degree = db.session.execute(
+            sa.select(followers.c.followed_id, sa.func.count()).group_by(followers.c.followed_id)
+            .order_by(sa.func.count().desc())).all()
+        self.assertGreater(in_degree[0][1], 3 * in_degree[len(in_degree) // 2][1])
+
+        db.drop_all()
+        db.create_all()
+        seed(users=50, posts_per_user=2, follows_per_user=5, messages=20, seed_value=7)
+        self.assertEqual(self.follow_rows(), first)
+
+    def test_run_suite(self):
+        """
+        Набор бенчмарков замеряет маршруты и методы модели.
+        """
+        seed(users=20, posts_per_user=2, follows_per_user=3, messages=10)
+        results = run_suite(self.app, repeat=1)
+        self.assertIn('route:explore', results)
+        self.assertIn('model:followers_count', results)
+        self.assertGreater(results['route:index']['queries'], 0)
+        rows = compare({'results': results}, {'results': results})
+        self.assertFalse(any(row['regression'] for row in rows))
+
+
+class LoadTestCase(unittest.TestCase):
+    """
+    Тестовый набор для расчетов нагрузочного теста (benchmarks/loadtest.py).
+    """
+
+    def test_percentile(self):
+        """
+        Перцентили считаются методом ближайшего ранга; для пустой выборки - 0.
+        """
+        self.assertEqual(percentile([], 95), 0.0)
+        values = list(range(100, 0, -1))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([7.5], 99), 7.5)
+
+    def test_regressions(self):
+        """
+        Регрессией считается рост больше порога; действия без базовой линии или без
+        запросов пропускаются.
+        """
+        baseline = {'index': {'p95_ms': 10.0}, 'explore': {'p95_ms': 20.0}, 'user': {'p95_ms': 5.0}}
+        results = {
+            'index': {'count': 10, 'p95_ms': 12.0},
+            'explore': {'count': 10, 'p95_ms': 21.0},
+            'user': {'count': 0, 'p95_ms': 0.0},
+            'post': {'count': 10, 'p95_ms': 100.0},
+        }
+        self.assertEqual(regressions(baseline, results, 0.1), ['index'])
+        self.assertEqual(regressions(baseline, results, 0.5), [])
+        self.assertEqual(regressions(baseline, results, 0.01), ['index', 'explore'])
+
+
+class TransferCase(unittest.TestCase):
+    """
+    Тестовый набор для потоковой выгрузки и загрузки данных в формате JSONL.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_round_trip(self):
+        """
+        Выгруженные данные загружаются в пустую базу без потерь.
+        """
+        seed(users=30, posts_per_user=3, follows_per_user=4, messages=10)
+        before = {name: db.session.scalar(sa.select(sa.func.count()).select_from(table))
+                  for name, table in TABLES.items()}
+        post = db.session.scalar(sa.select(Post).order_by(Post.id))
+        expected = (post.id, post.body, post.timestamp, post.author.username)
+
+        stream = io.StringIO()
+        exported = export_jsonl(stream, batch_size=7)
+        self.assertEqual({name: count for name, (count, _) in exported.items()}, before)
+
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        stream.seek(0)
+        imported = import_jsonl(stream, chunk_size=16)
+        # Пустые таблицы (архив, теги) в статистике загрузки не появляются.
+        self.assertEqual({name: count for name, (count, _) in imported.items()},
+                         {name: count for name, count in before.items() if count})
+        post = db.session.get(Post, expected[0])
+        self.assertEqual((post.id, post.body, post.timestamp, post.author.username), expected)
+
+    def test_archive_round_trip(self):
+        """
+        Архивные посты, теги и упоминания переносятся вместе с остальными данными.
+        """
+        seed(users=10, posts_per_user=3, follows_per_user=2, messages=5)
+        author = db.session.scalar(sa.select(User).order_by(User.id))
+        mentioned = db.session.scalar(sa.select(User).order_by(User.id.desc()))
+        post = Post(body=f'#retro for @{mentioned.username}', author=author,
+                    timestamp=datetime.utcnow() - timedelta(days=400))
+        db.session.add(post)
+        db.session.commit()
+        tags.index_post(post)
+        db.session.commit()
+        post_id, body = post.id, post.body
+        self.assertEqual(archive_posts(datetime.utcnow() - timedelta(days=365))[0], 1)
+        before = {name: db.session.scalar(sa.select(sa.func.count()).select_from(table))
+                  for name, table in TABLES.items()}
+        self.assertEqual((before['post_archive'], before['post_tag'], before['post_mention']), (1, 1, 1))
+
+        stream = io.StringIO()
+        export_jsonl(stream)
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        stream.seek(0)
+        imported = import_jsonl(stream)
+        self.assertEqual({name: count for name, (count, _) in imported.items()}, before)
+        self.assertEqual(db.session.get(PostArchive, post_id).body, body)
+
+    def test_cli_round_trip(self):
+        """
+        Команды flask data export и import по умолчанию переносят все таблицы, включая conversation.
+        """
+        seed(users=10, posts_per_user=2, follows_per_user=2, messages=10)
+        before = {name: db.session.scalar(sa.select(sa.func.count()).select_from(table))
+                  for name, table in TABLES.items()}
+        self.assertGreater(before['conversation'], 0)
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'export.jsonl')
+            cli.register(self.app)
+            runner = self.app.test_cli_runner()
+            result = runner.invoke(args=['data', 'export', path])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            result = runner.invoke(args=['data', 'import', path])
+            self.assertEqual(result.exit_code, 0, result.output)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual({name: db.session.scalar(sa.select(sa.func.count()).select_from(table))
+                          for name, table in TABLES.items()}, before)
+
+
+
+class PostArchiveCase(unittest.TestCase):
+    """
+    Тестовый набор для архивации старых постов и чтения архива в профиле пользователя.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config['POSTS_PER_PAGE'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='john', email='john@example.com')
+        now = datetime.utcnow()
+        db.session.add_all([self.user] + [
+            Post(body=f'post {i}', author=self.user, timestamp=now - timedelta(days=10 * i))
+            for i in range(5)])
+        db.session.commit()
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_archive_and_fall_through(self):
+        """
+        Старые посты переносятся в архив, а профиль дочитывает их только за пределами горячих постов.
+        """
+        moved, _ = archive_posts(datetime.utcnow() - timedelta(days=25), batch_size=2)
+        self.assertEqual(moved, 2)
+        self.assertEqual(db.session.scalar(sa.select(sa.func.count(Post.id))), 3)
+
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        sa.event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            page1 = self.client.get('/user/john?page=1').get_data(as_text=True)
+            # Строки архива не читаются; ETag берет только счетчик архива по индексу user_id.
+            self.assertFalse([s for s in statements if 'post_archive.body' in s])
+            page2 = self.client.get('/user/john?page=2').get_data(as_text=True)
+            page3 = self.client.get('/user/john?page=3').get_data(as_text=True)
+        finally:
+            sa.event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertIn('post 0', page1)
+        self.assertIn('post 1', page1)
+        self.assertIn('post 2', page2)
+        self.assertIn('post 3', page2)
+        self.assertIn('page=3', page2)
+        self.assertIn('post 4', page3)
+        self.assertNotIn('page=4', page3)
+
+    def test_hot_posts_fill_last_page(self):
+        """
+        Если горячих постов ровно на целое число страниц, последняя из них ссылается на архив.
+        """
+        archive_posts(datetime.utcnow() - timedelta(days=15), batch_size=2)
+        page1 = self.client.get('/user/john?page=1').get_data(as_text=True)
+        self.assertIn('post 1', page1)
+        self.assertIn('page=2', page1)
+        page2 = self.client.get('/user/john?page=2').get_data(as_text=True)
+        self.assertIn('post 2', page2)
+        self.assertIn('post 3', page2)
+
+        # Без архива на последней горячей странице ссылки на следующую нет.
+        other = User(username='susan', email='susan@example.com')
+        db.session.add_all([other] + [Post(body=f'susan {i}', author=other) for i in range(2)])
+        db.session.commit()
+        self.assertNotIn('page=2', self.client.get('/user/susan?page=1').get_data(as_text=True))
+
+
+class ConversationCase(unittest.TestCase):
+    """
+    Тестовый набор для переписок с денормализованной сводкой последнего сообщения.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config['POSTS_PER_PAGE'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.users = [User(username=name, email=f'{name}@example.com')
+                      for name in ('john', 'susan', 'mary', 'david')]
+        db.session.add_all(self.users)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def send(self, sender, recipient, body):
+        message = Message(author=sender, recipient=recipient, body=body)
+        db.session.add(message)
+        db.session.flush()
+        Conversation.record(message)
+        db.session.commit()
+        return message
+
+    def test_record_and_unread(self):
+        """
+        Одна переписка на пару участников, счетчики непрочитанных ведутся по сторонам.
+        """
+        john, susan = self.users[:2]
+        self.send(susan, john, 'hi john')
+        self.send(susan, john, 'are you there?')
+        last = self.send(john, susan, 'yes')
+        conversations = db.session.scalars(sa.select(Conversation)).all()
+        self.assertEqual(len(conversations), 1)
+        conversation = conversations[0]
+        self.assertEqual(conversation.last_message_id, last.id)
+        self.assertEqual(conversation.last_body, 'yes')
+        self.assertEqual(conversation.unread_for(john), 2)
+        self.assertEqual(conversation.unread_for(susan), 1)
+        self.assertEqual(conversation.other(john), susan)
+        conversation.mark_read(john)
+        self.assertEqual(conversation.unread_for(john), 0)
+        self.assertEqual(conversation.unread_for(susan), 1)
+
+    def test_inbox_and_conversation_keyset(self):
+        """
+        Список переписок и сообщения переписки листаются по курсору, новые первыми.
+        """
+        john, susan, mary, david = self.users
+        self.send(susan, john, 'from susan')
+        self.send(john, mary, 'to mary')
+        self.send(david, john, 'from david')
+        self.send(susan, mary, 'not for john')
+
+        inbox = Conversation.inbox(john, limit=2)
+        self.assertEqual([c.other(john) for c in inbox], [david, mary, susan])
+        rest = Conversation.inbox(john, before=inbox[1].last_message_id, limit=2)
+        self.assertEqual([c.other(john) for c in rest], [susan])
+
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(john.id)
+        page = client.get('/messages').get_data(as_text=True)
+        self.assertIn('from david', page)
+        self.assertIn('to mary', page)
+        self.assertNotIn('from susan', page)
+        self.assertIn('before={}'.format(inbox[1].last_message_id), page)
+
+        for i in range(3):
+            self.send(susan, john, f'more {i}')
+        page = client.get('/messages/susan').get_data(as_text=True)
+        self.assertIn('more 2', page)
+        self.assertNotIn('from susan', page)
+        self.assertEqual(Conversation.between(john.id, susan.id).unread_for(john), 0)
+
+    def test_inbox_query_count(self):
+        """
+        Список переписок загружает собеседников пачкой: число запросов не зависит от числа переписок.
+        """
+        john = self.users[0]
+        others = [User(username=f'user{i}', email=f'user{i}@example.com') for i in range(5)]
+        db.session.add_all(others)
+        db.session.commit()
+        for other in self.users[1:] + others:
+            self.send(other, john, f'from {other.username}')
+        john_id = john.id
+        db.session.remove()
+        john = db.session.get(User, john_id)
+
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        sa.event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            names = [c.other(john).username for c in Conversation.inbox(john)]
+        finally:
+            sa.event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(len(names), 8)
+        self.assertLessEqual(len(statements), 4)
+
+    def test_rebuild(self):
+        """
+        Переписки восстанавливаются для сообщений, отправленных до появления таблицы.
+        """
+        john, susan = self.users[:2]
+        db.session.add_all([Message(author=susan, recipient=john, body=f'old {i}') for i in range(3)])
+        db.session.commit()
+        self.assertEqual(Conversation.rebuild(batch_size=2), 3)
+        conversation = Conversation.between(john.id, susan.id)
+        self.assertEqual(conversation.last_body, 'old 2')
+        self.assertEqual(conversation.unread_for(john), 3)
+        self.assertEqual(Conversation.rebuild(), 0)
+
+
+class NotificationPruneCase(unittest.TestCase):
+    """
+    Тестовый набор для удаления просроченных уведомлений.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_prune(self):
+        """
+        Сроки хранения применяются по именам уведомлений, дубликаты уплотняются до самого нового.
+        """
+        john = User(username='john', email='john@example.com')
+        susan = User(username='susan', email='susan@example.com')
+        db.session.add_all([john, susan])
+        now = 100000.0
+        db.session.add_all([
+            Notification(name='unread_message_count', user=john, timestamp=now - 50, payload_json='1'),
+            Notification(name='unread_message_count', user=susan, timestamp=now - 500, payload_json='2'),
+            Notification(name='task_progress', user=john, timestamp=now - 500, payload_json='{}'),
+            Notification(name='task_progress', user=susan, timestamp=now - 5000, payload_json='{}'),
+            Notification(name='task_progress', user=susan, timestamp=now - 20, payload_json='{}'),
+        ])
+        db.session.commit()
+
+        removed, seconds = prune_notifications({'unread_message_count': 100}, default=1000,
+                                               batch_size=1, now=now)
+        self.assertEqual(removed, {'unread_message_count': 1, 'task_progress': 1})
+        self.assertGreaterEqual(seconds, 0)
+        left = db.session.execute(sa.select(Notification.user_id, Notification.name)
+                                  .order_by(Notification.id)).all()
+        self.assertEqual(left, [(john.id, 'unread_message_count'), (john.id, 'task_progress'),
+                                (susan.id, 'task_progress')])
+
+        db.session.add(Notification(name='task_progress', user=john, timestamp=now, payload_json='{}'))
+        db.session.commit()
+        removed, _ = prune_notifications({}, default=None, now=now)
+        self.assertEqual(removed, {DUPLICATES: 1})
+
+
+class SuggestionCase(unittest.TestCase):
+    """
+    Тестовый набор для рекомендаций "на кого подписаться".
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_follow_graph(self):
+        """
+        Кандидаты упорядочены по числу общих подписок, подписки и сам пользователь исключены.
+        """
+        edges = [(1, 2), (1, 3), (2, 4), (3, 4), (2, 5), (3, 1), (4, 5), (6, 5)]
+        src, dst = (np.array(column) for column in zip(*edges))
+        graph = FollowGraph.from_edges(src, dst, 7)
+        self.assertEqual(graph.following(1).tolist(), [2, 3])
+        candidates, scores = graph.suggest(1, 10)
+        self.assertEqual(candidates.tolist(), [4, 5])
+        self.assertEqual(scores.astype(int).tolist(), [2, 1])
+        users, candidates, _, ranks = graph.suggest_many(np.array([3, 1, 6, 99]), 1)
+        self.assertEqual(list(zip(users.tolist(), candidates.tolist(), ranks.tolist())),
+                         [(1, 4, 0), (3, 5, 0)])
+
+    def test_compute_and_sidebar(self):
+        """
+        Рекомендации сохраняются в таблицу и выводятся в профиле без уже оформленных подписок.
+        """
+        users = [User(username=name, email=f'{name}@example.com')
+                 for name in ('john', 'susan', 'mary', 'david')]
+        db.session.add_all(users)
+        john, susan, mary, david = users
+        john.follow(susan)
+        susan.follow(mary)
+        susan.follow(david)
+        mary.follow(david)
+        db.session.commit()
+
+        stats = compute_suggestions(k=5, batch_size=2)
+        self.assertEqual(stats['edges'], 4)
+        self.assertEqual(stats['users'], 4)
+        self.assertEqual(john.suggested_users(), [david, mary])
+
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(john.id)
+        page = client.get('/user/john').get_data(as_text=True)
+        self.assertIn('/user/mary', page)
+        john.follow(david)
+        db.session.commit()
+        self.assertEqual(john.suggested_users(), [mary])
+
+
+class FollowStatementCase(unittest.TestCase):
+    """
+    Тестовый набор для подписки и отписки одним запросом.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.users = [User(username=f'user{i}', email=f'user{i}@example.com') for i in range(5)]
+        db.session.add_all(self.users)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_follow_is_idempotent(self):
+        """
+        Повторная подписка и отписка не выполняют SELECT и не нарушают первичный ключ.
+        """
+        john, susan = self.users[:2]
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        sa.event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.assertTrue(john.follow(susan))
+            self.assertFalse(john.follow(susan))
+            db.session.commit()
+            self.assertTrue(john.unfollow(susan))
+            self.assertFalse(john.unfollow(susan))
+            db.session.commit()
+        finally:
+            sa.event.remove(db.engine, 'before_cursor_execute', record)
+        statements = [s.lstrip().split()[0].upper() for s in statements if 'followers' in s]
+        self.assertEqual(statements, ['INSERT', 'INSERT', 'DELETE', 'DELETE'])
+        self.assertFalse(john.is_following(susan))
+
+    def test_follow_many(self):
+        """
+        Массовая подписка пропускает себя и существующие подписки.
+        """
+        john = self.users[0]
+        john.follow(self.users[1])
+        created = john.follow_many([u.id for u in self.users], chunk_size=2)
+        db.session.commit()
+        self.assertEqual(created, 3)
+        self.assertEqual(john.following_count(), 4)
+        self.assertFalse(john.is_following(john))
+
+
+class ApiCase(unittest.TestCase):
+    """
+    Тестовый набор для JSON API с авторизацией по токену.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config['POSTS_PER_PAGE'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.john = User(username='john', email='john@example.com')
+        self.john.set_password('cat')
+        self.susan = User(username='susan', email='susan@example.com')
+        self.mary = User(username='mary', email='mary@example.com')
+        db.session.add_all([self.john, self.susan, self.mary])
+        now = datetime.utcnow()
+        self.posts = [Post(body=f'post {i}', author=(self.john, self.susan, self.mary)[i % 3],
+                           timestamp=now + timedelta(seconds=i)) for i in range(6)]
+        db.session.add_all(self.posts)
+        db.session.commit()
+        self.john.follow(self.susan)
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url):
+        token = self.client.post('/api/tokens', auth=('john', 'cat')).get_json()['token']
+        return self.client.get(url, headers={'Authorization': f'Bearer {token}'})
+
+    def test_auth(self):
+        """
+        Без токена и с неверным паролем возвращается 401 в формате JSON.
+        """
+        response = self.client.get('/api/explore')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.headers['WWW-Authenticate'], 'Bearer')
+        self.assertEqual(response.get_json()['error'], 'Unauthorized')
+        self.assertEqual(self.client.post('/api/tokens', auth=('john', 'dog')).status_code, 401)
+
+    def test_timeline_keyset(self):
+        """
+        Лента содержит посты пользователя и его подписок и листается курсором по id.
+        """
+        page = self.get('/api/timeline').get_json()
+        self.assertEqual([item['body'] for item in page['items']], ['post 4', 'post 3'])
+        self.assertEqual(page['items'][0]['author']['username'], 'susan')
+        self.assertNotIn('email', page['items'][0]['author'])
+        page = self.get(page['next']).get_json()
+        self.assertEqual([item['body'] for item in page['items']], ['post 1', 'post 0'])
+        self.assertIsNone(page['next'])
+
+    def test_user_archive_fall_through(self):
+        """
+        Страницы постов профиля за пределами горячих постов дочитываются из архива.
+        """
+        david = User(username='david', email='david@example.com')
+        db.session.add_all([david] + [Post(body=f'old {i}', author=david,
+                                           timestamp=datetime.utcnow() - timedelta(days=30, seconds=10 - i))
+                                      for i in range(4)])
+        db.session.commit()
+        db.session.add_all([Post(body=f'new {i}', author=david) for i in range(2)])
+        db.session.commit()
+        archive_posts(datetime.utcnow() - timedelta(days=10))
+        pages = []
+        page = self.get('/api/users/david').get_json()['posts']
+        while True:
+            pages.append([item['body'] for item in page['items']])
+            if page['next'] is None:
+                break
+            page = self.get(page['next']).get_json()['posts']
+        self.assertEqual(pages, [['new 1', 'new 0'], ['old 3', 'old 2'], ['old 1', 'old 0']])
+
+    def test_user_and_multi_get(self):
+        """
+        Профиль возвращает счетчики одним ответом, пакетный запрос сохраняет порядок id.
+        """
+        data = self.get('/api/users/susan').get_json()
+        self.assertEqual((data['followers_count'], data['following_count'], data['is_following']),
+                         (1, 0, True))
+        self.assertEqual([item['body'] for item in data['posts']['items']], ['post 4', 'post 1'])
+        self.assertTrue(data['avatar'].startswith('http://localhost/avatar/'))
+        self.assertTrue(data['posts']['items'][0]['author']['avatar'].startswith('http://localhost/avatar/'))
+        self.assertEqual(self.get('/api/users/nobody').status_code, 404)
+
+        ids = [self.posts[5].id, 999, self.posts[0].id]
+        archive_posts(datetime.utcnow() + timedelta(seconds=1), batch_size=10)
+        data = self.get('/api/posts?ids=' + ','.join(map(str, ids))).get_json()
+        self.assertEqual([item['body'] for item in data['items']], ['post 5', 'post 0'])
+        self.assertEqual(self.get('/api/posts?ids=1,x').status_code, 400)
+        self.assertEqual(self.get('/api/posts?ids=%C2%B2').status_code, 400)
+
+
+class AdmissionConfig(TestConfig):
+    """
+    Конфигурация с малыми лимитами поиска.
+    """
+    RATE_LIMITS = {'main.search': (0.01, 2)}
+    ROUTE_RATE_LIMITS = {}
+    CONCURRENCY_LIMITS = {'main.search': 1}
+
+
+class AdmissionCase(unittest.TestCase):
+    """
+    Тестовый набор для контроля допуска: лимиты частоты и одновременности.
+    """
+
+    def setUp(self):
+        self.app = create_app(AdmissionConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def client_for(self, user_id):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+        return client
+
+    def test_token_buckets(self):
+        """
+        Корзина выдает burst маркеров подряд и пополняется со скоростью rate.
+        """
+        buckets = TokenBuckets(rate=2.0, burst=2, maxsize=2)
+        self.assertEqual(buckets.take('a', now=0.0), 0)
+        self.assertEqual(buckets.take('a', now=0.0), 0)
+        self.assertAlmostEqual(buckets.take('a', now=0.0), 0.5)
+        self.assertEqual(buckets.take('a', now=0.5), 0)
+        buckets.take('b', now=0.5)
+        buckets.take('c', now=0.5)
+        self.assertEqual(len(buckets._buckets), 2)
+
+    def test_user_rate_limit(self):
+        """
+        Пользователь сверх своего лимита получает 429 с Retry-After, остальные не затронуты.
+        """
+        u1 = User(username='john', email='john@example.com')
+        u2 = User(username='susan', email='susan@example.com')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        client = self.client_for(u1.id)
+        self.assertNotEqual(client.get('/search?q=x').status_code, 429)
+        self.assertNotEqual(client.get('/search?q=x').status_code, 429)
+        response = client.get('/search?q=x')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '100')
+        self.assertNotEqual(self.client_for(u2.id).get('/search?q=x').status_code, 429)
+        # Маршруты без лимитов не затронуты.
+        self.assertEqual(client.get('/explore').status_code, 200)
+        self.assertIn('microblog_admission_rejections_total{endpoint="main.search",reason="user_rate"}',
+                      self.app.extensions['metrics'].render())
+
+    def test_concurrency_limit(self):
+        """
+        Сверх лимита одновременных запросов маршрут отвечает 503, пока слот не освободится.
+        """
+        limiter = Limiter({}, {'route': (1000.0, 1000)}, {'route': 1}, retry_after=2)
+        self.assertIsNone(limiter.admit('route', 'a'))
+        self.assertEqual(limiter.admit('route', 'b'), (503, 2, 'concurrency'))
+        limiter.release('route')
+        self.assertIsNone(limiter.admit('route', 'b'))
+        self.assertIsNone(limiter.admit('other', 'b'))
+
+
+class LoggingCase(unittest.TestCase):
+    """
+    Тестовый набор для неблокирующего логирования в формате JSON.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.handlers = list(self.app.logger.handlers)
+        self.level = self.app.logger.level
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        stop_logging(self.app)
+        self.app.logger.handlers = self.handlers
+        self.app.logger.setLevel(self.level)
+        shutil.rmtree(self.tmpdir)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_request_id(self):
+        """
+        Ответ содержит идентификатор запроса; корректный идентификатор от прокси сохраняется.
+        """
+        client = self.app.test_client()
+        generated = client.get('/auth/login').headers['X-Request-ID']
+        self.assertRegex(generated, r'^[0-9a-f]{32}$')
+        self.assertEqual(client.get('/auth/login', headers={'X-Request-ID': 'abc-1'})
+                         .headers['X-Request-ID'], 'abc-1')
+        for bad in ('a b', 'x' * 65):
+            self.assertNotEqual(client.get('/auth/login', headers={'X-Request-ID': bad})
+                                .headers['X-Request-ID'], bad)
+
+    def test_json_log_lines(self):
+        """
+        Записи пишутся в файл потоком QueueListener строками JSON с данными запроса.
+        """
+        path = os.path.join(self.tmpdir, 'microblog.log')
+        self.app.config['LOG_FILE'] = path
+        listener = start_logging(self.app)
+        self.addCleanup(listener.handlers[0].close)
+
+        @self.app.route('/boom')
+        def boom():
+            try:
+                1 / 0
+            except ZeroDivisionError:
+                self.app.logger.exception('boom failed')
+            return 'ok'
+
+        self.app.test_client().get('/boom', headers={'X-Request-ID': 'req-42'})
+        stop_logging(self.app)
+        with open(path, encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f]
+        error, access = entries
+        self.assertEqual((error['message'], error['level'], error['request_id']),
+                         ('boom failed', 'ERROR', 'req-42'))
+        self.assertIn('ZeroDivisionError', error['exception'])
+        self.assertEqual((access['status'], access['path'], access['request_id']), (200, '/boom', 'req-42'))
+        self.assertIn('duration_ms', access)
+
+    def test_rate_limited_email(self):
+        """
+        Повторы ошибки из того же места в течение интервала не отправляются, а подсчитываются.
+        """
+        handler = RateLimitedSMTPHandler(mailhost='localhost', fromaddr='a@example.com',
+                                         toaddrs=['b@example.com'], subject='Failure', interval=60)
+        record = logging.makeLogRecord({'msg': 'failed', 'pathname': 'x.py', 'lineno': 1,
+                                        'levelno': logging.ERROR})
+        with mock.patch.object(SMTPHandler, 'emit') as emit, mock.patch('app.logs.monotonic') as now:
+            now.return_value = 0
+            for _ in range(3):
+                handler.emit(record)
+            handler.emit(logging.makeLogRecord({'msg': 'other', 'pathname': 'y.py', 'lineno': 1}))
+            now.return_value = 61
+            handler.emit(record)
+        self.assertEqual([call.args[0].getMessage() for call in emit.call_args_list],
+                         ['failed', 'other', 'failed\n\n(2 more in the last 60 s not sent)'])
+
+
+SHARD_KEYS = ['posts0', 'posts1', 'posts2']
+
+
+class ShardConfig(TestConfig):
+    """
+    Конфигурация с таблицей post, распределенной по трем файлам SQLite.
+    """
+    SQLALCHEMY_BINDS = {key: 'sqlite:///' + os.path.join(tempfile.gettempdir(), f'microblog-test-{key}.db')
+                        for key in SHARD_KEYS}
+    POST_SHARDS = SHARD_KEYS
+    EXPLORE_CACHE_SIZE = 0
+    POSTS_PER_PAGE = 4
+
+
+class ShardingCase(unittest.TestCase):
+    """
+    Тестовый набор для шардирования постов по user_id.
+    """
+
+    def setUp(self):
+        self.app = create_app(ShardConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        create_shards()
+        self.users = [User(username=f'user{i}', email=f'user{i}@example.com') for i in range(6)]
+        db.session.add_all(self.users)
+        db.session.commit()
+        now = datetime.utcnow()
+        self.posts = []
+        for i in range(12):
+            post = Post(body=f'post {i}', author=self.users[i % 6], timestamp=now + timedelta(seconds=i))
+            db.session.add(post)
+            db.session.commit()
+            self.posts.append(post)
+        self.users[0].follow(self.users[1])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        for key in SHARD_KEYS:
+            shard_metadata().drop_all(db.engines[key])
+            # init_app() регистрирует пустые метаданные для каждого bind, и create_all() других
+            # приложений без этих bind завершился бы ошибкой.
+            db.metadatas.pop(key, None)
+        self.app_context.pop()
+
+    def shard_rows(self, key=None):
+        with db.engines[key].connect() as connection:
+            return connection.execute(sa.select(Post.__table__).order_by(Post.id)).all()
+
+    def assertPlaced(self, keys):
+        shards = ShardMap(keys)
+        self.assertEqual(self.shard_rows(), [])
+        placed = 0
+        for key in SHARD_KEYS:
+            for row in self.shard_rows(key):
+                self.assertEqual(shards.shard_for(row.user_id), key)
+                placed += 1
+        self.assertEqual(placed, len(self.posts))
+
+    def client_for(self, user):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user.id)
+        return client
+
+    def test_posts_written_to_owner_shard(self):
+        """
+        Посты сохраняются на шард автора с возрастающими id из общего счетчика.
+        """
+        self.assertPlaced(SHARD_KEYS)
+        self.assertGreater(len({self.app.extensions['shards'].shard_for(u.id) for u in self.users}), 1)
+        ids = [post.id for post in self.posts]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(db.session.get(PostIdCounter, 1).value, ids[-1])
+        self.assertEqual(Post.version(), (ids[-1], self.posts[-1].timestamp))
+        self.assertEqual(Post.version(self.users[2].id)[0], self.posts[8].id)
+
+    def test_scatter_gather_pages(self):
+        """
+        Глобальная лента, лента подписок и профиль собираются со всех шардов в порядке времени.
+        """
+        client = self.client_for(self.users[0])
+        bodies = []
+        for page in (1, 2, 3):
+            html = client.get(f'/explore?page={page}').get_data(as_text=True)
+            bodies += [f'post {i}' for i in range(11, -1, -1) if f'post {i}<' in html]
+        self.assertEqual(bodies, [f'post {i}' for i in range(11, -1, -1)])
+
+        self.users[0].follow(self.users[2])
+        db.session.commit()
+        html = client.get('/index').get_data(as_text=True)
+        self.assertEqual([i for i in range(12) if f'post {i}<' in html], [2, 6, 7, 8])
+        html = client.get('/index?page=2').get_data(as_text=True)
+        self.assertEqual([i for i in range(12) if f'post {i}<' in html], [0, 1])
+
+        html = client.get('/user/user3').get_data(as_text=True)
+        self.assertEqual([i for i in range(12) if f'post {i}<' in html], [3, 9])
+
+    def test_api_keyset_and_multiget(self):
+        """
+        API листает посты шардов по id и получает посты по списку id.
+        """
+        token = self.users[0].get_api_token()
+        headers = {'Authorization': f'Bearer {token}'}
+        client = self.app.test_client()
+        page = client.get('/api/explore?limit=5', headers=headers).get_json()
+        ids = [item['id'] for item in page['items']]
+        page = client.get(page['next'], headers=headers).get_json()
+        ids += [item['id'] for item in page['items']]
+        self.assertEqual(ids, [post.id for post in reversed(self.posts)][:10])
+        wanted = [self.posts[5].id, self.posts[0].id, 10 ** 6]
+        items = client.get('/api/posts?ids=' + ','.join(map(str, wanted)), headers=headers).get_json()['items']
+        self.assertEqual([(item['id'], item['author']['username']) for item in items],
+                         [(self.posts[5].id, 'user5'), (self.posts[0].id, 'user0')])
+
+    def test_rebalance(self):
+        """
+        Перебалансировка переносит посты из основной базы данных и после изменения списка шардов.
+        """
+        # Посты, созданные до включения шардирования.
+        legacy = [{'id': 1000 + i, 'body': f'legacy {i}', 'timestamp': datetime.utcnow(),
+                   'user_id': self.users[i].id, 'language': None} for i in range(6)]
+        with db.engines[None].begin() as connection:
+            connection.execute(sa.insert(Post.__table__), legacy)
+        self.posts += legacy
+        moved, _ = rebalance(batch_size=4)
+        self.assertEqual(sum(count for direction, count in moved.items()
+                             if direction.startswith('default')), 6)
+        self.assertPlaced(SHARD_KEYS)
+        self.assertEqual(db.session.get(PostIdCounter, 1).value, 1005)
+
+        self.app.extensions['shards'] = ShardMap(SHARD_KEYS[:2])
+        moved, _ = rebalance(batch_size=4)
+        self.assertEqual(set(direction.split(' -> ')[0] for direction in moved), {'posts2'})
+        self.assertEqual(self.shard_rows('posts2'), [])
+        self.assertPlaced(SHARD_KEYS[:2])
+        self.assertEqual(rebalance()[0], {})
+
+    def test_id_allocation(self):
+        """
+        Id выделяются отдельной транзакцией, блоками по POST_ID_BLOCK_SIZE; счетчик создается при отсутствии.
+        """
+        top = self.posts[-1].id
+        post = Post(body='pending', author=self.users[0])
+        db.session.add(post)
+        db.session.flush()
+        # Выделение уже зафиксировано, хотя транзакция поста еще открыта.
+        with db.engines[None].connect() as connection:
+            self.assertEqual(connection.scalar(sa.select(PostIdCounter.value)), top + 1)
+        db.session.rollback()
+
+        self.app.config['POST_ID_BLOCK_SIZE'] = 10
+        self.app.extensions.pop('post_id_blocks', None)
+        posts = [Post(body=f'block {i}', author=self.users[i]) for i in range(3)]
+        db.session.add_all(posts)
+        db.session.commit()
+        self.assertEqual([p.id for p in posts], [top + 2, top + 3, top + 4])
+        self.assertEqual(db.session.get(PostIdCounter, 1).value, top + 11)
+
+        db.session.execute(sa.delete(PostIdCounter))
+        db.session.commit()
+        self.assertEqual(list(allocate_post_ids(2)), [top + 5, top + 6])
+
+    def test_import_routes_posts(self):
+        """
+        Загрузка выгрузки записывает посты на шарды авторов и подтягивает счетчик id.
+        """
+        top = self.posts[-1].id
+        stream = io.StringIO()
+        self.assertEqual(export_jsonl(stream)['post'][0], len(self.posts))
+        db.session.remove()
+        db.drop_all()
+        for key in SHARD_KEYS:
+            shard_metadata().drop_all(db.engines[key])
+        db.create_all()
+        stream.seek(0)
+        import_jsonl(stream)
+        self.assertPlaced(SHARD_KEYS)
+        self.assertEqual(db.session.get(PostIdCounter, 1).value, top)
+
+    def test_archive(self):
+        """
+        Архивация переносит старые посты со всех шардов в post_archive.
+        """
+        ids = [post.id for post in self.posts]
+        moved, _ = archive_posts(self.posts[5].timestamp + timedelta(microseconds=1), batch_size=2)
+        self.assertEqual(moved, 6)
+        self.assertEqual(sorted(db.session.scalars(sa.select(PostArchive.id))), ids[:6])
+        remaining = sorted(row.id for key in SHARD_KEYS for row in self.shard_rows(key))
+        self.assertEqual(remaining, ids[6:])
+
+
+class AvatarCase(unittest.TestCase):
+    """
+    Тестовый набор для локальных аватаров (identicon) и их дискового кэша.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app(TestConfig)
+        self.app.config['AVATAR_CACHE_DIR'] = self.app.avatar_cache.directory = self.directory
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_render_identicon(self):
+        """
+        Identicon - корректный PNG нужного размера, одинаковый для одного хеша и разный для разных.
+        """
+        png = render_identicon('d4c74594d841139328695756648b6bd6', 70)
+        self.assertTrue(png.startswith(b'\x89PNG\r\n\x1a\n'))
+        self.assertEqual(png[16:24], (70).to_bytes(4, 'big') * 2)
+        self.assertEqual(png, render_identicon('d4c74594d841139328695756648b6bd6', 70))
+        self.assertNotEqual(png, render_identicon('0' * 32, 70))
+
+    def test_route_and_cache(self):
+        """
+        Маршрут отдает неизменяемый PNG и сохраняет его в кэш; неверный хеш или размер - 404.
+        """
+        client = self.app.test_client()
+        user = User(username='john', email='John@example.com')
+        db.session.add(user)
+        db.session.commit()
+        self.assertEqual(user.email_hash, 'd4c74594d841139328695756648b6bd6')
+        with self.app.test_request_context():
+            url = user.avatar(70)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertNotIn('Set-Cookie', response.headers)
+        path = self.app.avatar_cache.path('d4c74594d841139328695756648b6bd6', 70)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), response.data)
+
+        self.assertEqual(client.get(url, headers={'If-None-Match': response.headers['ETag']})
+                         .status_code, 304)
+        self.assertEqual(client.get('/avatar/not-a-digest/70').status_code, 404)
+        self.assertEqual(client.get('/avatar/d4c74594d841139328695756648b6bd6/4096').status_code, 404)
+        self.assertEqual(client.get('/avatar/d4c74594d841139328695756648b6bd6/71').status_code, 404)
+
+        # Хеш, не принадлежащий пользователю, отрисовывается, но в кэш не попадает.
+        response = client.get('/avatar/' + '0' * 32 + '/70')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, render_identicon('0' * 32, 70))
+        self.assertFalse(os.path.exists(self.app.avatar_cache.path('0' * 32, 70)))
+
+    def test_email_hash_bulk_insert(self):
+        """
+        Хеш адреса заполняется и при вставке строк через таблицу, минуя ORM.
+        """
+        db.session.execute(sa.insert(User.__table__), [{'username': 'john', 'email': 'John@example.com'}])
+        db.session.commit()
+        self.assertEqual(db.session.scalar(sa.select(User.email_hash)), 'd4c74594d841139328695756648b6bd6')
+
+    def test_cache_size_limit(self):
+        """
+        Кэш удаляет самые старые файлы, когда его размер превышает лимит.
+        """
+        size = len(render_identicon('0' * 32, 64))
+        cache = AvatarCache(self.directory, max_bytes=size * 5)
+        for i in range(20):
+            cache.get(f'{i:032x}', 64)
+        files = [os.path.join(root, name) for root, _, names in os.walk(self.directory) for name in names]
+        self.assertLessEqual(sum(os.path.getsize(path) for path in files), size * 5)
+        self.assertTrue(os.path.exists(cache.path(f'{19:032x}', 64)))
+
+    def test_prerender(self):
+        """
+        Пакетная отрисовка создает аватары всех пользователей в заданных размерах.
+        """
+        db.session.add_all([User(username='john', email='john@example.com'),
+                            User(username='susan', email='susan@example.com')])
+        db.session.commit()
+        rendered, _ = prerender(self.app.avatar_cache, [70, 256])
+        self.assertEqual(rendered, 4)
+        self.assertTrue(os.path.exists(self.app.avatar_cache.path('d4c74594d841139328695756648b6bd6', 256)))
+        self.assertEqual(prerender(self.app.avatar_cache, [70, 256])[0], 0)
+
+
+class HoverCardCase(unittest.TestCase):
+    """
+    Тестовый набор для пачечной загрузки карточек пользователей.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.john = User(username='john', email='john@example.com')
+        self.susan = User(username='susan', email='susan@example.com', about_me='hi')
+        self.mary = User(username='mary', email='mary@example.com')
+        db.session.add_all([self.john, self.susan, self.mary])
+        db.session.commit()
+        self.john.follow(self.susan)
+        self.mary.follow(self.susan)
+        db.session.add(Post(body='hello', author=self.susan))
+        db.session.commit()
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.john.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_batch_cards(self):
+        """
+        Один запрос возвращает карточки всех авторов с состоянием подписки и заголовками кэширования.
+        """
+        response = self.client.get('/users/cards?u=susan&u=mary&u=john&u=nobody')
+        self.assertEqual(response.status_code, 200)
+        cards = response.get_json()['cards']
+        self.assertEqual(sorted(cards), ['john', 'mary', 'susan'])
+        self.assertEqual((cards['susan']['followers'], cards['susan']['following']), (2, 0))
+        self.assertEqual(cards['susan']['about_me'], 'hi')
+        with self.app.test_request_context():
+            self.assertEqual(cards['susan']['avatar'], self.susan.avatar(64))
+        self.assertTrue(cards['susan']['is_following'])
+        self.assertFalse(cards['mary']['is_following'])
+        self.assertTrue(cards['john']['is_self'])
+        self.assertTrue(response.cache_control.private)
+        self.assertEqual(response.cache_control.max_age, 30)
+
+        hits = self.app.hover_cards.hits
+        again = self.client.get('/users/cards?u=susan&u=mary&u=john&u=nobody',
+                                headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.app.hover_cards.hits, hits + 3)
+
+    def test_follow_invalidates_cards(self):
+        """
+        Подписка сбрасывает карточки участников и меняет версию подписок страницы.
+        """
+        before = self.client.get('/users/cards?u=mary').get_json()['cards']['mary']
+        self.assertEqual(before['followers'], 0)
+        self.client.post('/follow/mary')
+        with self.client.session_transaction() as sess:
+            self.assertEqual(sess['follow_version'], 1)
+        after = self.client.get('/users/cards?u=mary').get_json()['cards']['mary']
+        self.assertEqual(after['followers'], 1)
+        self.assertTrue(after['is_following'])
+        html = self.client.get('/explore').get_data(as_text=True)
+        self.assertIn('data-username="susan"', html)
+        self.assertIn("new URLSearchParams({v: 1})", html)
+
+
+class TagCase(unittest.TestCase):
+    """
+    Тестовый набор для индекса хэштегов и упоминаний и лент по ним.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config.update(WTF_CSRF_ENABLED=False, POSTS_PER_PAGE=2)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.john = User(username='john', email='john@example.com')
+        self.susan = User(username='susan', email='susan@example.com')
+        db.session.add_all([self.john, self.susan])
+        db.session.commit()
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.john.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_extract(self):
+        """
+        Хэштеги приводятся к нижнему регистру; адреса почты и '#' внутри слова не учитываются.
+        """
+        self.assertEqual(extract('Hi #Flask and #flask, @susan! me@example.com a#b &#39; #dev_ops'),
+                         ({'flask', 'dev_ops'}, {'susan'}))
+
+    def test_new_post_indexed(self):
+        """
+        Пост, опубликованный на главной странице, сразу попадает в post_tag и post_mention.
+        """
+        self.client.post('/index', data={'post': 'Learning #Flask with @susan and @nobody'})
+        post = db.session.scalar(sa.select(Post))
+        self.assertEqual([(row.tag, row.post_id) for row in db.session.scalars(sa.select(PostTag))],
+                         [('flask', post.id)])
+        self.assertEqual([(row.user_id, row.post_id) for row in db.session.scalars(sa.select(PostMention))],
+                         [(self.susan.id, post.id)])
+
+    def test_backfill_and_keyset_pages(self):
+        """
+        Backfill индексирует существующие посты, а ленты листаются курсором без пропусков и повторов.
+        """
+        now = datetime.utcnow()
+        # Два поста с одинаковым временем: порядок между ними задает id.
+        for i, minutes in enumerate([5, 4, 3, 3, 1]):
+            db.session.add(Post(body=f'post {i} #flask @susan', author=self.john,
+                                timestamp=now - timedelta(minutes=minutes)))
+        db.session.add(Post(body='post 5 #django', author=self.john, timestamp=now))
+        db.session.commit()
+        totals, _ = backfill(batch_size=2, workers=2)
+        self.assertEqual(totals, {'posts': 6, 'tags': 6, 'mentions': 5})
+        backfill(batch_size=4, workers=1)
+        self.assertEqual(db.session.scalar(sa.select(sa.func.count()).select_from(PostTag)), 6)
+
+        seen, url = [], '/tag/Flask'
+        while url:
+            html = self.client.get(url).get_data(as_text=True)
+            seen += sorted((i for i in range(6) if f'post {i} ' in html), key=lambda i: html.index(f'post {i} '))
+            next_link = html.split('Older posts')[0].rsplit('href="', 1)[1].split('"')[0]
+            url = next_link.replace('&amp;', '&') if 'before=' in next_link else None
+        self.assertEqual(seen, [4, 3, 2, 1, 0])
+
+        headers = {'Authorization': f'Bearer {self.john.get_api_token()}'}
+        page = self.client.get('/api/users/susan/mentions?limit=3', headers=headers).get_json()
+        ids = [item['id'] for item in page['items']]
+        page = self.client.get(page['next'], headers=headers).get_json()
+        ids += [item['id'] for item in page['items']]
+        self.assertIsNone(page['next'])
+        self.assertEqual([db.session.get(Post, post_id).body[:6] for post_id in ids],
+                         ['post 4', 'post 3', 'post 2', 'post 1', 'post 0'])
+        self.assertEqual(self.client.get('/api/tags/flask?before=bad', headers=headers).status_code, 400)
+
+    def test_archived_posts(self):
+        """
+        Ленты хэштега и упоминаний показывают архивные посты, а backfill индексирует архив.
+        """
+        now = datetime.utcnow()
+        for i in range(3):
+            db.session.add(Post(body=f'post {i} #foo @susan', author=self.john,
+                                timestamp=now - timedelta(days=10 + i)))
+        db.session.commit()
+        backfill()
+        archive_posts(now - timedelta(days=5))
+        self.assertEqual(db.session.scalar(sa.select(sa.func.count(Post.id))), 0)
+
+        html = self.client.get('/tag/foo').get_data(as_text=True)
+        self.assertIn('post 0 ', html)
+        self.assertIn('post 1 ', html)
+        html = self.client.get(html.split('Older posts')[0].rsplit('href="', 1)[1].split('"')[0]
+                               .replace('&amp;', '&')).get_data(as_text=True)
+        self.assertIn('post 2 ', html)
+        html = self.client.get('/mentions/susan').get_data(as_text=True)
+        self.assertIn('post 0 ', html)
+
+        db.session.execute(sa.delete(PostTag))
+        db.session.execute(sa.delete(PostMention))
+        db.session.commit()
+        totals, _ = backfill(batch_size=2)
+        self.assertEqual(totals, {'posts': 3, 'tags': 3, 'mentions': 3})
+
+
+class StubSearch:
+    """
+    Асинхронная заглушка клиента Elasticsearch.
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.calls = []
+
+    async def search(self, **kwargs):
+        self.calls.append(kwargs)
+        return {'hits': {'hits': [{'_id': str(i)} for i in self.ids], 'total': {'value': len(self.ids)}}}
+
+
+class StubResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class StubHttp:
+    """
+    Асинхронная заглушка HTTP-клиента сервиса перевода.
+    """
+
+    async def get(self, url, params=None):
+        return StubResponse([[['hola ', params['q'], None], ['mundo', '', None]]])
+
+
+class AsyncGatewayCase(unittest.TestCase):
+    """
+    Тестовый набор для асинхронного режима (ASGI).
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config.update(NOTIFICATION_STREAM_INTERVAL=0.01, NOTIFICATION_STREAM_TIMEOUT=0.1)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='john', email='john@example.com')
+        self.post = Post(body='hello world', author=self.user)
+        db.session.add_all([self.user, self.post])
+        db.session.commit()
+        self.search = StubSearch([self.post.id])
+        self.gateway = AsyncGateway(self.app, search_client=self.search, http_client=StubHttp(),
+                                    max_threads=2)
+        serializer = self.app.session_interface.get_signing_serializer(self.app)
+        self.cookie = '{}={}'.format(self.app.config['SESSION_COOKIE_NAME'],
+                                     serializer.dumps({'_user_id': str(self.user.id)}))
+
+    def tearDown(self):
+        asyncio.run(self.gateway.aclose())
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def request(self, method, path, query=b'', body=b'', cookie=True):
+        headers = [(b'host', b'localhost')]
+        if cookie:
+            headers.append((b'cookie', self.cookie.encode('latin-1')))
+        scope = {'type': 'http', 'method': method, 'path': path, 'root_path': '',
+                 'query_string': query, 'headers': headers, 'http_version': '1.1',
+                 'scheme': 'http', 'server': ('localhost', 80), 'client': ('127.0.0.1', 1)}
+        messages = []
+
+        async def run():
+            pending = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+            async def receive():
+                if pending:
+                    return pending.pop()
+                await asyncio.Event().wait()
+
+            async def send(message):
+                messages.append(message)
+
+            await self.gateway(scope, receive, send)
+
+        asyncio.run(run())
+        status = messages[0]['status']
+        headers = dict(messages[0]['headers'])
+        body = b''.join(m.get('body', b'') for m in messages[1:])
+        return status, headers, body.decode('utf-8')
+
+    def test_search(self):
+        """
+        Запрос к поиску выполняется асинхронным клиентом, страницу отрисовывает Flask.
+        """
+        status, _, body = self.request('GET', '/search', b'q=hello')
+        self.assertEqual(status, 200)
+        self.assertIn('hello world', body)
+        self.assertEqual(self.search.calls[0]['query']['multi_match']['query'], 'hello')
+        self.assertIn('EventSource', body)
+        self.assertIn('const server_translation = true;', body)
+
+    def test_translate(self):
+        """
+        Перевод возвращается в JSON; без сессии - 401.
+        """
+        status, _, body = self.request('POST', '/translate',
+                                       body=b'{"text": "hello", "dest_language": "es"}')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {'text': 'hola mundo'})
+        status, _, _ = self.request('POST', '/translate', body=b'{}', cookie=False)
+        self.assertEqual(status, 401)
+
+        # В WSGI-режиме серверного перевода нет: браузер обращается к сервису перевода сам.
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user.id)
+        response = client.post('/translate', json={'text': 'hello', 'dest_language': 'es'})
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('const server_translation = false;', client.get('/index').get_data(as_text=True))
+
+    def test_admission_limits(self):
+        """
+        Асинхронные маршруты проверяют те же лимиты, что и Flask.
+        """
+        self.app.extensions['admission'] = Limiter({'asgi.translate': (0.01, 1)}, {}, {})
+        body = b'{"text": "hello", "dest_language": "es"}'
+        status, _, _ = self.request('POST', '/translate', body=body)
+        self.assertEqual(status, 200)
+        status, headers, _ = self.request('POST', '/translate', body=body)
+        self.assertEqual(status, 429)
+        self.assertEqual(headers[b'retry-after'], b'100')
+
+    def test_notification_stream(self):
+        """
+        Поток уведомлений отдает события Server-Sent Events и завершается по таймауту.
+        """
+        self.user.add_notification('unread_message_count', 3)
+        db.session.commit()
+        status, headers, body = self.request('GET', '/notifications/stream', b'since=0')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'content-type'], b'text/event-stream')
+        event = json.loads(body.split('data: ', 1)[1].split('\n', 1)[0])
+        self.assertEqual((event['name'], event['data']), ('unread_message_count', 3))
+        self.assertEqual(body.count('data: '), 1)
+
+
+class PreforkCase(unittest.TestCase):
+    """
+    Тестовый набор для ленивой загрузки и предварительной загрузки приложения (gunicorn --preload).
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_lazy_elasticsearch(self):
+        """
+        Клиент Elasticsearch создается при первом обращении и заново в процессе-потомке.
+        """
+        self.assertIsNone(self.app.elasticsearch)
+        proxy = LazyElasticsearch('http://localhost:9200')
+        self.assertTrue(proxy)
+        self.assertIsNone(proxy._client)
+        client = proxy.client
+        self.assertIs(proxy.client, client)
+        self.assertEqual(proxy.transport, client.transport)
+
+        # Клиент, созданный в другом процессе, не используется.
+        proxy._pid = -1
+        self.assertIsNot(proxy.client, client)
+        proxy.reset()
+        self.assertIsNone(proxy._client)
+
+    def test_reinit_after_fork(self):
+        """
+        После fork() пулы соединений и клиент Elasticsearch пересоздаются.
+        """
+        self.app.elasticsearch = LazyElasticsearch('http://localhost:9200')
+        self.app.elasticsearch.client
+        db.session.execute(sa.select(1))
+        db.session.commit()
+        pool = db.engine.pool
+        self.assertEqual(pool.checkedin(), 1)
+
+        reinit_after_fork(self.app)
+        self.assertIsNot(db.engine.pool, pool)
+        self.assertEqual(db.engine.pool.checkedin(), 0)
+        self.assertIsNone(self.app.elasticsearch._client)
+
+    def test_warm_up(self):
+        """
+        Прогрев компилирует шаблоны заранее.
+        """
+        try:
+            warm_up(self.app)
+        finally:
+            gc.unfreeze()
+        self.assertIn('base.html', [key[1] for key in self.app.jinja_env.cache.keys()])
+
+    def test_template_bytecode_cache(self):
+        """
+        flask templates compile заполняет кэш байт-кода, и новое приложение загружает шаблоны из него.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.app.config['TEMPLATE_CACHE_DIR'] = directory
+        init_bytecode_cache(self.app)
+        cli.register(self.app)
+        result = self.app.test_cli_runner().invoke(args=['templates', 'compile'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Compiled', result.output)
+        self.assertGreater(len(os.listdir(directory)), 10)
+
+        class CachedConfig(TestConfig):
+            TEMPLATE_CACHE_DIR = directory
+
+        app = create_app(CachedConfig)
+        with mock.patch.object(app.jinja_env, 'compile', side_effect=AssertionError('compiled')):
+            self.assertIsNotNone(app.jinja_env.get_template('base.html'))
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)